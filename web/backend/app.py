@@ -1,15 +1,37 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_cors import CORS
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta
 import bcrypt
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import mysql.connector
 from dotenv import load_dotenv
-import pandas as pd
 import urllib.parse
-from dateutil.relativedelta import relativedelta
+import base64
+import json
+import uuid
+from db_pool import ConnectionPool, PoolTimeout
+from db_router import ReplicaRouter
+from migrations import migrate
+from row_decoder import get_decoder, SITE_DETAIL_KEYS, TENURE_SOURCES
+from response_cache import SiteCache, ReportCache
+from report_export import iter_records, text_chunks, csv_header, csv_rows, write_xlsx, xlsx_chunks
+from coercion import SPECS, DATE, DERIVED_COLUMNS, coerce_record, is_blank, same_value
+from excel_import import (prepare_rows, diff_rows, changed_columns, iter_frames, row_estimate, upload_extension,
+                          INSERT, UPSERT, IMPORT_MODES)
+from jobs import JobManager, JobQueueFull, JobStoreUnavailable
+import payouts
+import change_log
+from report_aggregates import (is_aggregate_report, parse_aggregate_spec, build_aggregate_query,
+                               decode_aggregate_rows, aggregate_output_keys)
+from rent_projection import (is_projection_report, parse_projection_spec, build_projection_query,
+                             project_rents, projection_document, projection_output_keys)
+from search_index import SearchIndex
+from site_events import EventHub, HubFull, RESYNC
 
 # Load environment variables
 load_dotenv()
@@ -167,6 +189,31 @@ field_mapping = {
     'remarks': '`REMARKS`'
 }
 
+def site_column(key):
+    """rentdetails column for a request field: a column name or a legacy field name; None if unknown"""
+    if key in column_mapping:
+        return column_mapping[key]
+    if key in field_mapping:
+        return field_mapping[key].strip('`')
+    return None
+
+def site_changes(data):
+    """
+    {column: value} for the fields of an update body that name a column,
+    SITE and DERIVED_COLUMNS excluded. None values are dropped, and blank or
+    N/A dates are left out so the stored date stays unchanged.
+    """
+    record = {}
+    for key, value in data.items():
+        column = site_column(key)
+        if column is None or column == 'SITE' or column in DERIVED_COLUMNS or value is None:
+            continue
+        if SPECS[column].kind == DATE and (is_blank(value) or str(value).strip() == 'N/A'):
+            print(f"Skipping empty date value for {key}")
+            continue
+        record[column] = value
+    return record
+
 class Site(db.Model):
     __tablename__ = 'rentdetails'  # Actual table name from the database
     SITE = db.Column('SITE', db.String(10), primary_key=True, nullable=False)
@@ -206,22 +253,209 @@ class Site(db.Model):
     STATUS = db.Column(db.String(10), nullable=False)
     REMARKS = db.Column(db.Text)
 
-# Direct connection for custom queries
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+
+# Decoded single-site responses; TTL bounds staleness across worker processes
+SITE_CACHE_SIZE = int(os.getenv('SITE_CACHE_SIZE', '5000'))
+SITE_CACHE_TTL = int(os.getenv('SITE_CACHE_TTL', '300'))
+# Batch fetches of at most this many uncached sites read full rows and add them to the cache
+SITE_CACHE_BATCH_FILL = int(os.getenv('SITE_CACHE_BATCH_FILL', '50'))
+site_cache = SiteCache(max_entries=SITE_CACHE_SIZE, ttl=SITE_CACHE_TTL)
+
+# In-memory trigram index for /api/search; rebuilt in the background once older than the refresh interval
+SEARCH_LIMIT = 50
+SEARCH_INDEX_REFRESH_SECONDS = int(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', '600'))
+search_index = SearchIndex()
+search_index_build_lock = threading.Lock()
+
+# Type-ahead is answered from the search index alone; calls slower than the budget are logged
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 25
+AUTOCOMPLETE_BUDGET_MS = float(os.getenv('AUTOCOMPLETE_BUDGET_MS', '5'))
+
+# Serialized JSON reports keyed by their filters; any site write drops them all
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', '200'))
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_MB', '64')) * 2**20
+REPORT_CACHE_TTL = int(os.getenv('REPORT_CACHE_TTL', '600'))
+REPORT_CACHE_PREWARM = os.getenv('REPORT_CACHE_PREWARM', 'false').lower() == 'true'
+report_cache = ReportCache(max_entries=REPORT_CACHE_SIZE, max_bytes=REPORT_CACHE_MAX_BYTES, ttl=REPORT_CACHE_TTL)
+
+ALL_SITES_REPORT = 'ALL SITES DATA REPORTS'
+
+# Streamed reports and exports (?format=...) decode and write this many rows at a time
+REPORT_STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'stream': 'application/json',
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+REPORT_EXPORT_FORMATS = ('csv', 'xlsx')
+REPORT_STREAM_BATCH = int(os.getenv('REPORT_STREAM_BATCH', '1000'))
+
+# Excel and CSV imports read IMPORT_CHUNK_SIZE rows at a time and insert in executemany
+# batches; the response lists at most IMPORT_REJECTION_LIMIT rejected rows
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '5000'))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+IMPORT_REJECTION_LIMIT = int(os.getenv('IMPORT_REJECTION_LIMIT', '1000'))
+
+# Background jobs: report exports and Excel imports run on a bounded worker pool,
+# with their state in the jobs table and result files under JOB_RESULT_DIR
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '20'))
+JOB_RESULT_DIR = os.getenv('JOB_RESULT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'jobs'))
+JOB_RETENTION_HOURS = int(os.getenv('JOB_RETENTION_HOURS', '72'))
+# Job result format -> report encoding
+JOB_FORMATS = {'csv': 'csv', 'xlsx': 'xlsx', 'ndjson': 'ndjson', 'json': 'stream'}
+REPORT_JOB_PARAMS = ('type', 'div', 'status', 'from_date', 'to_date', 'format', 'group_by', 'metrics',
+                     'start', 'months')
+job_manager = JobManager(lambda: get_db_connection(), JOB_RESULT_DIR,
+                         max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING)
+
+# Payout runs: sites with this STATUS are paid; GST is added for sites with a valid GSTIN
+PAYOUT_ACTIVE_STATUS = os.getenv('PAYOUT_ACTIVE_STATUS', 'ONLINE')
+PAYOUT_GST_RATE = float(os.getenv('PAYOUT_GST_RATE', '18'))
+PAYOUT_FILE_FORMATS = ('csv', 'xlsx', 'ndjson')
+
+# Change feed (/api/changes): a gap in the sequence younger than CHANGE_FEED_SETTLE_SECONDS
+# holds the cursor back until the write behind it commits; older entries are purged at startup
+CHANGE_FEED_LIMIT = int(os.getenv('CHANGE_FEED_LIMIT', '500'))
+CHANGE_FEED_MAX_LIMIT = int(os.getenv('CHANGE_FEED_MAX_LIMIT', '5000'))
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv('CHANGE_FEED_SETTLE_SECONDS', '30'))
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', '30'))
+
+# Server-sent site events (/api/events): one poller per process reads the change log and fans out to
+# at most SITE_EVENTS_MAX_CLIENTS streams; a client more than SITE_EVENTS_QUEUE_SIZE sites behind is told to resync
+SITE_EVENTS_MAX_CLIENTS = int(os.getenv('SITE_EVENTS_MAX_CLIENTS', '500'))
+SITE_EVENTS_QUEUE_SIZE = int(os.getenv('SITE_EVENTS_QUEUE_SIZE', '200'))
+SITE_EVENTS_POLL_SECONDS = float(os.getenv('SITE_EVENTS_POLL_SECONDS', '1'))
+SITE_EVENTS_HEARTBEAT_SECONDS = float(os.getenv('SITE_EVENTS_HEARTBEAT_SECONDS', '15'))
+SITE_EVENTS_REPLAY_LIMIT = int(os.getenv('SITE_EVENTS_REPLAY_LIMIT', '1000'))
+site_event_hub = EventHub(lambda since: fetch_site_events(since), lambda: site_events_start(),
+                          max_clients=SITE_EVENTS_MAX_CLIENTS, queue_size=SITE_EVENTS_QUEUE_SIZE,
+                          poll_interval=SITE_EVENTS_POLL_SECONDS)
+
+# Login password checks run on a bounded worker pool so bursts can't saturate request threads;
+# at most BCRYPT_MAX_QUEUED checks wait for a worker, further logins get 503 straight away
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(os.cpu_count() or 2)))
+BCRYPT_MAX_QUEUED = int(os.getenv('BCRYPT_MAX_QUEUED', str(BCRYPT_WORKERS * 4)))
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', '10'))
+password_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+password_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_MAX_QUEUED)
+
+# Read replicas (comma-separated hosts); empty means every read goes to the primary
+REPLICA_DB_HOSTS = [host.strip() for host in os.getenv('REPLICA_DB_HOSTS', '').split(',') if host.strip()]
+REPLICA_MAX_LAG_SECONDS = int(os.getenv('REPLICA_MAX_LAG_SECONDS', '30'))
+REPLICA_CHECK_INTERVAL = int(os.getenv('REPLICA_CHECK_INTERVAL', '10'))
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+# How long a read waits for a busy replica pool before going to the primary instead
+REPLICA_CHECKOUT_TIMEOUT = float(os.getenv('REPLICA_CHECKOUT_TIMEOUT', '0.05'))
+
+def create_pool(host, name):
+    return ConnectionPool(
+        lambda: create_mysql_connection(host),
+        size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_MAX_OVERFLOW,
+        timeout=DB_POOL_TIMEOUT,
+        recycle=DB_POOL_RECYCLE,
+        pre_ping=DB_POOL_PRE_PING,
+        name=name
+    )
+
+def create_mysql_connection(host):
+    """Open a new physical connection to the given MySQL host"""
+    print(f"Connecting to database at {host}...")
+    conn = mysql.connector.connect(
+        host=host,
+        user=PRIMARY_DB_USER,
+        password=PRIMARY_DB_PASSWORD,
+        database=PRIMARY_DB_DATABASE
+    )
+    print("Database connection successful!")
+    return conn
+
+primary_pool = create_pool(PRIMARY_DB_HOST, 'primary')
+db_router = ReplicaRouter(
+    primary_pool,
+    [create_pool(host, f'replica:{host}') for host in REPLICA_DB_HOSTS],
+    max_lag=REPLICA_MAX_LAG_SECONDS,
+    check_interval=REPLICA_CHECK_INTERVAL,
+    retry_after=REPLICA_RETRY_SECONDS,
+    sticky_seconds=REPLICA_STICKY_SECONDS,
+    checkout_timeout=REPLICA_CHECKOUT_TIMEOUT
+)
+
+def current_identity():
+    """JWT identity of the current request, or None outside an authenticated request"""
+    try:
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+class DatabaseUnavailable(Exception):
+    """Raised when no database connection could be checked out"""
+
+class LoginBusy(Exception):
+    """Raised when the password check queue is full"""
+
+def note_write(identity=None):
+    """Keep the current user's (or the given user's) reads on the primary so they see their own writes"""
+    db_router.note_write(identity if identity is not None else current_identity())
+
+def notify_sites_changed(site_ids):
+    """Drop cached state for sites that were just written"""
+    site_cache.invalidate(site_ids)
+    report_cache.bump()
+    refresh_search_entries(site_ids)
+    site_event_hub.wake()
+
+def cached_response(entry):
+    """JSON response for a cached site or report body; answers If-None-Match with 304"""
+    response = app.response_class(entry.body, status=200, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def verify_password(password, stored_hash):
+    """
+    Check a bcrypt hash on the password worker pool.
+    Raises LoginBusy if too many checks are already waiting, and
+    FutureTimeout if this one did not finish within BCRYPT_TIMEOUT.
+    """
+    if not password_slots.acquire(blocking=False):
+        raise LoginBusy('Too many logins in progress')
+    try:
+        future = password_executor.submit(bcrypt.checkpw, password.encode('utf-8'), stored_hash.encode('utf-8'))
+    except Exception:
+        password_slots.release()
+        raise
+    # The slot is held until the check finishes or is cancelled, not until this request gives up
+    future.add_done_callback(lambda _: password_slots.release())
+    try:
+        return future.result(timeout=BCRYPT_TIMEOUT)
+    except FutureTimeout:
+        # Drops it if it is still queued; a hash already running cannot be interrupted
+        future.cancel()
+        raise
+
+# Pooled connection for custom queries
 def get_db_connection(use_primary=True):
     """
-    Get database connection using simple mysql.connector
-    Returns None if connection fails
+    Check out a pooled mysql.connector connection.
+    use_primary=False allows the read to be served by a healthy replica.
+    Calling close() on it returns it to the pool.
+    Returns None if connection fails or the pool is exhausted
     """
     try:
-        print(f"Connecting to database at {PRIMARY_DB_HOST}...")
-        conn = mysql.connector.connect(
-            host=PRIMARY_DB_HOST,
-            user=PRIMARY_DB_USER,
-            password=PRIMARY_DB_PASSWORD,
-            database=PRIMARY_DB_DATABASE
-        )
-        print("Database connection successful!")
-        return conn
+        return db_router.connect(use_primary=use_primary, identity=current_identity())
+    except PoolTimeout as e:
+        print(f"Database pool exhausted: {str(e)}")
+        return None
     except Exception as e:
         print(f"Database connection failed: {str(e)}")
         return None
@@ -239,6 +473,19 @@ def api_status():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/stats', methods=['GET'])
+@jwt_required()
+def api_stats():
+    return jsonify({
+        'pool': primary_pool.stats(),
+        'routing': db_router.stats(),
+        'site_cache': site_cache.stats(),
+        'report_cache': report_cache.stats(),
+        'search_index': search_index.stats(),
+        'jobs': job_manager.stats(),
+        'site_events': site_event_hub.stats()
+    }), 200
+
 @app.route('/<path:path>')
 def serve_static(path):
     return send_from_directory(app.static_folder, path)
@@ -260,49 +507,52 @@ def login():
                 }
             }), 200
         
-        # Then try database authentication
+        # Then try database authentication (schema bootstrap is a no-op once done at startup)
+        ensure_schema_ready()
+        
         conn = None
         cursor = None
         try:
-            # Try to initialize tables if this is first time
-            create_tables_if_needed()
-            
             conn = get_db_connection()
             if conn is None:
-                return jsonify({'message': 'Database connection failed. Using fallback credentials only.'}), 500
+                return jsonify({'message': 'Database connection failed. Using fallback credentials only.'}), 503
                 
             cursor = conn.cursor()
             
             # Query for user
             cursor.execute("SELECT password, role FROM USERS WHERE username = %s", (data['username'],))
             user_data = cursor.fetchone()
-            print(f"User data fetched: {user_data}")  # Debug print
-            
-            if user_data:
-                stored_hash = user_data[0].encode('utf-8')
-                input_password = data['password'].encode('utf-8')
-                
-                if bcrypt.checkpw(input_password, stored_hash):
-                    access_token = create_access_token(identity=data['username'])
-                    return jsonify({
-                        'access_token': access_token,
-                        'user': {
-                            'username': data['username'],
-                            'role': user_data[1]
-                        }
-                    }), 200
-            
-            print("Invalid credentials")  # Debug print
-            return jsonify({'message': 'Invalid credentials'}), 401
-            
         except Exception as e:
             print(f"Database error during login: {str(e)}")
             return jsonify({'message': 'Invalid credentials'}), 401
         finally:
+            # Hand the connection back before the (slow) hash check
             if cursor:
                 cursor.close()
             if conn:
                 conn.close()
+            
+        try:
+            if user_data and verify_password(data['password'], user_data[0]):
+                access_token = create_access_token(identity=data['username'])
+                return jsonify({
+                    'access_token': access_token,
+                    'user': {
+                        'username': data['username'],
+                        'role': user_data[1]
+                    }
+                }), 200
+        except FutureTimeout:
+            print("Password verification timed out")
+            return jsonify({'message': 'Login is busy, please try again'}), 503
+        except LoginBusy:
+            print("Password verification queue full")
+            return jsonify({'message': 'Login is busy, please try again'}), 503
+        except Exception as e:
+            print(f"Password verification error: {str(e)}")
+            
+        print("Invalid credentials")  # Debug print
+        return jsonify({'message': 'Invalid credentials'}), 401
                 
     except Exception as e:
         print(f"Login error: {str(e)}")
@@ -314,10 +564,17 @@ def login():
 def get_sites():
     site_id = request.args.get('site_id')
     
-    # Use primary DB when fetching a specific site
+    # Use primary DB when fetching a specific site (the edit form reads back its own writes);
+    # the listing may be served by a replica
     use_primary = site_id is not None
     print(f"get_sites called with site_id={site_id}, using primary DB: {use_primary}")
     
+    if site_id:
+        cached = site_cache.get(site_id)
+        if cached is not None:
+            return cached_response(cached)
+        cache_generation = site_cache.generation()
+    
     conn = None
     cursor = None
     try:
@@ -338,7 +595,7 @@ def get_sites():
             # If no results, try case-insensitive match
             if not rows:
                 print(f"No exact match for site ID '{site_id}', trying case-insensitive search")
-                query = "SELECT * FROM rentdetails WHERE UPPER(SITE) = UPPER(%s)"
+                query = "SELECT * FROM rentdetails WHERE SITE_NORM = UPPER(%s)"
                 cursor.execute(query, [site_id])
                 rows = cursor.fetchall()
                 
@@ -347,32 +604,42 @@ def get_sites():
                 return jsonify({'message': f'Site ID "{site_id}" not found'}), 404
                 
             # Process just the one site
-            site_data = process_site_data(rows[0], cursor.description)
+            site_data = get_decoder(cursor.description, 'site_detail').decode(rows[0])
             print(f"Returning site data for {site_id}")
-            print(f"GST NUMBER value: {site_data.get('gst_number')}")
-            print(f"PAN NUMBER value: {site_data.get('pan_number')}")
-            return jsonify(site_data), 200
+            entry = site_cache.put(site_id, app.json.dumps(site_data), cache_generation)
+            return cached_response(entry)
         else:
-            # Return list of all sites (simplified data)
-            query = "SELECT SITE, `STORE NAME`, REGION, DIV, `GST NUMBER`, `PAN NUMBER` FROM rentdetails LIMIT 100"
-            cursor.execute(query)
+            # Return one page of sites (simplified data), keyset-paginated by SITE
+            try:
+                limit = min(max(int(request.args.get('limit', SITES_PAGE_SIZE)), 1), SITES_PAGE_MAX)
+                after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+            except ValueError as ve:
+                return jsonify({'message': str(ve)}), 400
+            
+            query = "SELECT SITE, `STORE NAME`, REGION, DIV, `GST NUMBER`, `PAN NUMBER` FROM rentdetails WHERE 1=1"
+            params = []
+            if after is not None:
+                query += " AND SITE > %s"
+                params.append(after)
+            for arg, column in SITE_LIST_FILTERS.items():
+                value = request.args.get(arg)
+                if value and value != 'ALL':
+                    query += f" AND {column} = %s"
+                    params.append(value)
+            # Fetch one extra row to know whether another page exists
+            query += " ORDER BY SITE LIMIT %s"
+            params.append(limit + 1)
+            
+            cursor.execute(query, params)
             rows = cursor.fetchall()
             
-            sites = []
-            for row in rows:
-                sites.append({
-                    'site_id': row[0] if len(row) > 0 else '',
-                    'store_name': row[1] if len(row) > 1 else '',
-                    'region': row[2] if len(row) > 2 else '',
-                    'div': row[3] if len(row) > 3 else '',
-                    'gst_number': row[4] if len(row) > 4 and row[4] is not None else '',
-                    'pan_number': row[5] if len(row) > 5 and row[5] is not None else ''
-                })
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            sites = get_decoder(cursor.description, 'site_list').decode_many(rows)
+            next_cursor = encode_cursor(rows[-1][0]) if has_more else None
             
             print(f"Returning list of {len(sites)} sites")
-            print(f"Sample site GST NUMBER: {sites[0].get('gst_number') if sites else 'No sites'}")
-            print(f"Sample site PAN NUMBER: {sites[0].get('pan_number') if sites else 'No sites'}")
-            return jsonify({'sites': sites}), 200
+            return jsonify({'sites': sites, 'next': next_cursor}), 200
     
     except Exception as e:
         print(f"Error in get_sites: {str(e)}")
@@ -385,175 +652,148 @@ def get_sites():
         if conn:
             conn.close()
 
-def process_site_data(row, description):
-    """Process a database row into a site data dictionary"""
-    # Get column names
-    columns = [col[0] for col in description]
-    print(f"Site data columns: {columns}")
-    print(f"Raw row data: {row}")
+# /api/sites listing page size
+SITES_PAGE_SIZE = int(os.getenv('SITES_PAGE_SIZE', '100'))
+SITES_PAGE_MAX = int(os.getenv('SITES_PAGE_MAX', '1000'))
+
+# Optional listing filters: query parameter -> column
+SITE_LIST_FILTERS = {'div': '`DIV`', 'region': '`REGION`', 'status': '`STATUS`'}
+
+def encode_cursor(last_site):
+    """Opaque keyset cursor pointing just past last_site"""
+    payload = json.dumps({'after': last_site}).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+def decode_cursor(cursor_value):
+    """Site ID encoded in a cursor; raises ValueError if it is malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor_value.encode('ascii')))
+        return str(payload['after'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+# Upper bound on site IDs per batch request (keeps the IN list and response bounded)
+BATCH_MAX_SITES = int(os.getenv('BATCH_MAX_SITES', '500'))
+
+# Bulk updates (PATCH /api/sites): sites per request, and the columns a site filter may use
+BULK_UPDATE_MAX_SITES = int(os.getenv('BULK_UPDATE_MAX_SITES', '1000'))
+BULK_FILTER_COLUMNS = ('DIV', 'REGION', 'STATUS', 'MANAGER', 'ASST MANAGER', 'EXECUTIVE')
+
+@app.route('/api/sites/autocomplete', methods=['GET'])
+@jwt_required()
+def autocomplete_sites():
+    prefix = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', AUTOCOMPLETE_LIMIT)), 1), AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'message': 'limit must be an integer'}), 400
     
-    # Create a dictionary mapping column names to their indices
-    column_map = {col.upper(): i for i, col in enumerate(columns)}
-    print(f"Column map: {column_map}")
+    if not search_index.ready:
+        # Never block a keystroke on MySQL: build in the background and let the client retry
+        threading.Thread(target=build_search_index, daemon=True).start()
+        return jsonify({'message': 'Autocomplete index is loading'}), 503
+    ensure_search_index()
     
-    # Log specific columns we're having issues with
-    print(f"Looking for 'ASST MANAGER' in columns, found: {'ASST MANAGER' in column_map}")
-    print(f"Looking for 'GST NUMBER' in columns, found: {'GST NUMBER' in column_map}")
-    print(f"Looking for 'PAN NUMBER' in columns, found: {'PAN NUMBER' in column_map}")
+    started = time.perf_counter()
+    suggestions = search_index.complete(prefix, limit)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms > AUTOCOMPLETE_BUDGET_MS:
+        print(f"Autocomplete over budget: {elapsed_ms:.2f} ms for {prefix!r}")
     
-    # Get indices for special columns
-    asst_manager_idx = column_map.get('ASST MANAGER')
-    gst_number_idx = column_map.get('GST NUMBER')
-    pan_number_idx = column_map.get('PAN NUMBER')
-    tds_percentage_idx = column_map.get('TDS PERCENTAGE')
+    return jsonify({'suggestions': suggestions}), 200
+
+@app.route('/api/sites/batch', methods=['POST'])
+@jwt_required()
+def get_sites_batch():
+    """
+    Fetch many sites in one round trip.
+    Body: {"site_ids": [...], "fields": [...optional column or legacy names...]}
+    Site IDs match case-insensitively; IDs with no match are listed in not_found.
+    Sites already in the single-site cache are served from it; the rest are
+    read in one query and cached for GET /api/sites?site_id=.
+    """
+    data = request.get_json(silent=True) or {}
+    site_ids = data.get('site_ids')
+    fields = data.get('fields')
     
-    # Log what indices were found
-    print(f"Indices found - ASST MANAGER: {asst_manager_idx}, GST NUMBER: {gst_number_idx}, PAN NUMBER: {pan_number_idx}, TDS PERCENTAGE: {tds_percentage_idx}")
+    if not isinstance(site_ids, list) or not site_ids:
+        return jsonify({'message': 'site_ids must be a non-empty list'}), 400
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(field, str) for field in fields)):
+        return jsonify({'message': 'fields must be a list of field names'}), 400
+    if len(site_ids) > BATCH_MAX_SITES:
+        return jsonify({'message': f'At most {BATCH_MAX_SITES} site IDs per request'}), 400
     
-    # Get the site value to use in multiple fields
-    site_value = row[column_map.get('SITE', 0)] if 'SITE' in column_map else row[0]
-    print(f"Site value found: {site_value}")
+    # Normalized ID -> ID as requested, de-duplicated in request order
+    requested = {}
+    for site_id in site_ids:
+        site_id = str(site_id).strip()
+        if site_id:
+            requested.setdefault(site_id.upper(), site_id)
+    if not requested:
+        return jsonify({'message': 'site_ids must be a non-empty list'}), 400
     
-    # Build the site data dictionary with appropriate field mappings
-    site_data = {
-        'SITE': site_value,  # Use actual MySQL column name
-        'site_id': site_value,  # Include site_id for backward compatibility
-        'site': site_value,     # Include site for backward compatibility
-        'STORE NAME': row[column_map.get('STORE NAME', 1)] if 'STORE NAME' in column_map else row[1],
-        'REGION': row[column_map.get('REGION', 2)] if 'REGION' in column_map else row[2],
-        'DIV': row[column_map.get('DIV', 3)] if 'DIV' in column_map else row[3],
-        'MANAGER': row[column_map.get('MANAGER', 4)] if 'MANAGER' in column_map and len(row) > column_map.get('MANAGER', 4) else '',
-        'ASST MANAGER': row[asst_manager_idx] if asst_manager_idx is not None and len(row) > asst_manager_idx else '',
-        'EXECUTIVE': row[column_map.get('EXECUTIVE', 6)] if 'EXECUTIVE' in column_map and len(row) > column_map.get('EXECUTIVE', 6) else '',
-        'D.O.O': format_date(row[column_map.get('D.O.O', 7)]) if 'D.O.O' in column_map and len(row) > column_map.get('D.O.O', 7) else '',
-        'SQ.FT': row[column_map.get('SQ.FT', 8)] if 'SQ.FT' in column_map and len(row) > column_map.get('SQ.FT', 8) else 0,
-        'AGREEMENT DATE': format_date(row[column_map.get('AGREEMENT DATE', 9)]) if 'AGREEMENT DATE' in column_map and len(row) > column_map.get('AGREEMENT DATE', 9) else '',
-        'RENT POSITION DATE': format_date(row[column_map.get('RENT POSITION DATE', 10)]) if 'RENT POSITION DATE' in column_map and len(row) > column_map.get('RENT POSITION DATE', 10) else '',
-        'RENT EFFECTIVE DATE': format_date(row[column_map.get('RENT EFFECTIVE DATE', 11)]) if 'RENT EFFECTIVE DATE' in column_map and len(row) > column_map.get('RENT EFFECTIVE DATE', 11) else '',
-        'AGREEMENT VALID UPTO': format_date(row[column_map.get('AGREEMENT VALID UPTO', 12)]) if 'AGREEMENT VALID UPTO' in column_map and len(row) > column_map.get('AGREEMENT VALID UPTO', 12) else '',
-        'CURRENT DATE': format_date(row[column_map.get('CURRENT DATE', 13)]) if 'CURRENT DATE' in column_map and len(row) > column_map.get('CURRENT DATE', 13) else '',
-        'LEASE PERIOD': row[column_map.get('LEASE PERIOD', 14)] if 'LEASE PERIOD' in column_map and len(row) > column_map.get('LEASE PERIOD', 14) else 0,
-        'RENT FREE PERIOD DAYS': row[column_map.get('RENT FREE PERIOD DAYS', 15)] if 'RENT FREE PERIOD DAYS' in column_map and len(row) > column_map.get('RENT FREE PERIOD DAYS', 15) else 0,
-        'RENT EFFECTIVE AMOUNT': row[column_map.get('RENT EFFECTIVE AMOUNT', 16)] if 'RENT EFFECTIVE AMOUNT' in column_map and len(row) > column_map.get('RENT EFFECTIVE AMOUNT', 16) else 0,
-        'PRESENT RENT': row[column_map.get('PRESENT RENT', 17)] if 'PRESENT RENT' in column_map and len(row) > column_map.get('PRESENT RENT', 17) else 0,
-        'HIKE %': row[column_map.get('HIKE %', 18)] if 'HIKE %' in column_map and len(row) > column_map.get('HIKE %', 18) else 0,
-        'HIKE YEAR': row[column_map.get('HIKE YEAR', 19)] if 'HIKE YEAR' in column_map and len(row) > column_map.get('HIKE YEAR', 19) else 0,
-        'RENT DEPOSIT': row[column_map.get('RENT DEPOSIT', 20)] if 'RENT DEPOSIT' in column_map and len(row) > column_map.get('RENT DEPOSIT', 20) else 0,
-        'OWNER NAME-1': row[column_map.get('OWNER NAME-1', 21)] if 'OWNER NAME-1' in column_map and len(row) > column_map.get('OWNER NAME-1', 21) else '',
-        'OWNER NAME-2': row[column_map.get('OWNER NAME-2', 22)] if 'OWNER NAME-2' in column_map and len(row) > column_map.get('OWNER NAME-2', 22) else '',
-        'OWNER NAME-3': row[column_map.get('OWNER NAME-3', 23)] if 'OWNER NAME-3' in column_map and len(row) > column_map.get('OWNER NAME-3', 23) else '',
-        'OWNER NAME-4': row[column_map.get('OWNER NAME-4', 24)] if 'OWNER NAME-4' in column_map and len(row) > column_map.get('OWNER NAME-4', 24) else '',
-        'OWNER NAME-5': row[column_map.get('OWNER NAME-5', 25)] if 'OWNER NAME-5' in column_map and len(row) > column_map.get('OWNER NAME-5', 25) else '',
-        'OWNER NAME-6': row[column_map.get('OWNER NAME-6', 26)] if 'OWNER NAME-6' in column_map and len(row) > column_map.get('OWNER NAME-6', 26) else '',
-        'OWNER MOBILE': row[column_map.get('OWNER MOBILE', 27)] if 'OWNER MOBILE' in column_map and len(row) > column_map.get('OWNER MOBILE', 27) else '',
-        'CURRENT DATE 1': format_date(row[column_map.get('CURRENT DATE 1', 28)]) if 'CURRENT DATE 1' in column_map and len(row) > column_map.get('CURRENT DATE 1', 28) else '',
-        'VALIDITY DATE': format_date(row[column_map.get('VALIDITY DATE', 29)]) if 'VALIDITY DATE' in column_map and len(row) > column_map.get('VALIDITY DATE', 29) else '',
-        'GST NUMBER': row[gst_number_idx] if gst_number_idx is not None and len(row) > gst_number_idx and row[gst_number_idx] is not None else '',
-        'PAN NUMBER': row[pan_number_idx] if pan_number_idx is not None and len(row) > pan_number_idx and row[pan_number_idx] is not None else '',
-        'TDS PERCENTAGE': row[tds_percentage_idx] if tds_percentage_idx is not None and len(row) > tds_percentage_idx and row[tds_percentage_idx] is not None else 0,
-        'MATURE': row[column_map.get('MATURE', 33)] if 'MATURE' in column_map and len(row) > column_map.get('MATURE', 33) else '',
-        'STATUS': row[column_map.get('STATUS', 34)] if 'STATUS' in column_map and len(row) > column_map.get('STATUS', 34) else '',
-        'REMARKS': row[column_map.get('REMARKS', 35)] if 'REMARKS' in column_map and len(row) > column_map.get('REMARKS', 35) else ''
-    }
+    output_keys = None
+    select = '*'
+    if fields:
+        unknown = [field for field in fields if field not in SITE_DETAIL_KEYS]
+        if unknown:
+            return jsonify({'message': f"Unknown fields: {', '.join(unknown)}"}), 400
+        columns = {'SITE'}
+        output_keys = {'SITE', 'site_id'}
+        for field in fields:
+            column, keys = SITE_DETAIL_KEYS[field]
+            columns.add(column)
+            output_keys.update(keys)
+            if column in TENURE_SOURCES:
+                columns.add(TENURE_SOURCES[column])
+        select = ', '.join(f"`{column}`" for column in sorted(columns))
     
-    # Add backward compatibility fields
-    site_data.update({
-        'store_name': site_data['STORE NAME'],
-        'region': site_data['REGION'],
-        'div': site_data['DIV'],
-        'manager': site_data['MANAGER'],
-        'asst_manager': site_data['ASST MANAGER'],
-        'executive': site_data['EXECUTIVE'],
-        'doo': site_data['D.O.O'],
-        'sqft': site_data['SQ.FT'],
-        'agreement_date': site_data['AGREEMENT DATE'],
-        'rent_position_date': site_data['RENT POSITION DATE'],
-        'rent_effective_date': site_data['RENT EFFECTIVE DATE'],
-        'agreement_valid_upto': site_data['AGREEMENT VALID UPTO'],
-        'current_date': site_data['CURRENT DATE'],
-        'lease_period': site_data['LEASE PERIOD'],
-        'rent_free_period_days': site_data['RENT FREE PERIOD DAYS'],
-        'rent_effective_amount': site_data['RENT EFFECTIVE AMOUNT'],
-        'present_rent': site_data['PRESENT RENT'],
-        'hike_percentage': site_data['HIKE %'],
-        'hike_year': site_data['HIKE YEAR'],
-        'rent_deposit': site_data['RENT DEPOSIT'],
-        'owner_name1': site_data['OWNER NAME-1'],
-        'owner_name2': site_data['OWNER NAME-2'],
-        'owner_name3': site_data['OWNER NAME-3'],
-        'owner_name4': site_data['OWNER NAME-4'],
-        'owner_name5': site_data['OWNER NAME-5'],
-        'owner_name6': site_data['OWNER NAME-6'],
-        'owner_mobile': site_data['OWNER MOBILE'],
-        'current_date1': site_data['CURRENT DATE 1'],
-        'validity_date': site_data['VALIDITY DATE'],
-        'gst_number': site_data['GST NUMBER'],
-        'pan_number': site_data['PAN NUMBER'],
-        'tds_percentage': site_data['TDS PERCENTAGE'],
-        'mature': site_data['MATURE'],
-        'status': site_data['STATUS'],
-        'remarks': site_data['REMARKS']
-    })
+    # Cached full records serve any field selection
+    by_id = {}
+    for key in requested:
+        cached = site_cache.get(key)
+        if cached is not None:
+            by_id[key] = json.loads(cached.body)
+    missing = [key for key in requested if key not in by_id]
+    cache_generation = site_cache.generation()
     
-    # Calculate CURRENT DATE 1 (time elapsed since RENT POSITION DATE)
-    if row[column_map.get('RENT POSITION DATE')] is not None:
-        try:
-            rpd = row[column_map.get('RENT POSITION DATE')]
-            if isinstance(rpd, str):
-                rpd = datetime.strptime(rpd, '%Y-%m-%d').date()
-            current_date = datetime.now().date()
-            
-            # Calculate the difference between current date and rent position date
-            diff = relativedelta(current_date, rpd)
-            
-            site_data['CURRENT DATE 1'] = (
-                f"{diff.years} {'Years' if diff.years != 1 else 'Year'}, "
-                f"{diff.months} {'Months' if diff.months != 1 else 'Month'}, "
-                f"{diff.days} {'Days' if diff.days != 1 else 'Day'}"
-            )
-        except Exception as e:
-            print(f"Error calculating CURRENT DATE 1: {str(e)}")
-            site_data['CURRENT DATE 1'] = ''
-
-    # Calculate VALIDITY DATE (time remaining until AGREEMENT VALID UPTO)
-    if row[column_map.get('AGREEMENT VALID UPTO')] is not None:
-        try:
-            avu = row[column_map.get('AGREEMENT VALID UPTO')]
-            if isinstance(avu, str):
-                avu = datetime.strptime(avu, '%Y-%m-%d').date()
-            current_date = datetime.now().date()
+    conn = None
+    cursor = None
+    try:
+        if missing:
+            conn = get_db_connection()
+            if conn is None:
+                return jsonify({'message': 'Database connection failed. Please try again later.'}), 503
             
-            # Calculate the difference between agreement valid upto and current date
-            diff = relativedelta(avu, current_date)
+            cursor = conn.cursor()
+            # Full rows only when they can be cached; otherwise just the requested columns
+            query = (f"SELECT {'*' if len(missing) <= SITE_CACHE_BATCH_FILL else select} FROM rentdetails "
+                     f"WHERE SITE_NORM IN ({', '.join(['%s'] * len(missing))})")
+            cursor.execute(query, missing)
+            rows = cursor.fetchall()
             
-            site_data['VALIDITY DATE'] = (
-                f"{diff.years} {'Years' if diff.years != 1 else 'Year'}, "
-                f"{diff.months} {'Months' if diff.months != 1 else 'Month'}, "
-                f"{diff.days} {'Days' if diff.days != 1 else 'Day'}"
-            )
-        except Exception as e:
-            print(f"Error calculating VALIDITY DATE: {str(e)}")
-            site_data['VALIDITY DATE'] = ''
-
-    # Print what fields are available for debugging
-    print(f"Processed site data keys: {site_data.keys()}")
-    print(f"ASST MANAGER value: {site_data.get('ASST MANAGER')}")
-    print(f"GST NUMBER value: {site_data.get('GST NUMBER')}")
-    print(f"PAN NUMBER value: {site_data.get('PAN NUMBER')}")
-    
-    return site_data
-
-def format_date(date_value):
-    """Format a date value as a string"""
-    if not date_value:
-        return ""
-    try:
-        if isinstance(date_value, str):
-            return date_value
-        return date_value.strftime('%Y-%m-%d')
+            for record in get_decoder(cursor.description, 'site_detail').decode_many(rows):
+                key = str(record['SITE']).strip().upper()
+                by_id[key] = record
+                if len(missing) <= SITE_CACHE_BATCH_FILL:
+                    site_cache.put(key, app.json.dumps(record), cache_generation)
+        
+        if output_keys is not None:
+            by_id = {key: {name: value for name, value in record.items() if name in output_keys}
+                     for key, record in by_id.items()}
+        sites = [by_id[key] for key in requested if key in by_id]
+        not_found = [site_id for key, site_id in requested.items() if key not in by_id]
+        print(f"Batch fetch: {len(sites)} found, {len(not_found)} not found")
+        return jsonify({'sites': sites, 'not_found': not_found}), 200
+        
     except Exception as e:
-        print(f"Error formatting date {date_value}: {str(e)}")
-        return str(date_value) if date_value else ""
+        print(f"Error in get_sites_batch: {str(e)}")
+        return jsonify({'message': f'Error fetching site data: {str(e)}'}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
 
 @app.route('/api/sites', methods=['POST'])
 @jwt_required()
@@ -586,67 +826,29 @@ def create_site():
         if conn is None:
             return jsonify({'message': 'Database connection failed. Please try again later.'}), 503
             
+        # Coerce every field with the same rules as uploads
+        record = {}
+        for key, value in data.items():
+            column = site_column(key)
+            if column and key != 'site' and column not in DERIVED_COLUMNS:
+                record[column] = value
+        site_values, errors = coerce_record(record)
+        if errors:
+            print(f"Invalid site data: {errors}")
+            return jsonify({'message': f"Invalid site data: {'; '.join(errors)}", 'errors': errors}), 400
+        
         cursor = conn.cursor()
         
         # Check if site ID already exists
-        cursor.execute("SELECT COUNT(*) FROM rentdetails WHERE `SITE` = %s", (data['site_id'],))
+        cursor.execute("SELECT COUNT(*) FROM rentdetails WHERE `SITE` = %s", (site_values['SITE'],))
         count = cursor.fetchone()[0]
         if count > 0:
-            return jsonify({'message': f"Site ID {data['site_id']} already exists"}), 400
+            return jsonify({'message': f"Site ID {site_values['SITE']} already exists"}), 400
         
         # Prepare the SQL query
-        columns = [
-            "`SITE`", "`STORE NAME`", "`REGION`", "`DIV`", "`MANAGER`", "`ASST MANAGER`", "`EXECUTIVE`", 
-            "`D.O.O`", "`SQ.FT`", "`AGREEMENT DATE`", "`RENT POSITION DATE`", "`RENT EFFECTIVE DATE`", 
-            "`LEASE PERIOD`", "`RENT FREE PERIOD DAYS`", "`RENT EFFECTIVE AMOUNT`", "`PRESENT RENT`", 
-            "`HIKE %`", "`HIKE YEAR`", "`RENT DEPOSIT`", "`OWNER NAME-1`", "`OWNER NAME-2`", 
-            "`OWNER NAME-3`", "`OWNER NAME-4`", "`OWNER NAME-5`", "`OWNER NAME-6`", 
-            "`OWNER MOBILE`", "`GST NUMBER`", "`PAN NUMBER`", "`TDS PERCENTAGE`", "`MATURE`", 
-            "`STATUS`", "`REMARKS`"
-        ]
-        
-        # Optional fields
-        if 'agreement_valid_upto' in data and data['agreement_valid_upto']:
-            columns.append("`AGREEMENT VALID UPTO`")
-        
-        if 'current_date' in data and data['current_date']:
-            columns.append("`CURRENT DATE`")
-            
-        if 'current_date1' in data and data['current_date1']:
-            columns.append("`CURRENT DATE 1`")
-            
-        if 'validity_date' in data and data['validity_date']:
-            columns.append("`VALIDITY DATE`")
-        
-        # Create placeholders for values
+        columns = [f"`{column}`" for column in site_values]
         placeholders = ['%s'] * len(columns)
-        
-        # Prepare values
-        values = [
-            data['site_id'], data['store_name'], data['region'], data['div'], 
-            data['manager'], data['asst_manager'], data['executive'], 
-            data['doo'], data['sqft'], data['agreement_date'], data['rent_position_date'], 
-            data['rent_effective_date'], data['lease_period'], data['rent_free_period_days'], 
-            data['rent_effective_amount'], data['present_rent'], data['hike_percentage'], 
-            data['hike_year'], data['rent_deposit'], data['owner_name1'],
-            data.get('owner_name2'), data.get('owner_name3'), data.get('owner_name4'),
-            data.get('owner_name5'), data.get('owner_name6'), data.get('owner_mobile'),
-            data['gst_number'], data['pan_number'], data['tds_percentage'], 
-            data['mature'], data['status'], data.get('remarks')
-        ]
-        
-        # Add optional values
-        if 'agreement_valid_upto' in data and data['agreement_valid_upto']:
-            values.append(data['agreement_valid_upto'])
-        
-        if 'current_date' in data and data['current_date']:
-            values.append(data['current_date'])
-            
-        if 'current_date1' in data and data['current_date1']:
-            values.append(data['current_date1'])
-            
-        if 'validity_date' in data and data['validity_date']:
-            values.append(data['validity_date'])
+        values = list(site_values.values())
         
         # Build and execute the INSERT query
         column_names = ', '.join(columns)
@@ -655,7 +857,11 @@ def create_site():
         print(f"Insert query: {query}")
         print(f"Insert values: {values}")
         cursor.execute(query, values)
+        change_log.record_changes(cursor, [(site_values['SITE'], change_log.INSERTED, None)],
+                                  'create', current_identity())
         conn.commit()
+        note_write()
+        notify_sites_changed([site_values['SITE']])
         
         return jsonify({'message': 'Site created successfully'}), 201
     except Exception as e:
@@ -695,104 +901,15 @@ def update_site(site_id):
             
         print(f"Using site_id: {site_id}")
         
-        # Handle direct MySQL column names - We need to do this because the frontend
-        # is now using the exact MySQL column names
-        set_clauses = []
-        values = []
-        
-        # List of date fields to process
-        date_fields = [
-            'AGREEMENT DATE', 
-            'RENT POSITION DATE', 
-            'RENT EFFECTIVE DATE',
-            'AGREEMENT VALID UPTO',
-            'CURRENT DATE',
-            'CURRENT DATE 1',
-            'VALIDITY DATE',
-            'D.O.O'
-        ]
+        # Accept direct MySQL column names (what the frontend sends) and the legacy field names,
+        # and coerce the values with the same rules as uploads
+        update_values, errors = coerce_record(site_changes(data), partial=True)
+        if errors:
+            print(f"Invalid update data: {errors}")
+            return jsonify({'message': f"Invalid site data: {'; '.join(errors)}", 'errors': errors}), 400
         
-        for key, value in data.items():
-            if key != 'site_id' and key != 'SITE':  # Skip site_id in the update
-                db_field = None
-                
-                # Check if it's a direct MySQL column name
-                if key in column_mapping.keys():
-                    db_field = f"`{key}`"
-                    print(f"Direct MySQL column name: {key}")
-                # Otherwise check if it has a mapping
-                elif key in field_mapping:
-                    db_field = field_mapping[key]
-                    print(f"Mapped field {key} to {db_field}")
-                
-                if db_field and value is not None:
-                    # Handle date fields
-                    if key in date_fields and value:
-                        try:
-                            # Convert date string to SQL format (YYYY-MM-DD)
-                            date_str = str(value).strip()
-                            print(f"Processing date field {key}: {date_str}")
-                            
-                            # Skip empty values
-                            if not date_str or date_str == 'N/A':
-                                print(f"Skipping empty date value for {key}")
-                                continue
-                                
-                            formatted_date = None
-                            
-                            # Check if the format is DD-MM-YYYY
-                            if date_str.count('-') == 2:
-                                date_parts = date_str.split('-')
-                                
-                                # If format is DD-MM-YYYY (first part is 1 or 2 digits)
-                                if len(date_parts) == 3 and len(date_parts[0]) <= 2 and len(date_parts[2]) == 4:
-                                    # Convert from DD-MM-YYYY to YYYY-MM-DD
-                                    formatted_date = f"{date_parts[2]}-{date_parts[1].zfill(2)}-{date_parts[0].zfill(2)}"
-                                    print(f"Converted date from DD-MM-YYYY to YYYY-MM-DD: {formatted_date}")
-                                # If format is already YYYY-MM-DD
-                                elif len(date_parts) == 3 and len(date_parts[0]) == 4:
-                                    formatted_date = date_str
-                                    print(f"Date already in YYYY-MM-DD format: {formatted_date}")
-                            
-                            # Try parsing with multiple formats if not yet formatted
-                            if not formatted_date:
-                                formats_to_try = ['%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y/%m/%d']
-                                for fmt in formats_to_try:
-                                    try:
-                                        dt = datetime.strptime(date_str, fmt)
-                                        formatted_date = dt.strftime('%Y-%m-%d')
-                                        print(f"Parsed date with format {fmt}: {formatted_date}")
-                                        break
-                                    except ValueError:
-                                        continue
-                            
-                            if formatted_date:
-                                value = formatted_date
-                                print(f"Final date value for {key}: {value}")
-                            else:
-                                print(f"Could not parse date for {key}: {date_str}, skipping")
-                                continue
-                        except Exception as e:
-                            print(f"Error formatting date for {key}: {str(e)}")
-                            continue
-                    
-                    # Clean numeric values
-                    elif key in ['SQ.FT', 'LEASE PERIOD', 'RENT FREE PERIOD DAYS', 'HIKE %', 'HIKE YEAR', 'RENT DEPOSIT', 'TDS PERCENTAGE']:
-                        try:
-                            cleaned_value = str(value).replace('₹', '').replace(',', '').replace('%', '').strip()
-                            if cleaned_value:
-                                if key in ['SQ.FT', 'LEASE PERIOD', 'RENT FREE PERIOD DAYS', 'HIKE YEAR']:
-                                    value = int(float(cleaned_value))
-                                else:
-                                    value = float(cleaned_value)
-                            print(f"Cleaned numeric value for {key}: {value}")
-                        except Exception as e:
-                            print(f"Error cleaning numeric field {key}: {str(e)}")
-                            continue
-                    
-                    set_clauses.append(f"{db_field} = %s")
-                    values.append(value)
-                    print(f"Adding field to update: {db_field} = {value}")
+        set_clauses = [f"`{column}` = %s" for column in update_values]
+        values = list(update_values.values())
         
         if not set_clauses:
             return jsonify({'message': 'No fields to update'}), 400
@@ -808,7 +925,11 @@ def update_site(site_id):
         if cursor.rowcount == 0:
             return jsonify({'message': 'No records were updated'}), 404
         
+        change_log.record_changes(cursor, [(site_id, change_log.UPDATED, list(update_values))],
+                                  'update', current_identity())
         conn.commit()
+        note_write()
+        notify_sites_changed([site_id])
         return jsonify({'message': 'Site updated successfully'}), 200
         
     except Exception as e:
@@ -820,97 +941,433 @@ def update_site(site_id):
         if conn:
             conn.close()
 
+def bulk_filter_where(site_filter):
+    """WHERE clause and params for a bulk update filter; raises ValueError"""
+    if not isinstance(site_filter, dict) or not site_filter:
+        raise ValueError('filter must be a non-empty object')
+    clauses = []
+    params = []
+    for key, value in site_filter.items():
+        values = value if isinstance(value, list) else [value]
+        values = [str(item).strip() for item in values if item is not None and str(item).strip()]
+        if not values:
+            raise ValueError(f'Empty filter value for {key}')
+        placeholders = ', '.join(['%s'] * len(values))
+        if key == 'site_ids':
+            clauses.append(f"SITE_NORM IN ({placeholders})")
+            params.extend(item.upper() for item in values)
+            continue
+        column = site_column(key)
+        if column not in BULK_FILTER_COLUMNS:
+            raise ValueError(f"Cannot filter on '{key}'; use site_ids or {', '.join(BULK_FILTER_COLUMNS)}")
+        clauses.append(f"`{column}` IN ({placeholders})")
+        params.extend(values)
+    return ' AND '.join(clauses), params
+
+@app.route('/api/sites', methods=['PATCH'])
+@jwt_required()
+def bulk_update_sites():
+    """
+    Update many sites in one transaction.
+    Body: {"updates": [{"site_id": ..., "changes": {...}}, ...]}
+      or: {"changes": {...}, "filter": {"site_ids": [...], "DIV": ..., "STATUS": [...], ...}}
+    Changes use column or legacy field names and are coerced like PUT /api/sites/<id>.
+    Sites are matched case-insensitively; only columns whose value differs are written,
+    with one statement per distinct change. Returns one result per site:
+    updated, unchanged, not_found or invalid.
+    """
+    data = request.get_json(silent=True) or {}
+    updates = data.get('updates')
+    site_filter = data.get('filter')
+    if (updates is None) == (site_filter is None):
+        return jsonify({'message': 'Provide either updates, or changes with a filter'}), 400
+    
+    # (site_id as requested, normalized id, coerced changes, errors), in request order
+    entries = []
+    if updates is not None:
+        if not isinstance(updates, list) or not updates:
+            return jsonify({'message': 'updates must be a non-empty list'}), 400
+        if len(updates) > BULK_UPDATE_MAX_SITES:
+            return jsonify({'message': f'At most {BULK_UPDATE_MAX_SITES} sites per request'}), 400
+        seen = set()
+        for item in updates:
+            site_id = str(item.get('site_id') or '').strip() if isinstance(item, dict) else ''
+            changes = item.get('changes') if isinstance(item, dict) else None
+            if not site_id or not isinstance(changes, dict):
+                entries.append((site_id or None, None, None, ['Each update needs a site_id and a changes object']))
+                continue
+            if site_id.upper() in seen:
+                entries.append((site_id, None, None, ['Duplicate site_id in request']))
+                continue
+            seen.add(site_id.upper())
+            values, errors = coerce_record(site_changes(changes), partial=True)
+            if not values and not errors:
+                errors = ['No fields to update']
+            entries.append((site_id, site_id.upper(), values, errors))
+    else:
+        changes = data.get('changes')
+        if not isinstance(changes, dict):
+            return jsonify({'message': 'changes must be an object'}), 400
+        shared_values, errors = coerce_record(site_changes(changes), partial=True)
+        if errors:
+            return jsonify({'message': f"Invalid site data: {'; '.join(errors)}", 'errors': errors}), 400
+        if not shared_values:
+            return jsonify({'message': 'No fields to update'}), 400
+        try:
+            filter_where, filter_params = bulk_filter_where(site_filter)
+        except ValueError as ve:
+            return jsonify({'message': str(ve)}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({'message': 'Database connection failed. Please try again later.'}), 503
+        cursor = conn.cursor()
+        
+        if updates is None:
+            cursor.execute(f"SELECT SITE FROM rentdetails WHERE {filter_where} ORDER BY SITE LIMIT %s",
+                           [*filter_params, BULK_UPDATE_MAX_SITES + 1])
+            matched = [site for (site,) in cursor.fetchall()]
+            if len(matched) > BULK_UPDATE_MAX_SITES:
+                return jsonify({'message': f'The filter matches more than {BULK_UPDATE_MAX_SITES} sites'}), 400
+            entries = [(site, site.strip().upper(), shared_values, []) for site in matched]
+        
+        # Current values of every column being changed, for the sites being changed
+        columns = sorted({column for _, _, values, errors in entries if not errors for column in values})
+        keys = [key for _, key, _, errors in entries if not errors]
+        stored = {}
+        select = ', '.join(f"`{column}`" for column in ['SITE', *columns])
+        for offset in range(0, len(keys), BATCH_MAX_SITES):
+            chunk = keys[offset:offset + BATCH_MAX_SITES]
+            cursor.execute(f"SELECT {select} FROM rentdetails WHERE SITE_NORM IN ({', '.join(['%s'] * len(chunk))})",
+                           chunk)
+            for row in cursor.fetchall():
+                stored[str(row[0]).strip().upper()] = row
+        position = {column: i + 1 for i, column in enumerate(columns)}
+        
+        # Sites with identical changes share a statement: (columns, values) -> stored SITEs
+        results = []
+        groups = {}
+        for site_id, key, values, errors in entries:
+            if errors:
+                results.append({'site_id': site_id, 'status': 'invalid', 'errors': errors})
+                continue
+            row = stored.get(key)
+            if row is None:
+                results.append({'site_id': site_id, 'status': 'not_found'})
+                continue
+            changed = sorted(column for column, value in values.items()
+                             if not same_value(value, row[position[column]]))
+            if not changed:
+                results.append({'site_id': site_id, 'status': 'unchanged'})
+                continue
+            group = (tuple(changed), tuple(values[column] for column in changed))
+            groups.setdefault(group, []).append(row[0])
+            results.append({'site_id': site_id, 'status': 'updated', 'changed': changed})
+        
+        updated_sites = []
+        changes = []
+        for (changed, values), sites in groups.items():
+            assignments = ', '.join(f"`{column}` = %s" for column in changed)
+            for offset in range(0, len(sites), BATCH_MAX_SITES):
+                chunk = sites[offset:offset + BATCH_MAX_SITES]
+                cursor.execute(f"UPDATE rentdetails SET {assignments} WHERE SITE IN ({', '.join(['%s'] * len(chunk))})",
+                               [*values, *chunk])
+            updated_sites.extend(sites)
+            changes.extend((site, change_log.UPDATED, changed) for site in sites)
+        change_log.record_changes(cursor, changes, 'bulk', current_identity())
+        conn.commit()
+        
+        if updated_sites:
+            note_write()
+            notify_sites_changed(updated_sites)
+        
+        counts = {status: 0 for status in ('updated', 'unchanged', 'not_found', 'invalid')}
+        for result in results:
+            counts[result['status']] += 1
+        print(f"Bulk update: {counts} in {len(groups)} statements")
+        return jsonify({
+            'message': f"{counts['updated']} sites updated, {counts['unchanged']} unchanged, "
+                       f"{counts['not_found']} not found, {counts['invalid']} invalid",
+            **counts,
+            'results': results,
+        }), 200
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Error in bulk_update_sites: {str(e)}")
+        return jsonify({'message': f"Error updating sites: {str(e)}"}), 400
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/api/changes', methods=['GET'])
+@jwt_required()
+def get_changes():
+    """
+    Site writes after a change log cursor, oldest first.
+    ?since=<seq>&limit=<n> returns {changes, next, more}: each change has
+    seq, site, operation (insert or update), fields (the columns written;
+    null for an insert), source, changed_by and changed_at. Ask again with
+    since=next; more says further changes are already waiting.
+    Without since, returns no changes and the cursor to start from: take it
+    before loading the data the deltas will be applied to.
+    A cursor older than the retained log gets 410 and must reload.
+    """
+    since = request.args.get('since')
+    try:
+        since = int(since) if since is not None else None
+        limit = min(max(int(request.args.get('limit', CHANGE_FEED_LIMIT)), 1), CHANGE_FEED_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'message': 'since and limit must be integers'}), 400
+    if since is not None and since < 0:
+        return jsonify({'message': 'since must not be negative'}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        # Always the primary: a lagging replica would hide committed changes behind the cursor
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({'message': 'Database connection failed'}), 503
+        cursor = conn.cursor()
+        if since is None:
+            return jsonify({'changes': [], 'next': change_log.start_seq(cursor, CHANGE_FEED_SETTLE_SECONDS),
+                            'more': False}), 200
+        oldest = change_log.oldest_seq(cursor)
+        if oldest is not None and since < oldest - 1:
+            return jsonify({
+                'message': 'Changes after this cursor are no longer retained; reload and start from next',
+                'next': change_log.start_seq(cursor, CHANGE_FEED_SETTLE_SECONDS),
+            }), 410
+        changes, next_since, more = change_log.read_changes(cursor, since, limit, CHANGE_FEED_SETTLE_SECONDS)
+        return jsonify({'changes': changes, 'next': next_since, 'more': more}), 200
+    except Exception as e:
+        print(f"Change feed error: {str(e)}")
+        return jsonify({'message': f'Error reading changes: {str(e)}'}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/api/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_site_events():
+    """
+    Server-sent events for site writes; ?div=D1,D2&region=NORTH narrow them
+    down. Each 'site' event is a change as returned by GET /api/changes plus
+    the site's DIV and REGION, with the change seq as its id, so a
+    reconnecting EventSource (Last-Event-ID) gets the changes it missed.
+    'resync' means changes were dropped and what the client shows should be
+    reloaded. EventSource cannot send headers; pass the token as ?jwt=.
+    """
+    divs = [value for value in request.args.get('div', '').split(',') if value.strip()]
+    regions = [value for value in request.args.get('region', '').split(',') if value.strip()]
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({'message': 'Last-Event-ID must be a change sequence number'}), 400
+    
+    try:
+        subscriber = site_event_hub.subscribe(divs, regions, after=last_id)
+    except HubFull as e:
+        return jsonify({'message': str(e)}), 503
+    except Exception as e:
+        print(f"Site event subscribe error: {str(e)}")
+        return jsonify({'message': 'Site events are unavailable. Please try again later.'}), 503
+    
+    # Changes the hub had already passed when the client reconnected come from the change log
+    missed = []
+    if last_id is not None and last_id < subscriber.after:
+        try:
+            missed = missed_site_events(last_id, subscriber.after)
+        except Exception as e:
+            print(f"Site event replay error: {str(e)}")
+            missed = None
+    
+    # The id a reconnect resumes from: not past the missed changes until they have been sent
+    resume_id = last_id if missed else subscriber.after
+    
+    def generate():
+        yield f"retry: 5000\nid: {resume_id}\nevent: ready\ndata: {{}}\n\n"
+        if missed is None:
+            yield f"event: {RESYNC}\ndata: {{}}\n\n"
+        else:
+            for event in missed:
+                if subscriber.matches(event):
+                    yield site_event_message(event)
+        while True:
+            events = subscriber.next_events(SITE_EVENTS_HEARTBEAT_SECONDS)
+            if events is RESYNC:
+                yield f"id: {site_event_hub.cursor}\nevent: {RESYNC}\ndata: {{}}\n\n"
+            elif events:
+                yield ''.join(site_event_message(event) for event in events)
+            else:
+                # Keeps proxies from timing the connection out and notices closed clients
+                yield ": keepalive\n\n"
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    # Runs when the client goes away, even before the stream has started
+    response.call_on_close(lambda: site_event_hub.unsubscribe(subscriber))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def site_event_message(event):
+    return f"id: {event['seq']}\nevent: site\ndata: {json.dumps(event, default=str)}\n\n"
+
+def attach_site_groups(cursor, events):
+    """Add each change's current DIV and REGION to it (None once the site is gone)"""
+    sites = sorted({str(event['site']).strip().upper() for event in events})
+    groups = {}
+    for offset in range(0, len(sites), BATCH_MAX_SITES):
+        chunk = sites[offset:offset + BATCH_MAX_SITES]
+        cursor.execute(f"SELECT SITE_NORM, `DIV`, `REGION` FROM rentdetails WHERE SITE_NORM IN ({', '.join(['%s'] * len(chunk))})",
+                       chunk)
+        for site, div, region in cursor.fetchall():
+            groups[site] = (div, region)
+    for event in events:
+        event['div'], event['region'] = groups.get(str(event['site']).strip().upper(), (None, None))
+    return events
+
+def fetch_site_events(since):
+    """Hub poller: changes after `since` with their DIV and REGION, as (events, next_since, more)"""
+    conn = get_db_connection()
+    if conn is None:
+        raise DatabaseUnavailable('Database connection failed')
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        changes, next_since, more = change_log.read_changes(cursor, since, CHANGE_FEED_LIMIT, CHANGE_FEED_SETTLE_SECONDS)
+        return attach_site_groups(cursor, changes), next_since, more
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
+def site_events_start():
+    """Hub poller: the change log cursor to start from"""
+    conn = get_db_connection()
+    if conn is None:
+        raise DatabaseUnavailable('Database connection failed')
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        return change_log.start_seq(cursor, CHANGE_FEED_SETTLE_SECONDS)
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
+def missed_site_events(since, until):
+    """
+    Changes after `since` up to seq `until`, with their DIV and REGION.
+    None if they are no longer retained or more than SITE_EVENTS_REPLAY_LIMIT.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise DatabaseUnavailable('Database connection failed')
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        oldest = change_log.oldest_seq(cursor)
+        if oldest is not None and since < oldest - 1:
+            return None
+        events = []
+        while since < until:
+            changes, next_since, _ = change_log.read_changes(cursor, since, CHANGE_FEED_LIMIT,
+                                                             CHANGE_FEED_SETTLE_SECONDS)
+            events.extend(change for change in changes if change['seq'] <= until)
+            if len(events) > SITE_EVENTS_REPLAY_LIMIT:
+                return None
+            if next_since == since:
+                break
+            since = next_since
+        return attach_site_groups(cursor, events)
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
 @app.route('/api/reports', methods=['GET'])
 @jwt_required()
 def get_report():
+    """
+    Report as JSON (cached), or streamed as ndjson, csv or xlsx. Row
+    reports are streamed from the cursor in every format, xlsx included,
+    so there is no row limit and memory stays at one batch.
+    """
     report_type = request.args.get('type')
     from_date = request.args.get('from_date')
     to_date = request.args.get('to_date')
     div = request.args.get('div')
     status = request.args.get('status')
+    response_format = request.args.get('format', 'json')
     
     print(f"Received report request - Type: {report_type}, DIV: {div}, Status: {status}")
     
     if not report_type:
         return jsonify({'message': 'Report type is required'}), 400
+    if response_format != 'json' and response_format not in REPORT_STREAM_FORMATS:
+        return jsonify({'message': f'Unsupported report format: {response_format}'}), 400
+    
+    try:
+        aggregate, projection = parse_report_type(report_type, request.args)
+    except ValueError as ve:
+        return jsonify({'message': str(ve)}), 400
+    
+    if response_format == 'json':
+        try:
+            return cached_report(report_type, div, status, from_date, to_date, aggregate, projection)
+        except Exception as e:
+            print(f"Report generation error: {str(e)}")
+            return jsonify({'message': f'Error generating report: {str(e)}'}), 500
     
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(use_primary=False)
         if conn is None:
             return jsonify({'message': 'Database connection failed'}), 503
             
-        cursor = conn.cursor(dictionary=True)
+        # Unbuffered, so a streamed report pulls rows from the server as it writes them
+        cursor = conn.cursor(buffered=False)
         
-        # Build the base query with filters
-        query = "SELECT * FROM rentdetails WHERE 1=1"
-        params = []
+        where, params = report_filters(div, status, from_date, to_date)
         
-        # Add DIV filter if provided and not 'ALL'
-        if div and div != 'ALL':
-            query += " AND `DIV` = %s"
-            params.append(div)
-            print(f"Added DIV filter: {div}")
+        if aggregate is not None:
+            # Summaries are computed by MySQL; only one row per group comes back
+            query = build_aggregate_query(aggregate, where)
+            print(f"Executing aggregate query: {query}")
+            cursor.execute(query, params)
+            data = decode_aggregate_rows(aggregate, cursor.fetchall())
+            print(f"Returning {len(data)} aggregate rows")
+            return aggregate_response(data, aggregate, response_format)
         
-        # Add Status filter if provided and not 'ALL'
-        if status and status != 'ALL':
-            query += " AND `STATUS` = %s"
-            params.append(status)
-            print(f"Added Status filter: {status}")
+        if projection is not None:
+            document = projection_report(cursor, projection, where, params)
+            return summary_response(document['data'], projection_output_keys(projection), document,
+                                    response_format)
         
-        # Add date range filter if provided
-        if from_date and to_date:
-            query += " AND `AGREEMENT DATE` BETWEEN %s AND %s"
-            params.extend([from_date, to_date])
+        # Build the base query with filters
+        query = "SELECT * FROM rentdetails" + where
         
         print(f"Executing query: {query}")
         print(f"With parameters: {params}")
         
         cursor.execute(query, params)
-        sites = cursor.fetchall()
-        
-        print(f"Found {len(sites)} matching records")
         
-        if report_type == 'ALL SITES DATA REPORTS':
-            data = []
-            for site in sites:
-                try:
-                    record = {
-                        'site_id': site['SITE'],
-                        'store_name': site['STORE NAME'],
-                        'region': site['REGION'],
-                        'div': site['DIV'],
-                        'manager': site['MANAGER'],
-                        'asst_manager': site['ASST MANAGER'],
-                        'executive': site['EXECUTIVE'],
-                        'doo': format_date(site['D.O.O']),
-                        'sqft': site['SQ.FT'],
-                        'agreement_date': format_date(site['AGREEMENT DATE']),
-                        'rent_position_date': format_date(site['RENT POSITION DATE']),
-                        'rent_effective_date': format_date(site['RENT EFFECTIVE DATE']),
-                        'lease_period': site['LEASE PERIOD'],
-                        'rent_free_period_days': site['RENT FREE PERIOD DAYS'],
-                        'rent_effective_amount': site['RENT EFFECTIVE AMOUNT'],
-                        'present_rent': site['PRESENT RENT'],
-                        'hike_percentage': site['HIKE %'],
-                        'hike_year': site['HIKE YEAR'],
-                        'rent_deposit': site['RENT DEPOSIT'],
-                        'owner_name1': site['OWNER NAME-1'],
-                        'gst_number': site['GST NUMBER'],
-                        'pan_number': site['PAN NUMBER'],
-                        'tds_percentage': site['TDS PERCENTAGE'],
-                        'mature': site['MATURE'],
-                        'status': site['STATUS'],
-                        'remarks': site.get('REMARKS', '')
-                    }
-                    data.append(record)
-                except Exception as e:
-                    print(f"Error processing site {site.get('SITE', 'Unknown')}: {str(e)}")
-                    continue
-            
-            print(f"Returning {len(data)} processed records")
-            return jsonify({'data': data}), 200
+        # The response generator owns the cursor and connection from here on
+        response = stream_report(conn, cursor, response_format)
+        conn = cursor = None
+        return response
             
     except Exception as e:
         print(f"Report generation error: {str(e)}")
@@ -921,130 +1378,860 @@ def get_report():
         if conn:
             conn.close()
 
-@app.route('/api/upload', methods=['POST'])
-@jwt_required()
-def upload_excel():
-    if 'file' not in request.files:
-        return jsonify({'message': 'No file uploaded'}), 400
+def report_filters(div, status, from_date, to_date):
+    """WHERE clause and parameters shared by every report type"""
+    where = " WHERE 1=1"
+    params = []
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'message': 'No file selected'}), 400
+    # Add DIV filter if provided and not 'ALL'
+    if div and div != 'ALL':
+        where += " AND `DIV` = %s"
+        params.append(div)
+        print(f"Added DIV filter: {div}")
     
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        return jsonify({'message': 'Invalid file format'}), 400
+    # Add Status filter if provided and not 'ALL'
+    if status and status != 'ALL':
+        where += " AND `STATUS` = %s"
+        params.append(status)
+        print(f"Added Status filter: {status}")
     
+    # Add date range filter if provided
+    if from_date and to_date:
+        where += " AND `AGREEMENT DATE` BETWEEN %s AND %s"
+        params.extend([from_date, to_date])
+    
+    return where, params
+
+def parse_report_type(report_type, args):
+    """
+    (aggregate, projection) specs for a report type; both are None for
+    ALL SITES DATA REPORTS. Raises ValueError for an unsupported type or
+    invalid parameters
+    """
+    if is_aggregate_report(report_type):
+        return parse_aggregate_spec(report_type, args.get('group_by'), args.get('metrics')), None
+    if is_projection_report(report_type):
+        return None, parse_projection_spec(args.get('group_by'), args.get('start'), args.get('months'))
+    if report_type != ALL_SITES_REPORT:
+        raise ValueError(f'Unsupported report type: {report_type}')
+    return None, None
+
+def cached_report(report_type, div, status, from_date, to_date, aggregate=None, projection=None):
+    """JSON report response, served from the report cache when the data has not changed since"""
+    key = report_cache.key(report_type, div, status, from_date, to_date, aggregate or projection)
+    entry = report_cache.get(key)
+    if entry is None:
+        generation = report_cache.generation()
+        body = report_body(div, status, from_date, to_date, aggregate, projection)
+        if body is None:
+            return jsonify({'message': 'Database connection failed'}), 503
+        entry = report_cache.put(key, body, generation)
+    else:
+        print(f"Report cache hit for {key}")
+    return cached_response(entry)
+
+def report_body(div, status, from_date, to_date, aggregate=None, projection=None):
+    """
+    Serialized JSON for an ALL SITES DATA REPORTS, aggregate or projection report,
+    read from the primary since it fills the report cache.
+    Returns None if the database connection fails
+    """
     conn = None
     cursor = None
     try:
-        # Initialize database connection first
+        # The primary: the body is cached under the current generation, and a lagging
+        # replica would serve pre-write data for the whole TTL
         conn = get_db_connection()
         if conn is None:
-            return jsonify({'message': 'Database connection failed. Please try again later.'}), 503
-            
+            return None
         cursor = conn.cursor()
+        where, params = report_filters(div, status, from_date, to_date)
         
-        # Read the Excel file
-        df = pd.read_excel(file)
-        
-        # Define required fields with default values
-        required_fields = {
-            'SITE': None,
-            'STORE NAME': None,
-            'REGION': None,
-            'DIV': None,
-            'MANAGER': None,
-            'ASST MANAGER': None,
-            'EXECUTIVE': None,
-            'D.O.O': None,
-            'SQ.FT': 0,
-            'AGREEMENT DATE': None,
-            'RENT POSITION DATE': None,
-            'RENT EFFECTIVE DATE': None,
-            'LEASE PERIOD': 0,
-            'RENT FREE PERIOD DAYS': 0,
-            'RENT EFFECTIVE AMOUNT': 0,
-            'PRESENT RENT': 0,
-            'HIKE %': 0,
-            'HIKE YEAR': 0,
-            'RENT DEPOSIT': 0,
-            'OWNER NAME-1': None,
-            'GST NUMBER': 'NA',
-            'PAN NUMBER': 'NA',
-            'TDS PERCENTAGE': 0,
-            'MATURE': 'NO',
-            'STATUS': 'ACTIVE'
-        }
+        if aggregate is not None:
+            # Summaries are computed by MySQL; only one row per group comes back
+            query = build_aggregate_query(aggregate, where)
+            print(f"Executing aggregate query: {query}")
+            cursor.execute(query, params)
+            data = decode_aggregate_rows(aggregate, cursor.fetchall())
+            print(f"Returning {len(data)} aggregate rows")
+            return app.json.dumps(aggregate_document(data, aggregate))
         
-        # Skip calculated fields
-        skip_fields = ['CURRENT DATE 1', 'VALIDITY DATE']
+        if projection is not None:
+            return app.json.dumps(projection_report(cursor, projection, where, params))
         
-        inserted_count = 0
+        query = "SELECT * FROM rentdetails" + where
+        print(f"Executing query: {query}")
+        print(f"With parameters: {params}")
+        cursor.execute(query, params)
+        sites = cursor.fetchall()
         
-        for _, row in df.iterrows():
-            # Process each row...
-            try:
-                # Rest of your existing row processing code...
-                site_id = str(row['SITE'])
-                cursor.execute("SELECT COUNT(*) FROM rentdetails WHERE `SITE` = %s", (site_id,))
-                count = cursor.fetchone()[0]
-                
-                if count > 0:
-                    continue
-                
-                columns = []
-                placeholders = []
-                values = []
-                
-                # Process all required fields
-                for field, default in required_fields.items():
-                    value = row.get(field, default)
-                    
-                    # Handle empty values
-                    if pd.isna(value) or value == '':
-                        value = default
-                    
-                    # Skip if still None and field is required
-                    if value is None:
-                        raise ValueError(f"Missing required field: {field}")
-                    
-                    # Format column name for SQL
-                    sql_col = f"`{field}`"
-                    columns.append(sql_col)
-                    placeholders.append('%s')
-                    
-                    # Handle date objects
-                    if isinstance(value, pd.Timestamp):
-                        value = value.to_pydatetime().date()
-                    
-                    values.append(value)
-                
-                # Build and execute the INSERT query
-                column_names = ', '.join(columns)
-                placeholder_str = ', '.join(placeholders)
-                query = f"INSERT INTO rentdetails ({column_names}) VALUES ({placeholder_str})"
-                cursor.execute(query, values)
-                inserted_count += 1
-                
-            except Exception as row_error:
-                print(f"Error processing row for site {site_id}: {str(row_error)}")
-                continue
+        print(f"Found {len(sites)} matching records")
+        data = get_decoder(cursor.description, 'report').decode_many(sites)
+        print(f"Returning {len(data)} processed records")
+        return app.json.dumps({'data': data})
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+def warm_report_cache():
+    """
+    Pre-compute the ALL SITES DATA REPORTS for every DIV x STATUS combination,
+    including the 'ALL' rows and columns, so the common dashboard filters are
+    cached before the first user asks for them
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            print("Report cache warm-up skipped: Database connection failed")
+            return 0
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT `DIV`, `STATUS` FROM rentdetails")
+        pairs = cursor.fetchall()
+    except Exception as e:
+        print(f"Report cache warm-up error: {str(e)}")
+        return 0
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+    
+    combinations = {('ALL', 'ALL')}
+    for div, status in pairs:
+        combinations.update({(div, status), (div, 'ALL'), ('ALL', status)})
+    
+    warmed = 0
+    started = time.monotonic()
+    for div, status in sorted(combinations, key=str):
+        key = report_cache.key(ALL_SITES_REPORT, div, status)
+        if report_cache.get(key) is not None:
+            continue
+        try:
+            generation = report_cache.generation()
+            body = report_body(div, status, None, None)
+            if body is not None:
+                report_cache.put(key, body, generation)
+                warmed += 1
+        except Exception as e:
+            print(f"Report cache warm-up error for DIV={div}, STATUS={status}: {str(e)}")
+    print(f"Report cache warmed: {warmed} reports in {time.monotonic() - started:.2f}s")
+    return warmed
+
+def aggregate_document(data, aggregate):
+    return {
+        'data': data,
+        'group_by': list(aggregate.group_by),
+        'metrics': [f'{function}:{measure}' for function, measure in aggregate.metrics],
+    }
+
+def projection_report(cursor, projection, where, params):
+    """Rent projection document; the schedule is computed in-process from one pass over the sites"""
+    query = build_projection_query(where)
+    print(f"Executing projection query: {query}")
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    started = time.monotonic()
+    document = projection_document(projection, project_rents(rows, projection))
+    print(f"Projected {len(rows)} sites over {projection.months} months in {time.monotonic() - started:.2f}s")
+    return document
+
+def aggregate_response(data, aggregate, response_format):
+    return summary_response(data, list(aggregate_output_keys(aggregate)), aggregate_document(data, aggregate),
+                            response_format)
+
+def summary_response(data, keys, document, response_format):
+    """Summary reports are small, so every format is rendered in one go"""
+    keys = list(keys)
+    if response_format == 'csv':
+        return export_response([csv_header(keys), csv_rows(data, keys)], response_format)
+    if response_format == 'xlsx':
+        return export_response(xlsx_chunks([data], keys), response_format)
+    if response_format == 'ndjson':
+        return Response(''.join(app.json.dumps(record) + '\n' for record in data),
+                        mimetype=REPORT_STREAM_FORMATS['ndjson'])
+    return jsonify(document), 200
+
+def stream_report(conn, cursor, response_format, batch_size=None):
+    """
+    Stream an executed report query as NDJSON (one record per line), as an
+    incrementally written {"data": [...]} document, or as a CSV or XLSX download. Rows are pulled with
+    fetchmany and decoded a batch at a time, so memory and time-to-first-byte
+    do not grow with the number of matching sites.
+    """
+    decoder = get_decoder(cursor.description, 'report')
+    batches = iter_records(cursor, decoder, batch_size or REPORT_STREAM_BATCH, datetime.now().date())
+    return stream_records(conn, cursor, response_format, batches, decoder.output_keys)
+
+def stream_records(conn, cursor, response_format, batches, keys, label='report', filename=None, title='Report'):
+    """
+    Stream record batches read from an executed query in one of the
+    REPORT_STREAM_FORMATS encodings; `title` names the XLSX sheet.
+    Closes the cursor and returns the connection when the stream ends; a
+    stream the client abandoned discards the connection, since it may still
+    have unread rows.
+    """
+    dumps = app.json.dumps
+    
+    def generate():
+        finished = False
+        sent = 0
         
-        conn.commit()
-        return jsonify({
-            'message': f'Data uploaded successfully. {inserted_count} new records inserted.'
-        }), 200
+        def counted():
+            nonlocal sent
+            for records in batches:
+                yield records
+                sent += len(records)
+        
+        try:
+            if response_format == 'xlsx':
+                yield from xlsx_chunks(counted(), keys, title)
+            else:
+                yield from text_chunks(response_format, counted(), keys, dumps)
+            finished = True
+            print(f"Streamed {sent} {label} records")
+        except Exception as e:
+            # Headers are already sent, so the failure is reported in-band
+            print(f"{label.capitalize()} streaming error after {sent} records: {str(e)}")
+            message = f'Error generating {label}: {str(e)}'
+            if response_format == 'ndjson':
+                yield dumps({'error': message}) + '\n'
+            elif response_format == 'csv':
+                yield csv_rows([{'error': message}], ['error'])
+            elif response_format == 'xlsx':
+                # Nothing can be appended to a zip; stopping before its directory leaves the file unreadable
+                pass
+            else:
+                yield '], "error": ' + dumps(message) + '}'
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+            if finished:
+                conn.close()
+            else:
+                conn.invalidate()
+    
+    if response_format in REPORT_EXPORT_FORMATS:
+        return export_response(generate(), response_format, filename)
+    response = Response(generate(), mimetype=REPORT_STREAM_FORMATS[response_format])
+    # Ask reverse proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def export_response(chunks, response_format, filename=None):
+    """Streamed file download for a report export"""
+    response = Response(chunks, content_type=REPORT_STREAM_FORMATS[response_format])
+    filename = filename or f"report-{datetime.now().strftime('%Y%m%d')}.{response_format}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/upload', methods=['POST'])
+@jwt_required()
+def upload_excel():
+    if 'file' not in request.files:
+        return jsonify({'message': 'No file uploaded'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'message': 'No file selected'}), 400
+    
+    extension = upload_extension(file.filename)
+    if extension is None:
+        return jsonify({'message': 'Invalid file format'}), 400
+    
+    mode = request.args.get('mode', INSERT)
+    if mode not in IMPORT_MODES:
+        return jsonify({'message': f"Invalid import mode; use {' or '.join(IMPORT_MODES)}"}), 400
+    
+    if request.args.get('background') == 'true':
+        # Park the upload on disk and import it on the job pool
+        path = os.path.join(JOB_RESULT_DIR, f'upload-{uuid.uuid4().hex}{extension}')
+        file.save(path)
+        response = submit_background_job('import', {'path': path, 'filename': file.filename, 'mode': mode})
+        if response[1] != 202 and os.path.exists(path):
+            os.remove(path)
+        return response
+    
+    try:
+        return jsonify(import_excel(file.stream, extension, mode=mode)), 200
         
+    except DatabaseUnavailable as e:
+        return jsonify({'message': str(e)}), 503
     except ValueError as ve:
         print(f"Validation error: {str(ve)}")
-        if conn:
-            conn.rollback()
         return jsonify({'message': str(ve)}), 400
     except Exception as e:
         print(f"Upload error: {str(e)}")
-        if conn:
-            conn.rollback()
         return jsonify({'message': f'Error uploading data: {str(e)}'}), 400
+
+def import_excel(source, extension, progress=None, identity=None, mode=INSERT):
+    """
+    Import the upload's rows into rentdetails.
+    .xlsx and .csv uploads are streamed IMPORT_CHUNK_SIZE rows at a time,
+    each chunk validated and written in executemany batches before the
+    next is read; everything is committed as one transaction at the end.
+    Invalid rows are rejected with their reasons. In insert mode existing
+    SITEs are skipped; in upsert mode their stored rows are fetched and
+    diffed, and only rows that changed are written back.
+    The written sites go to the change log just before the commit.
+    progress(rows read, estimated total) is called after each chunk.
+    Returns a summary dict with the counts and the rejection report
+    """
+    total = row_estimate(source, extension)
+    
+    conn = get_db_connection()
+    if conn is None:
+        raise DatabaseUnavailable('Database connection failed. Please try again later.')
+    cursor = None
+    seen = {}
+    written_sites = []
+    changes = []
+    rejections = []
+    read = inserted = updated = unchanged = skipped = rejected = 0
+    try:
+        cursor = conn.cursor()
+        for first_row, frame in iter_frames(source, extension, IMPORT_CHUNK_SIZE):
+            prepared = prepare_rows(frame, first_row, seen)
+            read += len(frame)
+            rejected += len(prepared.rejections)
+            rejections.extend(prepared.rejections[:IMPORT_REJECTION_LIMIT - len(rejections)])
+            sites = [row[0] for row in prepared.rows]
+            
+            column_names = ', '.join(f"`{column}`" for column in prepared.columns)
+            placeholders = ', '.join(['%s'] * len(prepared.columns))
+            query = f"INSERT INTO rentdetails ({column_names}) VALUES ({placeholders})"
+            if mode == UPSERT:
+                stored = existing_rows(cursor, prepared.columns, sites)
+                new_rows, changed_rows, same = diff_rows(prepared.rows, stored)
+                rows = new_rows + changed_rows
+                updated += len(changed_rows)
+                unchanged += same
+                query += " ON DUPLICATE KEY UPDATE " + ', '.join(
+                    f"`{column}` = VALUES(`{column}`)" for column in prepared.columns[1:]
+                )
+                for row in changed_rows:
+                    current = stored[row[0].upper()]
+                    changes.append((current[0], change_log.UPDATED, changed_columns(prepared.columns, row, current)))
+            else:
+                existing = existing_sites(cursor, sites)
+                new_rows = rows = [row for row in prepared.rows if row[0].upper() not in existing]
+                skipped += len(prepared.rows) - len(rows)
+            inserted += len(new_rows)
+            changes.extend((row[0], change_log.INSERTED, None) for row in new_rows)
+            
+            for offset in range(0, len(rows), IMPORT_BATCH_SIZE):
+                cursor.executemany(query, rows[offset:offset + IMPORT_BATCH_SIZE])
+            written_sites.extend(row[0] for row in rows)
+            if progress:
+                progress(read, total)
+        change_log.record_changes(cursor, changes, 'import',
+                                  identity if identity is not None else current_identity(), IMPORT_BATCH_SIZE)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+    
+    if written_sites:
+        note_write(identity)
+        notify_sites_changed(written_sites)
+    
+    print(f"Imported ({mode}) {inserted} new, {updated} updated, {unchanged} unchanged, "
+          f"{skipped} existing skipped, {rejected} rejected")
+    message = f'Data uploaded successfully. {inserted} new records inserted.'
+    if mode == UPSERT:
+        message += f' {updated} updated, {unchanged} unchanged.'
+    if skipped:
+        message += f' {skipped} existing sites skipped.'
+    if rejected:
+        message += f' {rejected} rows rejected.'
+    return {
+        'message': message,
+        'mode': mode,
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': unchanged,
+        'skipped_existing': skipped,
+        'rejected': rejected,
+        'rejections': rejections,
+    }
+
+def existing_sites(cursor, sites, chunk_size=1000):
+    """The given SITEs that are already in rentdetails, upper-cased"""
+    found = set()
+    for offset in range(0, len(sites), chunk_size):
+        chunk = sites[offset:offset + chunk_size]
+        cursor.execute(
+            f"SELECT SITE FROM rentdetails WHERE SITE IN ({', '.join(['%s'] * len(chunk))})", chunk
+        )
+        found.update(site.upper() for (site,) in cursor.fetchall())
+    return found
+
+def existing_rows(cursor, columns, sites, chunk_size=1000):
+    """Stored values of `columns` (SITE first) for the given SITEs, keyed by upper-cased SITE"""
+    found = {}
+    column_names = ', '.join(f"`{column}`" for column in columns)
+    for offset in range(0, len(sites), chunk_size):
+        chunk = sites[offset:offset + chunk_size]
+        cursor.execute(
+            f"SELECT {column_names} FROM rentdetails WHERE SITE IN ({', '.join(['%s'] * len(chunk))})", chunk
+        )
+        for row in cursor.fetchall():
+            found[row[0].upper()] = row
+    return found
+
+def run_import_job(context, params):
+    """Background job: import an upload parked on disk by upload_excel"""
+    try:
+        return import_excel(params['path'], upload_extension(params['path']), context.progress,
+                            identity=context.owner, mode=params.get('mode', INSERT))
+    finally:
+        if os.path.exists(params['path']):
+            os.remove(params['path'])
+
+def run_report_job(context, params):
+    """Background job: write a report export to the job's result file"""
+    report_type = params['type']
+    job_format = params.get('format', 'csv')
+    aggregate, projection = parse_report_type(report_type, params)
+    where, query_params = report_filters(params.get('div'), params.get('status'),
+                                         params.get('from_date'), params.get('to_date'))
+    path = context.result_path(job_format)
+    
+    conn = get_db_connection(use_primary=False)
+    if conn is None:
+        raise DatabaseUnavailable('Database connection failed')
+    cursor = None
+    finished = False
+    written = 0
+    try:
+        cursor = conn.cursor()
+        if aggregate is not None or projection is not None:
+            # Summaries come from one query with no batches to report on, so
+            # cancellation is checked before the query and before the file is written
+            context.progress(0)
+            if aggregate is not None:
+                cursor.execute(build_aggregate_query(aggregate, where), query_params)
+                data = decode_aggregate_rows(aggregate, cursor.fetchall())
+                keys = list(aggregate_output_keys(aggregate))
+            else:
+                data = projection_report(cursor, projection, where, query_params)['data']
+                keys = list(projection_output_keys(projection))
+            written = len(data)
+            context.progress(written, written)
+            write_report_file(path, job_format, [data], keys)
+        else:
+            cursor.execute("SELECT COUNT(*) FROM rentdetails" + where, query_params)
+            total = cursor.fetchone()[0]
+            cursor.close()
+            # Unbuffered, so rows are pulled from the server as the file is written
+            cursor = conn.cursor(buffered=False)
+            cursor.execute("SELECT * FROM rentdetails" + where, query_params)
+            decoder = get_decoder(cursor.description, 'report')
+            
+            def tracked():
+                nonlocal written
+                for records in iter_records(cursor, decoder, REPORT_STREAM_BATCH, datetime.now().date()):
+                    yield records
+                    written += len(records)
+                    context.progress(written, total)
+            
+            write_report_file(path, job_format, tracked(), decoder.output_keys)
+        finished = True
+    finally:
+        try:
+            if cursor:
+                cursor.close()
+        except Exception:
+            pass
+        # A cancelled export may leave unread rows on the connection
+        if finished:
+            conn.close()
+        else:
+            conn.invalidate()
+    
+    return {
+        'path': path,
+        'filename': f"report-{datetime.now().strftime('%Y%m%d')}.{job_format}",
+        'content_type': REPORT_STREAM_FORMATS[JOB_FORMATS[job_format]],
+        'rows': written,
+    }
+
+def write_report_file(path, job_format, batches, keys):
+    if job_format == 'xlsx':
+        with open(path, 'wb') as fileobj:
+            write_xlsx(batches, keys, fileobj)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as fileobj:
+            for chunk in text_chunks(JOB_FORMATS[job_format], batches, keys, app.json.dumps):
+                fileobj.write(chunk)
+
+def run_payout_job(context, params):
+    """Background job: compute the lines and totals of a payout run created by create_payout_run"""
+    run_id = params['run_id']
+    conn = get_db_connection()
+    if conn is None:
+        raise DatabaseUnavailable('Database connection failed')
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT base_run_id, settings FROM payout_runs WHERE id = %s", (run_id,))
+        base_run_id, settings = cursor.fetchone()
+        base = None
+        if base_run_id is not None:
+            cursor.execute("SELECT snapshot_at FROM payout_runs WHERE id = %s", (base_run_id,))
+            base = (base_run_id, cursor.fetchone()[0])
+        cursor.close()
+        cursor = None
+        
+        recomputed, carried = payouts.execute_run(conn, run_id, json.loads(settings), base,
+                                                  progress=context.progress)
+        print(f"Payout run {run_id}: {recomputed} sites computed, {carried} carried over from run {base_run_id}")
+        return {'run_id': run_id, 'recomputed_sites': recomputed, 'carried_sites': carried}
+    except Exception as e:
+        try:
+            conn.rollback()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM payout_lines WHERE run_id = %s", (run_id,))
+            cursor.execute(
+                "UPDATE payout_runs SET status = %s, error = %s, finished_at = NOW() WHERE id = %s",
+                (payouts.FAILED, str(e) or 'Cancelled', run_id)
+            )
+            conn.commit()
+        except Exception as cleanup_error:
+            print(f"Payout run {run_id} cleanup error: {str(cleanup_error)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
+job_manager.register('report', run_report_job)
+job_manager.register('import', run_import_job)
+job_manager.register('payout', run_payout_job)
+
+def submit_background_job(kind, params):
+    try:
+        job_id = job_manager.submit(kind, params, owner=current_identity())
+    except JobQueueFull as e:
+        return jsonify({'message': str(e)}), 429
+    except JobStoreUnavailable as e:
+        return jsonify({'message': str(e)}), 503
+    except Exception as e:
+        print(f"Job submit error: {str(e)}")
+        return jsonify({'message': f'Error submitting job: {str(e)}'}), 500
+    print(f"Submitted {kind} job {job_id}")
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f'/api/jobs/{job_id}'}), 202
+
+@app.route('/api/jobs', methods=['POST'])
+@jwt_required()
+def submit_job():
+    """Queue a report export; Excel imports are queued with /api/upload?background=true"""
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind', 'report')
+    if kind != 'report':
+        return jsonify({'message': f'Unsupported job kind: {kind}'}), 400
+    
+    params = {key: data[key] for key in REPORT_JOB_PARAMS if data.get(key)}
+    params.setdefault('format', 'csv')
+    report_type = params.get('type')
+    if not report_type:
+        return jsonify({'message': 'Report type is required'}), 400
+    if params['format'] not in JOB_FORMATS:
+        return jsonify({'message': f"Unsupported report format: {params['format']}"}), 400
+    try:
+        parse_report_type(report_type, params)
+    except ValueError as ve:
+        return jsonify({'message': str(ve)}), 400
+    
+    return submit_background_job('report', params)
+
+@app.route('/api/jobs', methods=['GET'])
+@jwt_required()
+def list_jobs():
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        return jsonify({'message': 'limit must be an integer'}), 400
+    try:
+        return jsonify({'jobs': job_manager.list(owner=current_identity(), limit=limit)}), 200
+    except Exception as e:
+        print(f"Job list error: {str(e)}")
+        return jsonify({'message': f'Error listing jobs: {str(e)}'}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    try:
+        job = job_manager.get(job_id, owner=current_identity())
+    except Exception as e:
+        print(f"Job status error: {str(e)}")
+        return jsonify({'message': f'Error reading job: {str(e)}'}), 500
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    return jsonify(job), 200
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+@jwt_required()
+def get_job_result(job_id):
+    try:
+        result = job_manager.result_file(job_id, owner=current_identity())
+    except Exception as e:
+        print(f"Job result error: {str(e)}")
+        return jsonify({'message': f'Error reading job: {str(e)}'}), 500
+    if result is None:
+        return jsonify({'message': 'No result file for this job'}), 404
+    path, filename, content_type = result
+    # send_file appends the charset for text types itself
+    mimetype = content_type.split(';')[0] if content_type else None
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename)
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_job(job_id):
+    try:
+        job = job_manager.cancel(job_id, owner=current_identity())
+    except Exception as e:
+        print(f"Job cancel error: {str(e)}")
+        return jsonify({'message': f'Error cancelling job: {str(e)}'}), 500
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    return jsonify(job), 200
+
+def start_jobs():
+    """
+    Fail jobs orphaned by a previous process on this host, purge expired
+    ones and remove files in JOB_RESULT_DIR that no job refers to any more
+    """
+    try:
+        interrupted = job_manager.recover()
+        purged = job_manager.purge(JOB_RETENTION_HOURS)
+        swept = job_manager.sweep()
+        print(f"Jobs ready: {interrupted} interrupted, {purged} expired removed, {swept} orphaned files removed")
+        if interrupted:
+            fail_interrupted_payout_runs()
+    except Exception as e:
+        print(f"Job startup error: {str(e)}")
+
+def purge_change_log():
+    """Drop change log entries older than CHANGE_LOG_RETENTION_DAYS"""
+    conn = get_db_connection()
+    if conn is None:
+        return
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        purged = change_log.purge_changes(cursor, CHANGE_LOG_RETENTION_DAYS)
+        conn.commit()
+        print(f"Change log: {purged} entries older than {CHANGE_LOG_RETENTION_DAYS} days removed")
+    except Exception as e:
+        print(f"Change log purge error: {str(e)}")
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
+def fail_interrupted_payout_runs():
+    """Payout runs whose job was interrupted would otherwise stay 'running' forever"""
+    conn = get_db_connection()
+    if conn is None:
+        return
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE payout_runs p JOIN jobs j ON j.id = p.job_id "
+            "SET p.status = %s, p.error = j.error, p.finished_at = NOW() "
+            "WHERE p.status = %s AND j.status = %s",
+            (payouts.FAILED, payouts.RUNNING, 'failed')
+        )
+        conn.commit()
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
+@app.route('/api/payouts', methods=['POST'])
+@jwt_required()
+def create_payout_run():
+    """
+    Start a payout run for a period (YYYY-MM, default this month). Unless
+    "incremental" is false, the run builds on the latest completed run with
+    the same settings and only recomputes sites changed since.
+    """
+    data = request.get_json(silent=True) or {}
+    period = data.get('period') or datetime.now().strftime('%Y-%m')
+    try:
+        period = datetime.strptime(period, '%Y-%m').strftime('%Y-%m')
+    except (TypeError, ValueError):
+        return jsonify({'message': f'Invalid period: {period}; use YYYY-MM'}), 400
+    incremental = data.get('incremental', True) not in (False, 'false', 0, '0')
+    settings = payouts.settings_key({'active_status': PAYOUT_ACTIVE_STATUS, 'gst_rate': PAYOUT_GST_RATE})
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({'message': 'Database connection failed'}), 503
+        cursor = conn.cursor()
+        
+        base_run_id = None
+        if incremental:
+            cursor.execute(
+                "SELECT id FROM payout_runs WHERE status = %s AND settings = %s ORDER BY id DESC LIMIT 1",
+                (payouts.COMPLETED, settings)
+            )
+            row = cursor.fetchone()
+            base_run_id = row[0] if row else None
+        
+        cursor.execute(
+            "INSERT INTO payout_runs (period, status, created_by, base_run_id, settings, created_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (period, payouts.RUNNING, current_identity(), base_run_id, settings, datetime.now())
+        )
+        run_id = cursor.lastrowid
+        conn.commit()
+        
+        response, status_code = submit_background_job('payout', {'run_id': run_id})
+        body = response.get_json()
+        if status_code != 202:
+            cursor.execute(
+                "UPDATE payout_runs SET status = %s, error = %s, finished_at = NOW() WHERE id = %s",
+                (payouts.FAILED, body.get('message'), run_id)
+            )
+        else:
+            cursor.execute("UPDATE payout_runs SET job_id = %s WHERE id = %s", (body['job_id'], run_id))
+        conn.commit()
+        body.update({'run_id': run_id, 'period': period, 'base_run_id': base_run_id})
+        return jsonify(body), status_code
+    
+    except Exception as e:
+        print(f"Payout run error: {str(e)}")
+        return jsonify({'message': f'Error starting payout run: {str(e)}'}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/api/payouts', methods=['GET'])
+@jwt_required()
+def list_payout_runs():
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        return jsonify({'message': 'limit must be an integer'}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection(use_primary=False)
+        if conn is None:
+            return jsonify({'message': 'Database connection failed'}), 503
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT {', '.join(payouts.RUN_COLUMNS)} FROM payout_runs ORDER BY id DESC LIMIT %s", (limit,)
+        )
+        return jsonify({'runs': [payouts.run_record(row) for row in cursor.fetchall()]}), 200
+    except Exception as e:
+        print(f"Payout list error: {str(e)}")
+        return jsonify({'message': f'Error listing payout runs: {str(e)}'}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/api/payouts/<int:run_id>', methods=['GET'])
+@jwt_required()
+def get_payout_run(run_id):
+    """Run status and totals, with totals per DIV once the run has completed"""
+    conn = None
+    cursor = None
+    try:
+        # Read from the primary: a run is polled while its job is writing it
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({'message': 'Database connection failed'}), 503
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(payouts.RUN_COLUMNS)} FROM payout_runs WHERE id = %s", (run_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return jsonify({'message': 'Payout run not found'}), 404
+        run = payouts.run_record(row)
+        
+        if run['status'] == payouts.COMPLETED:
+            cursor.execute(
+                "SELECT `div`, COUNT(DISTINCT `site`), SUM(gross), SUM(tds), SUM(gst), SUM(net) "
+                "FROM payout_lines WHERE run_id = %s GROUP BY `div` ORDER BY `div`", (run_id,)
+            )
+            run['by_div'] = [
+                {'div': div, 'site_count': sites, 'gross': float(gross), 'tds': float(tds),
+                 'gst': float(gst), 'net': float(net)}
+                for div, sites, gross, tds, gst, net in cursor.fetchall()
+            ]
+        return jsonify(run), 200
+    except Exception as e:
+        print(f"Payout run error: {str(e)}")
+        return jsonify({'message': f'Error reading payout run: {str(e)}'}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/api/payouts/<int:run_id>/file', methods=['GET'])
+@jwt_required()
+def get_payout_file(run_id):
+    """Stream the lines of a completed payout run as csv (default), xlsx or ndjson"""
+    response_format = request.args.get('format', 'csv')
+    if response_format not in PAYOUT_FILE_FORMATS:
+        return jsonify({'message': f'Unsupported payout file format: {response_format}'}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({'message': 'Database connection failed'}), 503
+        cursor = conn.cursor()
+        cursor.execute("SELECT period, status FROM payout_runs WHERE id = %s", (run_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return jsonify({'message': 'Payout run not found'}), 404
+        period, status = row
+        if status != payouts.COMPLETED:
+            return jsonify({'message': f'Payout run {run_id} is {status}'}), 409
+        cursor.close()
+        
+        # Unbuffered, so lines are pulled from the server as the file is written
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(
+            f"SELECT {', '.join(payouts.quote(column) for column in payouts.LINE_COLUMNS)} FROM payout_lines "
+            "WHERE run_id = %s ORDER BY `site`, `owner_index`", (run_id,)
+        )
+        batches = payouts.iter_lines(cursor, REPORT_STREAM_BATCH)
+        keys = payouts.LINE_COLUMNS
+        filename = f'payout-{period}-run{run_id}.{response_format}'
+        
+        # The response generator owns the cursor and connection from here on
+        response = stream_records(conn, cursor, response_format, batches, keys, 'payout', filename,
+                                  f'Payout {period}')
+        conn = cursor = None
+        return response
+    except Exception as e:
+        print(f"Payout file error: {str(e)}")
+        return jsonify({'message': f'Error generating payout file: {str(e)}'}), 500
     finally:
         if cursor:
             cursor.close()
@@ -1057,9 +2244,6 @@ def search_sites():
     search_term = request.args.get('term', '')
     site_id_search = request.args.get('site_id_search', 'false') == 'true'
     
-    # Get current date for calculations
-    current_date = datetime.now().date()
-    
     # Clean up search term
     search_term = search_term.strip().upper() if search_term else ''
     
@@ -1069,16 +2253,13 @@ def search_sites():
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(use_primary=False)
         if conn is None:
             return jsonify({'message': 'Database connection failed'}), 503
             
-        cursor = conn.cursor(dictionary=True)
+        cursor = conn.cursor()
         
-        if site_id_search:
-            query = """
-                SELECT 
-                    `SITE` as site_id,
+        columns = """
                     `SITE`,
                     `STORE NAME`,
                     `REGION`,
@@ -1088,25 +2269,33 @@ def search_sites():
                     `CURRENT DATE`,
                     `GST NUMBER`,
                     `PAN NUMBER`
+        """
+        site_ids = None
+        if site_id_search:
+            query = f"""
+                SELECT {columns}
                 FROM rentdetails 
                 WHERE `SITE` = %s
                 LIMIT 1
             """
             cursor.execute(query, [search_term])
+        elif ensure_search_index():
+            # Rank in memory, then hydrate only the top matches by primary key
+            site_ids = search_index.search(search_term, SEARCH_LIMIT)
+            if not site_ids:
+                return jsonify({'message': 'No results found'}), 404
+            placeholders = ', '.join(['%s'] * len(site_ids))
+            query = f"""
+                SELECT {columns}
+                FROM rentdetails 
+                WHERE `SITE` IN ({placeholders})
+            """
+            cursor.execute(query, site_ids)
         else:
+            # Index unavailable: fall back to the scanning LIKE query
             search_pattern = f"%{search_term}%"
-            query = """
-                SELECT 
-                    `SITE` as site_id,
-                    `SITE`,
-                    `STORE NAME`,
-                    `REGION`,
-                    `DIV`,
-                    `RENT POSITION DATE`,
-                    `AGREEMENT VALID UPTO`,
-                    `CURRENT DATE`,
-                    `GST NUMBER`,
-                    `PAN NUMBER`
+            query = f"""
+                SELECT {columns}
                 FROM rentdetails 
                 WHERE `SITE` LIKE %s 
                 OR `STORE NAME` LIKE %s
@@ -1120,61 +2309,11 @@ def search_sites():
         if not results:
             return jsonify({'message': 'No results found'}), 404
         
-        processed_results = []
-        for result in results:
-            # Get required dates for calculations
-            rent_position_date = result.get('RENT POSITION DATE')
-            agreement_valid_upto = result.get('AGREEMENT VALID UPTO')
-            
-            site_data = {
-                'site_id': result.get('site_id'),
-                'SITE': result.get('SITE'),
-                'STORE NAME': result.get('STORE NAME'),
-                'REGION': result.get('REGION'),
-                'DIV': result.get('DIV'),
-                'GST NUMBER': result.get('GST NUMBER', ''),
-                'PAN NUMBER': result.get('PAN NUMBER', '')
-            }
-            
-            # Calculate CURRENT DATE 1 (time elapsed since RENT POSITION DATE)
-            if rent_position_date:
-                try:
-                    # Convert rent position date to datetime
-                    rpd = datetime.strptime(str(rent_position_date), '%Y-%m-%d').date()
-                    
-                    # Calculate the difference between current date and rent position date
-                    diff = relativedelta(current_date, rpd)
-                    
-                    # Format as "X Years, Y Months, Z Days"
-                    site_data['CURRENT DATE 1'] = (
-                        f"{diff.years} {'Years' if diff.years != 1 else 'Year'}, "
-                        f"{diff.months} {'Months' if diff.months != 1 else 'Month'}, "
-                        f"{diff.days} {'Days' if diff.days != 1 else 'Day'}"
-                    )
-                except Exception as e:
-                    print(f"Error calculating CURRENT DATE 1: {str(e)}")
-                    site_data['CURRENT DATE 1'] = ''
-
-            # Calculate VALIDITY DATE (time remaining until AGREEMENT VALID UPTO)
-            if agreement_valid_upto:
-                try:
-                    # Convert agreement valid upto date to datetime
-                    avu = datetime.strptime(str(agreement_valid_upto), '%Y-%m-%d').date()
-                    
-                    # Calculate the difference between agreement valid upto and current date
-                    diff = relativedelta(avu, current_date)
-                    
-                    # Format as "X Years, Y Months, Z Days"
-                    site_data['VALIDITY DATE'] = (
-                        f"{diff.years} {'Years' if diff.years != 1 else 'Year'}, "
-                        f"{diff.months} {'Months' if diff.months != 1 else 'Month'}, "
-                        f"{diff.days} {'Days' if diff.days != 1 else 'Day'}"
-                    )
-                except Exception as e:
-                    print(f"Error calculating VALIDITY DATE: {str(e)}")
-                    site_data['VALIDITY DATE'] = ''
-
-            processed_results.append(site_data)
+        if site_ids:
+            rank = {site_id: i for i, site_id in enumerate(site_ids)}
+            results.sort(key=lambda row: rank.get(str(row[0]).strip(), len(rank)))
+        
+        processed_results = get_decoder(cursor.description, 'search').decode_many(results)
         
         return jsonify({'results': processed_results}), 200
         
@@ -1187,52 +2326,133 @@ def search_sites():
         if conn:
             conn.close()
 
-def create_tables_if_needed():
-    """Creates necessary database tables if they don't exist"""
+def build_search_index():
+    """(Re)build the search index from rentdetails. Returns True if the index is usable."""
+    if not search_index_build_lock.acquire(blocking=False):
+        # Another thread is already building
+        return search_index.ready
     conn = None
     cursor = None
     try:
-        # Create USERS table if it doesn't exist
+        started = time.monotonic()
+        # The primary: a lagging replica would leave recent writes out until their sites change again
         conn = get_db_connection()
         if conn is None:
-            print("Failed to create tables: Database connection failed")
-            return False
-            
+            print("Search index build skipped: Database connection failed")
+            return search_index.ready
         cursor = conn.cursor()
-        
-        # Check if USERS table exists
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS USERS (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            username VARCHAR(80) UNIQUE NOT NULL,
-            password VARCHAR(120) NOT NULL,
-            role VARCHAR(20) NOT NULL DEFAULT 'user'
-        )
-        """)
-        conn.commit()
+        cursor.execute("SELECT `SITE`, `STORE NAME`, `REGION` FROM rentdetails")
+        search_index.build(cursor.fetchall())
+        print(f"Search index built: {search_index.stats()['documents']} sites in {time.monotonic() - started:.2f}s")
+        return True
+    except Exception as e:
+        print(f"Search index build error: {str(e)}")
+        return search_index.ready
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+        search_index_build_lock.release()
 
-        # Create default admin user if not exists
-        cursor.execute("SELECT COUNT(*) FROM USERS WHERE username = 'admin'")
-        admin_exists = cursor.fetchone()[0]
-        
-        if not admin_exists:
-            hashed = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
+def ensure_search_index():
+    """Build the index on first use; refresh a stale one without blocking the caller"""
+    if not search_index.ready:
+        return build_search_index()
+    if search_index.stats()['age_seconds'] > SEARCH_INDEX_REFRESH_SECONDS:
+        threading.Thread(target=build_search_index, daemon=True).start()
+    return True
+
+def refresh_search_entries(site_ids, chunk_size=1000):
+    """Re-read the given sites into the search index after a write"""
+    if not search_index.ready or not site_ids:
+        return
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            print("Search index refresh skipped: Database connection failed")
+            return
+        cursor = conn.cursor()
+        site_ids = [str(site_id).strip() for site_id in site_ids]
+        for start in range(0, len(site_ids), chunk_size):
+            chunk = site_ids[start:start + chunk_size]
+            placeholders = ', '.join(['%s'] * len(chunk))
             cursor.execute(
-            "INSERT INTO USERS (username, password, role) VALUES (%s, %s, %s)",
-                ('admin', hashed.decode('utf-8'), 'admin')
+                f"SELECT `SITE`, `STORE NAME`, `REGION` FROM rentdetails WHERE `SITE` IN ({placeholders})",
+                chunk
             )
-            conn.commit()
-        
+            found = set()
+            for site, store_name, region in cursor.fetchall():
+                search_index.upsert(site, store_name, region)
+                found.add(str(site).strip())
+            for site_id in chunk:
+                if site_id not in found:
+                    search_index.remove(site_id)
+    except Exception as e:
+        print(f"Search index refresh error: {str(e)}")
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# Set once migrations have run in this process
+schema_ready = threading.Event()
+schema_lock = threading.Lock()
+SCHEMA_RETRY_SECONDS = 60
+schema_retry_at = 0.0
+
+def ensure_schema_ready():
+    """
+    Run the schema bootstrap once per process.
+    Called at startup; afterwards it is just a flag check.
+    A failed bootstrap is retried at most every SCHEMA_RETRY_SECONDS.
+    """
+    global schema_retry_at
+    if schema_ready.is_set():
+        return True
+    with schema_lock:
+        if schema_ready.is_set() or time.monotonic() < schema_retry_at:
+            return schema_ready.is_set()
+        if create_tables_if_needed():
+            schema_ready.set()
+        else:
+            schema_retry_at = time.monotonic() + SCHEMA_RETRY_SECONDS
+    return schema_ready.is_set()
+
+def create_tables_if_needed():
+    """Applies any pending schema migrations (see migrations.py)"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            print("Failed to create tables: Database connection failed")
+            return False
+            
+        applied = migrate(conn)
+        if applied:
+            print(f"Applied migrations: {', '.join(applied)}")
         return True
     except Exception as e:
         print(f"Database initialization error: {str(e)}")
         return False
     finally:
-        if cursor:
-            cursor.close()
         if conn:
             conn.close()
             
+def startup():
+    """Process startup work, shared by run.py and running app.py directly"""
+    # Schema bootstrap happens once here rather than on the request path;
+    # a failure is retried lazily by the first database login
+    ensure_schema_ready()
+    build_search_index()
+    start_jobs()
+    purge_change_log()
+    if REPORT_CACHE_PREWARM:
+        threading.Thread(target=warm_report_cache, daemon=True).start()
+
 if __name__ == '__main__':
-    # Don't try to connect to database at startup
+    startup()
     app.run(debug=True, host='0.0.0.0')
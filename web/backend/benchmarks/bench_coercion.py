@@ -0,0 +1,80 @@
+"""
+Microbenchmark of the field coercion layer.
+
+Compares, per value, the date and money parsing update_site used to do
+(splitting, then up to five strptime formats; chained str.replace) with
+coercion.coerce_value(), and both with the vectorized coerce_series()
+path uploads use.
+
+Usage:
+    python benchmarks/bench_coercion.py [values]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd
+
+from coercion import SPECS, coerce_series, coerce_value
+
+
+def legacy_date(date_str):
+    """The date handling update_site had inline"""
+    date_str = str(date_str).strip()
+    if date_str.count('-') == 2:
+        parts = date_str.split('-')
+        if len(parts) == 3 and len(parts[0]) <= 2 and len(parts[2]) == 4:
+            return f"{parts[2]}-{parts[1].zfill(2)}-{parts[0].zfill(2)}"
+        elif len(parts) == 3 and len(parts[0]) == 4:
+            return date_str
+    for fmt in ['%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y/%m/%d']:
+        try:
+            return datetime.strptime(date_str, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def legacy_number(value):
+    cleaned = str(value).replace('₹', '').replace(',', '').replace('%', '').strip()
+    return float(cleaned) if cleaned else None
+
+
+def synthetic(count):
+    dates = []
+    money = []
+    for i in range(count):
+        day, month, year = 1 + i % 28, 1 + i % 12, 2000 + i % 25
+        dates.append([f'{year}-{month:02d}-{day:02d}', f'{day:02d}/{month:02d}/{year}',
+                      f'{month}/{day}/{year}'][i % 3])
+        money.append([f'₹ {i * 37 % 900000:,}.50', f'{i % 5000}', f'{i % 30}%'][i % 3])
+    return dates, money
+
+
+def timed(label, count, run):
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:28} {elapsed:6.3f} s   {elapsed / count * 1e6:6.2f} us/value")
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 100_000
+    dates, money = synthetic(count)
+    date_spec = SPECS['AGREEMENT DATE']
+    money_spec = SPECS['PRESENT RENT']
+    print(f"{count} values per column")
+    timed('dates: legacy strptime', count, lambda: [legacy_date(value) for value in dates])
+    timed('dates: coerce_value', count, lambda: [coerce_value(date_spec.column, value) for value in dates])
+    timed('dates: coerce_series', count, lambda: coerce_series(pd.Series(dates, dtype=object), date_spec))
+    timed('money: legacy replace', count, lambda: [legacy_number(value) for value in money])
+    timed('money: coerce_value', count, lambda: [coerce_value(money_spec.column, value) for value in money])
+    timed('money: coerce_series', count, lambda: coerce_series(pd.Series(money, dtype=object), money_spec))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
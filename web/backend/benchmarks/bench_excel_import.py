@@ -0,0 +1,89 @@
+"""
+Benchmark validation of an uploaded workbook on synthetic rentdetails rows.
+
+Times prepare_rows() on a DataFrame shaped like pd.read_excel() output,
+i.e. the part of the import that used to run once per row. With --file,
+also writes the rows to a temporary .csv or .xlsx and compares reading it
+whole with streaming it through iter_frames(), including peak memory
+(those timings include the tracemalloc overhead).
+
+Usage:
+    python benchmarks/bench_excel_import.py [rows] [--file csv|xlsx] [--chunk N]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import openpyxl
+import pandas as pd
+
+from bench_report_export import COLUMNS, SyntheticCursor
+from excel_import import DEFAULT_CHUNK_SIZE, iter_frames, prepare_rows
+
+
+def write_file(count, extension, path):
+    cursor = SyntheticCursor(count)
+    if extension == '.csv':
+        pd.DataFrame(cursor.fetchall(), columns=COLUMNS).to_csv(path, index=False)
+        return
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(COLUMNS)
+    for row in cursor.fetchall():
+        sheet.append(list(row))
+    workbook.save(path)
+
+
+def measure(label, run):
+    tracemalloc.start()
+    started = time.perf_counter()
+    valid = run()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:10} {elapsed:6.2f} s   peak {peak / 2**20:7.1f} MiB   {valid} valid")
+
+
+def whole(path, extension):
+    frame = pd.read_csv(path, dtype=str) if extension == '.csv' else pd.read_excel(path)
+    return len(prepare_rows(frame).rows)
+
+
+def streamed(path, extension, chunk_size):
+    seen = {}
+    valid = 0
+    for first_row, frame in iter_frames(path, extension, chunk_size):
+        valid += len(prepare_rows(frame, first_row, seen).rows)
+    return valid
+
+
+def main(argv):
+    args = argv[1:]
+    file_kind = args[args.index('--file') + 1] if '--file' in args else None
+    chunk_size = int(args[args.index('--chunk') + 1]) if '--chunk' in args else DEFAULT_CHUNK_SIZE
+    count = int(args[0]) if args and not args[0].startswith('--') else 50_000
+
+    df = pd.DataFrame(SyntheticCursor(count).fetchall(), columns=COLUMNS)
+    started = time.perf_counter()
+    prepared = prepare_rows(df)
+    elapsed = time.perf_counter() - started
+    print(f"{count} rows   {elapsed:6.2f} s   {len(prepared.rows)} valid, {len(prepared.rejections)} rejected")
+    if file_kind is None:
+        return 0
+
+    extension = '.' + file_kind
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'upload' + extension)
+        write_file(count, extension, path)
+        print(f"{path}: {os.path.getsize(path) / 2**20:.1f} MiB, chunks of {chunk_size}")
+        measure('whole', lambda: whole(path, extension))
+        measure('streamed', lambda: streamed(path, extension, chunk_size))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
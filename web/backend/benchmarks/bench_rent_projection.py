@@ -0,0 +1,48 @@
+"""
+Benchmark the rent projection on a synthetic portfolio.
+
+Usage:
+    python benchmarks/bench_rent_projection.py [sites] [months]
+"""
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rent_projection import parse_projection_spec, project_rents, projection_document
+
+REGIONS = ['NORTH', 'SOUTH', 'EAST', 'WEST', 'CENTRAL']
+
+
+def synthetic_rows(count):
+    rows = []
+    for i in range(count):
+        agreement = date(2015, 1, 1) + timedelta(days=i % 3000)
+        lease = 5 + i % 11
+        rows.append((
+            ['SAP', 'BOT', 'HYP'][i % 3], REGIONS[i % len(REGIONS)], agreement, 30 + i % 60,
+            agreement + timedelta(days=30 + i % 60), 25000.0 + i % 1000, 27500.0 + i % 1000,
+            5.0 + i % 6, 1 + i % 3, agreement, lease,
+            agreement + timedelta(days=365 * lease) if i % 10 else None,
+        ))
+    return rows
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 50_000
+    months = int(argv[2]) if len(argv) > 2 else 120
+    rows = synthetic_rows(count)
+    print(f"{count} sites, {months} months")
+    for group_by in ('none', 'div', 'div,region'):
+        spec = parse_projection_spec(group_by, '2026-01', months)
+        started = time.perf_counter()
+        document = projection_document(spec, project_rents(rows, spec))
+        elapsed = time.perf_counter() - started
+        print(f"group_by={group_by:12} {elapsed:6.2f} s   {len(document['data'])} groups")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,112 @@
+"""
+Benchmark the report export paths on synthetic rentdetails rows.
+
+Rows are generated lazily by a stand-in cursor, so the peak memory figures
+reflect the export itself rather than the input. Compares the buffered JSON
+report (fetchall + decode + serialize) with the streamed CSV and XLSX paths.
+
+Usage:
+    python benchmarks/bench_report_export.py [rows] [--memory]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from row_decoder import get_decoder
+from report_export import iter_records, csv_header, csv_rows, xlsx_chunks
+
+COLUMNS = [
+    'SITE', 'STORE NAME', 'REGION', 'DIV', 'MANAGER', 'ASST MANAGER', 'EXECUTIVE', 'D.O.O', 'SQ.FT',
+    'AGREEMENT DATE', 'RENT POSITION DATE', 'RENT EFFECTIVE DATE', 'AGREEMENT VALID UPTO', 'CURRENT DATE',
+    'LEASE PERIOD', 'RENT FREE PERIOD DAYS', 'RENT EFFECTIVE AMOUNT', 'PRESENT RENT', 'HIKE %', 'HIKE YEAR',
+    'RENT DEPOSIT', 'OWNER NAME-1', 'OWNER NAME-2', 'OWNER NAME-3', 'OWNER NAME-4', 'OWNER NAME-5',
+    'OWNER NAME-6', 'OWNER MOBILE', 'CURRENT DATE 1', 'VALIDITY DATE', 'GST NUMBER', 'PAN NUMBER',
+    'TDS PERCENTAGE', 'MATURE', 'STATUS', 'REMARKS',
+]
+BATCH_SIZE = 1000
+
+
+class SyntheticCursor:
+    """Just enough of a DB-API cursor: description, fetchmany and fetchall"""
+
+    def __init__(self, count):
+        self.description = [(name,) for name in COLUMNS]
+        self._rows = (self._row(i) for i in range(count))
+
+    @staticmethod
+    def _row(i):
+        start = date(2015, 1, 1) + timedelta(days=i % 3000)
+        return (
+            f'SITE{i:06d}', f'Store {i} Main Road', ['NORTH', 'SOUTH', 'EAST', 'WEST'][i % 4], ['SAP', 'BOT'][i % 2],
+            'Manager', 'Asst Manager', 'Executive', start, 1000 + i % 500,
+            start, start + timedelta(days=30), start + timedelta(days=60), start + timedelta(days=3650), None,
+            10, 45, 25000.0 + i % 1000, 27500.0 + i % 1000, 5.0, 3,
+            100000.0, f'Owner {i}', None, None, None, None,
+            None, '9999999999', None, None, '29ABCDE1234F1Z5', 'ABCDE1234F',
+            10.0, 'NO', ['ONLINE', 'OFFLINE'][i % 2], None,
+        )
+
+    def fetchmany(self, size):
+        return [row for _, row in zip(range(size), self._rows)]
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+def buffered_json(count):
+    cursor = SyntheticCursor(count)
+    rows = cursor.fetchall()
+    data = get_decoder(cursor.description, 'report').decode_many(rows)
+    return len(json.dumps({'data': data}))
+
+
+def streamed_csv(count):
+    cursor = SyntheticCursor(count)
+    decoder = get_decoder(cursor.description, 'report')
+    size = len(csv_header(decoder.output_keys))
+    for records in iter_records(cursor, decoder, BATCH_SIZE, date.today()):
+        size += len(csv_rows(records, decoder.output_keys))
+    return size
+
+
+def streamed_xlsx(count):
+    cursor = SyntheticCursor(count)
+    decoder = get_decoder(cursor.description, 'report')
+    batches = iter_records(cursor, decoder, BATCH_SIZE, date.today())
+    return sum(len(chunk) for chunk in xlsx_chunks(batches, decoder.output_keys))
+
+
+def measure(name, func, count, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    size = func(count)
+    elapsed = time.perf_counter() - started
+    line = f"{name:14} {elapsed:8.2f} s   output {size / 2**20:7.1f} MiB"
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"   peak {peak / 2**20:7.1f} MiB"
+    print(line)
+
+
+def main(argv):
+    # tracemalloc slows allocation-heavy code several times over, so timings are only
+    # meaningful without --memory
+    trace_memory = '--memory' in argv
+    args = [arg for arg in argv[1:] if arg != '--memory']
+    count = int(args[0]) if args else 100_000
+    print(f"{count} rows")
+    measure('buffered json', buffered_json, count, trace_memory)
+    measure('csv stream', streamed_csv, count, trace_memory)
+    measure('xlsx stream', streamed_xlsx, count, trace_memory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,47 @@
+"""
+Benchmark the site event hub fanning changes out to idle subscribers.
+
+Usage:
+    python benchmarks/bench_site_events.py [subscribers] [events]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from site_events import EventHub, RESYNC
+
+DIVS = ['SAP', 'BOT', 'HYP']
+
+
+def synthetic_events(count, sites, first_seq):
+    return [
+        {'seq': seq, 'site': f'SITE{seq % sites:05d}', 'operation': 'update', 'fields': ['PRESENT RENT'],
+         'div': DIVS[seq % len(DIVS)], 'region': None}
+        for seq in range(first_seq, first_seq + count)
+    ]
+
+
+def main(argv):
+    subscribers = int(argv[1]) if len(argv) > 1 else 500
+    count = int(argv[2]) if len(argv) > 2 else 2_000
+    hub = EventHub(lambda since: ([], since, False), lambda: 0, max_clients=subscribers, queue_size=200,
+                   poll_interval=60)
+    clients = [hub.subscribe([DIVS[i % len(DIVS)]] if i % 2 else None) for i in range(subscribers)]
+    print(f"{subscribers} subscribers, {count} events")
+    for round_number, sites in enumerate((50, 5_000)):
+        events = synthetic_events(count, sites, round_number * count + 1)
+        started = time.perf_counter()
+        hub.publish(events)
+        elapsed = time.perf_counter() - started
+        resyncs = sum(1 for client in clients if client.next_events(0) is RESYNC)
+        print(f"{sites:6} distinct sites {elapsed:6.2f} s   {elapsed / count * 1e6:8.1f} us/event   "
+              f"{resyncs} resyncs   {hub.stats()}")
+    for client in clients:
+        hub.unsubscribe(client)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,107 @@
+"""
+Append-only log of rentdetails writes, for incremental client sync.
+
+Every write path records one change_log row (migration 0007) per written
+site in the same transaction as the write: the SITE, the operation, the
+columns written (NULL for an insert, which writes them all), where the
+write came from and who made it. seq is an AUTO_INCREMENT, so it only
+grows; a client keeps the last seq it applied and asks for the changes
+after it.
+
+AUTO_INCREMENT values are handed out when a row is inserted, not when its
+transaction commits, so a reader can see seq 12 while 11 is still
+uncommitted, or was rolled back and will never appear. read_changes()
+therefore stops at a gap in the sequence until the row after the gap is
+older than `settle` seconds; a client that moved its cursor past a
+transaction still committing would miss it for good. Writers record their
+changes as the last statement before commit to keep that window short.
+A cursor that is too low is always safe: the client just sees some
+changes twice.
+"""
+import json
+from datetime import datetime, timedelta
+
+INSERTED = 'insert'
+UPDATED = 'update'
+
+CHANGE_COLUMNS = ('seq', 'site', 'operation', 'fields', 'source', 'changed_by', 'changed_at')
+
+
+def record_changes(cursor, changes, source, changed_by, batch_size=1000):
+    """
+    Append (site, operation, columns) tuples to the change log; columns is
+    None for an insert. Call it right before the write's commit.
+    Returns the number of rows recorded.
+    """
+    rows = [(site, operation, json.dumps(list(columns)) if columns is not None else None, source, changed_by)
+            for site, operation, columns in changes]
+    query = ("INSERT INTO change_log (site, operation, fields, source, changed_by) "
+             "VALUES (%s, %s, %s, %s, %s)")
+    for offset in range(0, len(rows), batch_size):
+        cursor.executemany(query, rows[offset:offset + batch_size])
+    return len(rows)
+
+
+def change_record(row):
+    """change_log row as a JSON-ready dict"""
+    change = dict(zip(CHANGE_COLUMNS, row))
+    change['fields'] = json.loads(change['fields']) if change['fields'] else None
+    if isinstance(change['changed_at'], datetime):
+        change['changed_at'] = change['changed_at'].isoformat()
+    return change
+
+
+def _db_now(cursor):
+    # The DB clock, so it compares exactly with changed_at
+    cursor.execute("SELECT NOW(6)")
+    return cursor.fetchone()[0]
+
+
+def oldest_seq(cursor):
+    """Lowest seq still in the log, or None if it is empty"""
+    cursor.execute("SELECT MIN(seq) FROM change_log")
+    return cursor.fetchone()[0]
+
+
+def start_seq(cursor, settle):
+    """
+    Cursor for a client about to do a full load: the last seq older than
+    `settle` seconds, so changes that may still be committing are replayed
+    rather than skipped.
+    """
+    cutoff = _db_now(cursor) - timedelta(seconds=settle)
+    cursor.execute("SELECT MAX(seq) FROM change_log WHERE changed_at < %s", (cutoff,))
+    return cursor.fetchone()[0] or 0
+
+
+def read_changes(cursor, since, limit, settle):
+    """
+    Up to `limit` changes after seq `since`, in seq order.
+    Returns (changes, next_since, more): the change dicts, the cursor to
+    ask with next time, and whether more settled changes are waiting.
+    """
+    now = _db_now(cursor)
+    cursor.execute(
+        f"SELECT {', '.join(CHANGE_COLUMNS)} FROM change_log WHERE seq > %s ORDER BY seq LIMIT %s",
+        (since, limit + 1)
+    )
+    rows = cursor.fetchall()
+    more = len(rows) > limit
+    changes = []
+    expected = since + 1
+    for row in rows[:limit]:
+        seq, changed_at = row[0], row[-1]
+        if seq != expected and now - changed_at < timedelta(seconds=settle):
+            # An earlier seq may still be committing; wait for it
+            more = False
+            break
+        changes.append(change_record(row))
+        expected = seq + 1
+    next_since = changes[-1]['seq'] if changes else since
+    return changes, next_since, more
+
+
+def purge_changes(cursor, days):
+    """Delete changes older than `days` days. Returns the number removed"""
+    cursor.execute("DELETE FROM change_log WHERE changed_at < NOW(6) - INTERVAL %s DAY", (days,))
+    return cursor.rowcount
@@ -0,0 +1,493 @@
+"""
+Field coercion for rentdetails writes.
+
+Every write path converts incoming values with the same per-column rules:
+uploads convert a whole DataFrame column at a time with coerce_series(),
+and the site create/update endpoints convert one value at a time with
+coerce_value(). Both accept the same inputs, produce the same values and
+fail with the same messages:
+- TEXT: stripped; numbers that are whole come back without '.0', dates as
+  YYYY-MM-DD; longer than the column allows is an error.
+- DATE: date/datetime values, or text in one of DATE_FORMATS (tried in
+  order, so 03/04/2024 is 3 April), optionally followed by a time.
+- INT / FLOAT: numbers, or text with the rupee sign, thousands separators
+  and '%' removed. INT values must be whole.
+Blank values (None, NaN, whitespace) take the column default; columns
+without one (MISSING) report the field as missing. Optional TEXT columns
+keep blank text as ''; only a missing value is stored as NULL.
+CURRENT DATE 1 and VALIDITY DATE are derived from other dates when sites
+are read, so they have no spec and writes leave them alone.
+
+Date formats are compiled to regular expressions once. The scalar path
+remembers, per text shape (digits and separators), which formats can
+match, so repeated values of the same shape go straight to their format.
+The vectorized path converts plain dates (three digit fields) with numpy,
+each distinct text once, and numeric text with numpy after one cleaning
+pass over the column; cells it cannot handle, such as dates with a time
+or text with unusual whitespace, go through the scalar parsers.
+"""
+import math
+import re
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from itertools import repeat
+import numpy as np
+import pandas as pd
+
+# Column kinds
+TEXT = 'text'
+DATE = 'date'
+INT = 'int'
+FLOAT = 'float'
+
+MISSING = object()   # required: a blank value is an error
+
+ColumnSpec = namedtuple('ColumnSpec', ['column', 'kind', 'default', 'max_length', 'required'])
+
+
+def _spec(column, kind, default=MISSING, max_length=None, required=True):
+    return ColumnSpec(column, kind, default, max_length, required)
+
+
+# rentdetails columns with their defaults for blank values and their sizes.
+# required columns are NOT NULL; an upload must provide them (or their
+# default), the others are only imported when the sheet has them.
+COLUMN_SPECS = [
+    _spec('SITE', TEXT, max_length=10),
+    _spec('STORE NAME', TEXT, max_length=100),
+    _spec('REGION', TEXT, max_length=50),
+    _spec('DIV', TEXT, max_length=10),
+    _spec('MANAGER', TEXT, max_length=100),
+    _spec('ASST MANAGER', TEXT, max_length=100),
+    _spec('EXECUTIVE', TEXT, max_length=100),
+    _spec('D.O.O', DATE),
+    _spec('SQ.FT', INT, 0),
+    _spec('AGREEMENT DATE', DATE),
+    _spec('RENT POSITION DATE', DATE),
+    _spec('RENT EFFECTIVE DATE', DATE),
+    _spec('LEASE PERIOD', INT, 0),
+    _spec('RENT FREE PERIOD DAYS', INT, 0),
+    _spec('RENT EFFECTIVE AMOUNT', FLOAT, 0),
+    _spec('PRESENT RENT', FLOAT, 0),
+    _spec('HIKE %', FLOAT, 0),
+    _spec('HIKE YEAR', INT, 0),
+    _spec('RENT DEPOSIT', FLOAT, 0),
+    _spec('OWNER NAME-1', TEXT, max_length=100),
+    _spec('GST NUMBER', TEXT, 'NA', max_length=20),
+    _spec('PAN NUMBER', TEXT, 'NA', max_length=20),
+    _spec('TDS PERCENTAGE', FLOAT, 0),
+    _spec('MATURE', TEXT, 'NO', max_length=3),
+    _spec('STATUS', TEXT, 'ACTIVE', max_length=10),
+    _spec('AGREEMENT VALID UPTO', DATE, None, required=False),
+    _spec('CURRENT DATE', DATE, None, required=False),
+    _spec('OWNER NAME-2', TEXT, None, 100, required=False),
+    _spec('OWNER NAME-3', TEXT, None, 100, required=False),
+    _spec('OWNER NAME-4', TEXT, None, 100, required=False),
+    _spec('OWNER NAME-5', TEXT, None, 100, required=False),
+    _spec('OWNER NAME-6', TEXT, None, 100, required=False),
+    _spec('OWNER MOBILE', TEXT, None, 20, required=False),
+    _spec('REMARKS', TEXT, None, required=False),
+]
+SPECS = {spec.column: spec for spec in COLUMN_SPECS}
+
+# Filled in by the report decoder from other dates (VARCHAR(50) since
+# migration 0002); not writable
+DERIVED_COLUMNS = ('CURRENT DATE 1', 'VALIDITY DATE')
+
+# Accepted text dates, in order of preference
+DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%m/%d/%Y', '%Y/%m/%d', '%d.%m.%Y')
+
+_DATE_FIELDS = {'%Y': r'(?P<year>[0-9]{4})', '%m': r'(?P<month>[0-9]{1,2})', '%d': r'(?P<day>[0-9]{1,2})'}
+# Exports and spreadsheets often carry a time after the date; it is ignored
+_TIME = r'[ T][0-9]{1,2}:[0-9]{2}(?::[0-9]{2}(?:\.[0-9]+)?)?'
+_TIME_SUFFIX = f'(?:{_TIME})?'
+
+
+def _date_pattern(date_format):
+    body = re.sub('%[Ymd]|[^%]+', lambda m: _DATE_FIELDS.get(m.group(0)) or re.escape(m.group(0)), date_format)
+    return re.compile(f'^{body}{_TIME_SUFFIX}$')
+
+
+DATE_PATTERNS = tuple(_date_pattern(date_format) for date_format in DATE_FORMATS)
+
+DATE_SEPARATORS = tuple(dict.fromkeys(date_format[2] for date_format in DATE_FORMATS))
+
+
+def _layout_fields():
+    layouts = {}
+    for date_format in DATE_FORMATS:
+        fields = date_format.split(date_format[2])
+        layouts.setdefault((date_format[2], date_format.startswith('%Y')), []).append(
+            tuple(fields.index(field) for field in ('%Y', '%m', '%d')))
+    return layouts
+
+
+# DATE_FORMATS by layout (separator, whether the year comes first), as the
+# positions of the year, month and day fields in preference order
+LAYOUT_FIELDS = _layout_fields()
+
+# Removed from numeric text before parsing: rupee sign, thousands separators, '%', spaces
+_NUMBER_NOISE = {ord(char): None for char in '₹,% \t\r\n\xa0'}
+# Plain decimal numbers only: no 'nan', 'inf', hex or '1_000' (as pd.to_numeric)
+_NUMBER_RE = re.compile(r'^[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?$')
+
+# Text shape for picking date formats: every digit becomes 0
+_SHAPE_TABLE = str.maketrans('123456789', '000000000')
+
+
+def error_message(spec):
+    """Why a value of this column was rejected"""
+    if spec.kind == TEXT:
+        return f'{spec.column} is longer than {spec.max_length} characters'
+    if spec.kind == DATE:
+        return f'{spec.column} is not a valid date'
+    if spec.kind == INT:
+        return f'{spec.column} is not a whole number'
+    return f'{spec.column} is not a number'
+
+
+def missing_message(column):
+    return f'Missing required field: {column}'
+
+
+def keeps_empty_text(spec):
+    """Whether blank text in this column is stored as '' rather than the default"""
+    return spec.kind == TEXT and not spec.required and spec.default is None
+
+
+# -- vectorized path (DataFrame columns) ---------------------------------------
+
+def _is_text(raw):
+    if pd.api.types.is_string_dtype(raw.dtype) and raw.dtype != object:
+        return raw.notna().to_numpy()
+    if raw.dtype != object:
+        return np.zeros(len(raw), dtype=bool)
+    return np.fromiter((isinstance(value, str) for value in raw.tolist()), dtype=bool, count=len(raw))
+
+
+def _blank(raw, text):
+    blank = raw.isna().to_numpy().copy()
+    if text.any():
+        blank[text] = [not value.strip() for value in raw.to_numpy()[text].tolist()]
+    return blank
+
+
+@lru_cache(maxsize=256)
+def _date_candidates(shape):
+    """Indexes of the DATE_FORMATS that text of this shape can match, in preference order"""
+    return tuple(i for i, pattern in enumerate(DATE_PATTERNS) if pattern.match(shape))
+
+
+def _cell_text(value):
+    if isinstance(value, float) and value.is_integer():
+        # Numeric SITE or PAN cells come back from Excel as floats
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return str(value).strip()
+
+
+def text_series(raw):
+    """Column as stripped text, the way TEXT columns are coerced"""
+    if pd.api.types.is_float_dtype(raw.dtype):
+        integral = raw.notna() & (raw % 1 == 0)
+        if integral.sum() == raw.notna().sum():
+            return raw.astype('Int64').astype(str).astype(object)
+    if pd.api.types.is_string_dtype(raw.dtype) and raw.dtype != object:
+        return raw.str.strip().astype(object)
+    return raw.map(_cell_text, na_action='ignore').astype(object)
+
+
+def _series_dates(raw, text):
+    """Object array of dates (None where unparsed)"""
+    if pd.api.types.is_datetime64_dtype(raw.dtype):
+        return raw.to_numpy().astype('datetime64[D]').astype(object)
+    cells = raw.to_numpy(dtype=object)
+    values = np.array([value.date() if isinstance(value, datetime) else value if isinstance(value, date)
+                       else None for value in cells.tolist()], dtype=object)
+    if not text.any():
+        return values
+
+    positions = np.flatnonzero(text)
+    values[positions] = _text_dates([value.strip() for value in cells[positions].tolist()])
+    return values
+
+
+def _field_dates(years, months, days):
+    """datetime64[D] array from year, month and day numbers (NaT where they are not a date)"""
+    valid = (years >= 1) & (months >= 1) & (months <= 12) & (days >= 1)
+    starts = np.where(valid, (years - 1970) * 12 + months - 1, 0).astype('datetime64[M]')
+    first_days = starts.astype('datetime64[D]')
+    valid &= days <= ((starts + 1).astype('datetime64[D]') - first_days).astype(np.int64)
+    return np.where(valid, first_days + (np.where(valid, days, 1) - 1), np.datetime64('NaT'))
+
+
+def _text_dates(texts):
+    """Object array of dates for a list of stripped text (None where unparsed)"""
+    # Date columns repeat a lot, so each distinct text is parsed once
+    codes, uniques = pd.factorize(np.array(texts, dtype=object))
+    uniques = uniques.tolist()
+    count = len(uniques)
+    dates = np.full(count, None, dtype=object)
+    unparsed = np.ones(count, dtype=bool)
+    lengths = np.fromiter(map(len, uniques), dtype=np.intp, count=count)
+    ascii = np.fromiter(map(str.isascii, uniques), dtype=bool, count=count)
+
+    # Plain dates (three ASCII digit fields, one separator, a 4 digit year
+    # first or last) are checked and converted a separator at a time with str
+    # methods mapped over the column and numpy, trying the formats of each
+    # layout in preference order
+    for separator in DATE_SEPARATORS:
+        rows = np.flatnonzero(ascii & (np.fromiter(map(str.count, uniques, repeat(separator)), dtype=np.intp,
+                                                   count=count) == 2))
+        if not len(rows):
+            continue
+        candidates = [uniques[row] for row in rows.tolist()]
+        first = np.fromiter(map(str.find, candidates, repeat(separator)), dtype=np.intp, count=len(rows))
+        last = np.fromiter(map(str.rfind, candidates, repeat(separator)), dtype=np.intp, count=len(rows))
+        digits = np.fromiter(map(str.isdigit, map(str.replace, candidates, repeat(separator), repeat(''))),
+                             dtype=bool, count=len(rows))
+        middle = last - first - 1
+        tail = lengths[rows] - last - 1
+        year_first = first == 4
+        plain = digits & (middle >= 1) & (middle <= 2) & np.where(
+            year_first, (tail >= 1) & (tail <= 2), (tail == 4) & (first >= 1) & (first <= 2))
+        if not plain.any():
+            continue
+        fields = np.fromstring(' '.join(candidates[index] for index in np.flatnonzero(plain).tolist())
+                               .replace(separator, ' '), dtype=np.int64, sep=' ').reshape(-1, 3)
+        rows, year_first = rows[plain], year_first[plain]
+        for leading_year in (True, False):
+            remaining = np.flatnonzero(year_first == leading_year)
+            for year, month, day in LAYOUT_FIELDS.get((separator, leading_year), ()):
+                if not len(remaining):
+                    break
+                parsed = _field_dates(fields[remaining, year], fields[remaining, month], fields[remaining, day])
+                matched = ~np.isnat(parsed)
+                dates[rows[remaining[matched]]] = parsed[matched].astype(object)
+                unparsed[rows[remaining[matched]]] = False
+                remaining = remaining[~matched]
+
+    # Times, odd spacing and invalid dates: the scalar parser decides
+    for index in np.flatnonzero(unparsed).tolist():
+        try:
+            dates[index] = _scalar_date(uniques[index])
+        except ValueError:
+            pass
+    return dates[codes]
+
+
+def _number_text(value):
+    """Numeric text with _NUMBER_NOISE removed; raises ValueError if it is not a plain decimal number"""
+    cleaned = value.replace('₹', '').replace(',', '').replace('%', '').replace(' ', '')
+    if not (cleaned.isascii() and cleaned.isprintable() and '_' not in cleaned):
+        # float() would take other whitespace, '1_000' and non-ASCII digits
+        cleaned = value.translate(_NUMBER_NOISE)
+        if not _NUMBER_RE.match(cleaned):
+            raise ValueError
+    return cleaned
+
+
+def _text_numbers(texts):
+    """Float array for a list of numeric text (NaN where unparsed)"""
+    cleaned = [value.replace('₹', '').replace(',', '').replace('%', '').replace(' ', '') for value in texts]
+    joined = ''.join(cleaned)
+    if joined.isascii() and joined.isprintable() and '_' not in joined:
+        # Printable ASCII without '_' is what float() and _NUMBER_RE agree on,
+        # so numpy can convert the column in one go unless a cell is not a number
+        try:
+            return np.array(cleaned, dtype=np.float64)
+        except ValueError:
+            pass
+    numbers = np.full(len(texts), np.nan)
+    for index, value in enumerate(texts):
+        try:
+            numbers[index] = float(_number_text(value))
+        except ValueError:
+            pass
+    return numbers
+
+
+def _series_numbers(raw, text):
+    """Float array (NaN where unparsed)"""
+    cells = raw.to_numpy(dtype=object) if raw.dtype == object else None
+    numeric = ~text & raw.notna().to_numpy()
+    if pd.api.types.is_bool_dtype(raw.dtype):
+        numeric[:] = False
+    elif cells is not None and numeric.any():
+        # True/False are not numbers here, as in the scalar path
+        numeric[numeric] = [not isinstance(value, (bool, np.bool_)) for value in cells[numeric].tolist()]
+    numbers = np.full(len(raw), np.nan)
+    if numeric.any():
+        numbers[numeric] = pd.to_numeric(raw[numeric], errors='coerce').astype(np.float64).to_numpy()
+    if text.any():
+        texts = (cells if cells is not None else raw.to_numpy(dtype=object))[text].tolist()
+        numbers[text] = _text_numbers(texts)
+    numbers[~np.isfinite(numbers)] = np.nan
+    return numbers
+
+
+def coerce_series(raw, spec):
+    """
+    (values, invalid) for one column: values as a list ready for the
+    database, with defaults filled into blank cells, and a boolean array of
+    cells that could not be converted or are too long
+    """
+    raw = raw.reset_index(drop=True)
+    invalid = np.zeros(len(raw), dtype=bool)
+
+    if spec.kind == TEXT:
+        values = text_series(raw)
+        blank = values.isna().to_numpy()
+        if not keeps_empty_text(spec):
+            blank |= (values == '').to_numpy()
+        if spec.max_length:
+            invalid = ~blank & (values.str.len().fillna(0).to_numpy() > spec.max_length)
+        values = values.tolist()
+    else:
+        text = _is_text(raw)
+        blank = _blank(raw, text)
+        if spec.kind == DATE:
+            values = _series_dates(raw, text & ~blank)
+            invalid = ~blank & pd.isna(values)
+            values = values.tolist()
+        else:
+            numbers = _series_numbers(raw, text & ~blank)
+            invalid = ~blank & np.isnan(numbers)
+            if spec.kind == INT:
+                invalid |= ~np.isnan(numbers) & (numbers % 1 != 0)
+                values = [int(value) for value in np.where(blank | invalid, 0, numbers).tolist()]
+            else:
+                values = numbers.tolist()
+
+    default = None if spec.default is MISSING else spec.default
+    if default is not None and spec.kind == FLOAT:
+        default = float(default)
+    for index in np.flatnonzero(blank | invalid).tolist():
+        values[index] = default
+    return values, invalid
+
+
+# -- scalar path (single values) ------------------------------------------------
+
+def is_blank(value):
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return math.isnan(value)
+    return isinstance(value, str) and not value.strip()
+
+
+def _scalar_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        raise ValueError
+    value = value.strip()
+    for candidate in _date_candidates(value.translate(_SHAPE_TABLE)):
+        match = DATE_PATTERNS[candidate].match(value)
+        try:
+            return date(int(match['year']), int(match['month']), int(match['day']))
+        except ValueError:
+            continue
+    raise ValueError
+
+
+def _scalar_number(value):
+    if isinstance(value, str):
+        value = _number_text(value)
+    elif isinstance(value, bool) or not isinstance(value, (int, float, Decimal, np.number)):
+        raise ValueError
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError
+    return number
+
+
+def _scalar_coercer(spec):
+    """Converter for single values of one column; raises ValueError with the rejection message"""
+    default = None if spec.default is MISSING else spec.default
+    if default is not None and spec.kind == FLOAT:
+        default = float(default)
+    message = error_message(spec)
+
+    if spec.kind == TEXT:
+        def convert(value):
+            value = _cell_text(value)
+            if spec.max_length and len(value) > spec.max_length:
+                raise ValueError(message)
+            return value
+    elif spec.kind == DATE:
+        convert = _scalar_date
+    elif spec.kind == INT:
+        def convert(value):
+            number = _scalar_number(value)
+            if not number.is_integer():
+                raise ValueError
+            return int(number)
+    else:
+        convert = _scalar_number
+
+    keep_empty = keeps_empty_text(spec)
+
+    def coerce(value):
+        if is_blank(value):
+            return '' if keep_empty and isinstance(value, str) else default
+        try:
+            return convert(value)
+        except ValueError:
+            raise ValueError(message)
+    return coerce
+
+
+COERCERS = {spec.column: _scalar_coercer(spec) for spec in COLUMN_SPECS}
+
+
+def coerce_value(column, value):
+    """
+    Coerce one value of `column` the way coerce_series() coerces a column.
+    Blank values become the column default (None for required columns).
+    Raises ValueError with the rejection message.
+    """
+    return COERCERS[column](value)
+
+
+def coerce_record(record, partial=False):
+    """
+    Coerce a {column: value} dict. Returns (values, errors): the coerced
+    values and a list of rejection messages. Unless `partial`, required
+    columns that are absent or blank are reported as missing.
+    """
+    values = {}
+    errors = []
+    for column, value in record.items():
+        try:
+            values[column] = coerce_value(column, value)
+        except ValueError as e:
+            errors.append(str(e))
+            continue
+        if values[column] is None and SPECS[column].default is MISSING:
+            errors.append(missing_message(column))
+    if not partial:
+        for spec in COLUMN_SPECS:
+            if spec.default is MISSING and spec.column not in record:
+                errors.append(missing_message(spec.column))
+    return values, errors
+
+
+def same_value(new, stored):
+    """Whether a coerced value equals the value stored in rentdetails"""
+    if new is None or stored is None:
+        return new is None and stored is None
+    if isinstance(stored, datetime):
+        stored = stored.date()
+    if isinstance(new, float) or isinstance(stored, (float, Decimal)):
+        try:
+            return float(new) == float(stored)
+        except (TypeError, ValueError):
+            return False
+    return new == stored
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the pool timeout"""
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a DB-API connection checked out of a ConnectionPool.
+    Everything is delegated to the real connection except close(), which
+    returns the connection to the pool instead of tearing it down.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def invalidate(self):
+        """Discard the underlying connection instead of returning it to the pool"""
+        if not self._returned:
+            self._returned = True
+            self._pool._release(self._raw, self._created_at, discard=True)
+
+    def close(self):
+        if not self._returned:
+            self._returned = True
+            self._pool._release(self._raw, self._created_at)
+
+
+class ConnectionPool:
+    """
+    Thread-safe connection pool.
+
+    Keeps up to `size` idle connections around and allows `max_overflow`
+    extra connections under burst load. Idle connections older than
+    `recycle` seconds are replaced, and with `pre_ping` enabled every
+    checkout verifies the connection is still alive before handing it out.
+    A checkout that cannot be satisfied within `timeout` seconds raises
+    PoolTimeout.
+    """
+
+    def __init__(self, creator, size=5, max_overflow=10, timeout=5.0,
+                 recycle=3600, pre_ping=True, name='primary'):
+        self.creator = creator
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.name = name
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size + max_overflow)
+        self._checked_out = 0
+        self._counters = {
+            'checkouts': 0,
+            'connects': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'timeouts': 0,
+            'errors': 0,
+        }
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def connect(self, timeout=None):
+        """
+        Check out a connection, creating one only when no idle connection is usable.
+        `timeout` overrides the pool's checkout timeout for this call.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise PoolTimeout(
+                f"Timed out after {timeout}s waiting for a '{self.name}' connection "
+                f"({self.size + self.max_overflow} in use)"
+            )
+
+        try:
+            raw, created_at = self._checkout_idle()
+            if raw is None:
+                raw = self.creator()
+                created_at = time.monotonic()
+                with self._lock:
+                    self._counters['connects'] += 1
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._counters['errors'] += 1
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._checked_out += 1
+            self._counters['checkouts'] += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return PooledConnection(self, raw, created_at)
+
+    def _checkout_idle(self):
+        """Pop idle connections until a healthy one is found"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None, None
+                raw, created_at, returned_at = self._idle.pop()
+
+            if self.recycle and time.monotonic() - created_at > self.recycle:
+                with self._lock:
+                    self._counters['recycled'] += 1
+                self._close_quietly(raw)
+                continue
+
+            if self.pre_ping and not self._ping(raw):
+                with self._lock:
+                    self._counters['ping_failures'] += 1
+                self._close_quietly(raw)
+                continue
+
+            return raw, created_at
+
+    def _ping(self, raw):
+        try:
+            if hasattr(raw, 'ping'):
+                raw.ping(reconnect=False)
+            else:
+                cursor = raw.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                cursor.close()
+            return True
+        except Exception as e:
+            print(f"Pool '{self.name}' pre-ping failed: {str(e)}")
+            return False
+
+    def _release(self, raw, created_at, discard=False):
+        if not discard:
+            try:
+                # Never hand an open transaction to the next request
+                raw.rollback()
+            except Exception:
+                discard = True
+
+        with self._lock:
+            self._checked_out -= 1
+            keep = not discard and len(self._idle) < self.size
+            if keep:
+                self._idle.append((raw, created_at, time.monotonic()))
+        if not keep:
+            self._close_quietly(raw)
+        self._slots.release()
+
+    def _close_quietly(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def dispose(self):
+        """Close every idle connection; checked-out connections close when returned"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for raw, _, _ in idle:
+            self._close_quietly(raw)
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._counters['checkouts']
+            return {
+                'name': self.name,
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'timeout': self.timeout,
+                'recycle': self.recycle,
+                'pre_ping': self.pre_ping,
+                'checked_out': self._checked_out,
+                'idle': len(self._idle),
+                'avg_wait_ms': round(self._wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 3),
+                **self._counters,
+            }
@@ -0,0 +1,163 @@
+import threading
+import time
+from db_pool import PoolTimeout
+
+
+def mysql_replication_lag(conn):
+    """
+    Return replication lag in seconds for a MySQL replica connection.
+    A server that reports no replica status at all (e.g. a standalone copy
+    used for local testing) counts as zero lag; a replica whose SQL thread
+    is stopped reports None, which the router treats as unhealthy.
+    """
+    cursor = conn.cursor()
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Exception:
+            # MySQL < 8.0.22 and MariaDB only know the old spelling
+            cursor.execute("SHOW SLAVE STATUS")
+        row = cursor.fetchone()
+        if row is None:
+            return 0
+        columns = [col[0] for col in cursor.description]
+        status = dict(zip(columns, row))
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        return None if lag is None else int(lag)
+    finally:
+        cursor.close()
+
+
+class ReplicaRouter:
+    """
+    Routes read-only checkouts to healthy replica pools and everything else
+    to the primary pool.
+
+    A replica is skipped for `retry_after` seconds after a failed connect,
+    and while its measured lag exceeds `max_lag` seconds. A replica pool
+    with no free connection within `checkout_timeout` seconds is only
+    skipped for that one read: busy is not down. Lag is probed at
+    most every `check_interval` seconds per replica. Callers that wrote
+    within the last `sticky_seconds` are pinned to the primary so they
+    always read their own writes.
+    """
+
+    def __init__(self, primary, replicas=None, max_lag=30, check_interval=10,
+                 retry_after=30, sticky_seconds=10, checkout_timeout=0.05, lag_probe=mysql_replication_lag):
+        self.primary = primary
+        self.replicas = list(replicas or [])
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self.sticky_seconds = sticky_seconds
+        self.checkout_timeout = checkout_timeout
+        self.lag_probe = lag_probe
+
+        self._lock = threading.Lock()
+        self._next = 0
+        self._health = {
+            pool.name: {'down_until': 0.0, 'lag': None, 'checked_at': 0.0, 'failures': 0}
+            for pool in self.replicas
+        }
+        self._recent_writers = {}
+        self._counters = {'primary_reads': 0, 'replica_reads': 0, 'fallbacks': 0, 'replica_busy': 0}
+
+    def note_write(self, identity):
+        """Pin `identity` to the primary for the read-your-own-write window"""
+        if identity is None or not self.replicas:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writers[identity] = now + self.sticky_seconds
+            if len(self._recent_writers) > 1000:
+                self._recent_writers = {
+                    key: until for key, until in self._recent_writers.items() if until > now
+                }
+
+    def _is_sticky(self, identity):
+        if identity is None:
+            return False
+        with self._lock:
+            until = self._recent_writers.get(identity)
+        return until is not None and until > time.monotonic()
+
+    def connect(self, use_primary=True, identity=None):
+        """Check out a connection from the primary or from a healthy replica"""
+        if use_primary:
+            return self.primary.connect()
+        if not self.replicas or self._is_sticky(identity):
+            with self._lock:
+                self._counters['primary_reads'] += 1
+            return self.primary.connect()
+
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        ordered = self.replicas[start:] + self.replicas[:start]
+
+        for pool in ordered:
+            conn = self._try_replica(pool)
+            if conn is not None:
+                with self._lock:
+                    self._counters['replica_reads'] += 1
+                return conn
+
+        with self._lock:
+            self._counters['fallbacks'] += 1
+        return self.primary.connect()
+
+    def _try_replica(self, pool):
+        health = self._health[pool.name]
+        now = time.monotonic()
+        if health['down_until'] > now:
+            return None
+
+        try:
+            conn = pool.connect(timeout=self.checkout_timeout)
+        except PoolTimeout:
+            # Saturated, not broken: fall back for this read only
+            with self._lock:
+                self._counters['replica_busy'] += 1
+            return None
+        except Exception as e:
+            print(f"Replica '{pool.name}' unavailable, falling back: {str(e)}")
+            with self._lock:
+                health['down_until'] = now + self.retry_after
+                health['failures'] += 1
+            return None
+
+        if now - health['checked_at'] >= self.check_interval:
+            try:
+                lag = self.lag_probe(conn)
+            except Exception as e:
+                print(f"Replica '{pool.name}' lag check failed: {str(e)}")
+                lag = None
+            with self._lock:
+                health['lag'] = lag
+                health['checked_at'] = now
+
+        lag = health['lag']
+        if lag is None or lag > self.max_lag:
+            print(f"Replica '{pool.name}' lagging ({lag}s), falling back")
+            conn.close()
+            return None
+        return conn
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            replicas = []
+            for pool in self.replicas:
+                health = self._health[pool.name]
+                replicas.append({
+                    **pool.stats(),
+                    'lag_seconds': health['lag'],
+                    'healthy': health['down_until'] <= now and health['lag'] is not None
+                               and health['lag'] <= self.max_lag,
+                    'connect_failures': health['failures'],
+                })
+            return {
+                'max_lag': self.max_lag,
+                'replicas': replicas,
+                **self._counters,
+            }
@@ -0,0 +1,197 @@
+"""
+Set-based validation of uploaded rentdetails workbooks.
+
+prepare_rows() validates and coerces a whole DataFrame column by column
+instead of row by row: every column is converted once with
+coercion.coerce_series(), the same rules the site endpoints apply to
+single values, and
+the rows that fail any check are collected into a rejection report that
+names the workbook row and the reasons. The surviving rows come back as
+insert-ready tuples; looking up existing SITEs and inserting them in
+batches is left to the caller.
+
+iter_frames() reads an upload as a sequence of DataFrames of at most
+chunk_size rows: .xlsx through openpyxl's read-only mode and .csv through
+pandas' chunked reader, so memory is bounded by the chunk rather than the
+file. Legacy .xls workbooks can only be read whole and come back as one
+frame.
+
+In upsert mode diff_rows() compares the prepared rows with the stored rows
+of the same SITEs column by column, so only new and actually changed rows
+are written back.
+"""
+from collections import namedtuple
+import numpy as np
+import openpyxl
+import pandas as pd
+from coercion import (COLUMN_SPECS, MISSING, coerce_series, error_message, missing_message, same_value,
+                      text_series)
+
+# Spreadsheet row of the first data row (row 1 is the header)
+FIRST_DATA_ROW = 2
+
+IMPORT_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+DEFAULT_CHUNK_SIZE = 5000
+
+# insert: skip SITEs that already exist; upsert: also update the ones whose values changed
+INSERT = 'insert'
+UPSERT = 'upsert'
+IMPORT_MODES = (INSERT, UPSERT)
+
+PreparedRows = namedtuple('PreparedRows', ['columns', 'rows', 'row_numbers', 'rejections'])
+
+
+def prepare_rows(df, first_row=FIRST_DATA_ROW, seen=None):
+    """
+    Validate and coerce a workbook DataFrame whose first row is spreadsheet
+    row `first_row`. Returns PreparedRows: the columns imported, the valid
+    rows as tuples in that order, their spreadsheet row numbers, and one
+    rejection per failed row: {'row': spreadsheet row, 'site': SITE cell,
+    'errors': [...]}. Completely empty rows are ignored.
+    Repeated SITEs keep the first occurrence; pass the same `seen` dict
+    (upper-cased SITE -> row) to every chunk of one file to catch repeats
+    across chunks.
+    """
+    df = df.rename(columns=lambda name: str(name).strip().upper())
+    present = df.notna().any(axis=1).to_numpy()
+    row_numbers = (first_row + np.flatnonzero(present)).tolist()
+    df = df[present].reset_index(drop=True)
+    specs = [spec for spec in COLUMN_SPECS if spec.required or spec.column in df.columns]
+    empty = pd.Series([None] * len(df), dtype=object)
+    if seen is None:
+        seen = {}
+
+    errors = {}
+
+    def reject(mask, message):
+        for pos in np.flatnonzero(mask).tolist():
+            errors.setdefault(pos, []).append(message)
+
+    columns = []
+    for spec in specs:
+        raw = df[spec.column] if spec.column in df.columns else empty
+        values, invalid = coerce_series(raw, spec)
+        reject(invalid, error_message(spec))
+        if spec.default is MISSING:
+            reject(np.array([value is None for value in values], dtype=bool) & ~invalid,
+                   missing_message(spec.column))
+        columns.append(values)
+
+    sites = columns[0]
+    site_cells = text_series(df['SITE']).tolist() if 'SITE' in df.columns else [None] * len(df)
+    for pos, site in enumerate(sites):
+        if site is None or pos in errors:
+            continue
+        key = site.upper()
+        if key in seen:
+            errors.setdefault(pos, []).append(f'Duplicate SITE (first seen on row {seen[key]})')
+        else:
+            seen[key] = row_numbers[pos]
+
+    valid = [pos for pos in range(len(df)) if pos not in errors]
+    rows = list(zip(*columns))
+    rejections = [
+        {'row': row_numbers[pos], 'site': site_cells[pos] if isinstance(site_cells[pos], str) else '',
+         'errors': messages}
+        for pos, messages in sorted(errors.items())
+    ]
+    return PreparedRows(
+        [spec.column for spec in specs],
+        [rows[pos] for pos in valid],
+        [row_numbers[pos] for pos in valid],
+        rejections,
+    )
+
+
+def diff_rows(rows, stored):
+    """
+    Split prepared rows (SITE first) against `stored`, which maps the
+    upper-cased SITE to the stored values of the same columns.
+    Returns (new rows, changed rows, unchanged count).
+    """
+    new = []
+    changed = []
+    unchanged = 0
+    for row in rows:
+        current = stored.get(row[0].upper())
+        if current is None:
+            new.append(row)
+        elif all(same_value(value, old) for value, old in zip(row[1:], current[1:])):
+            unchanged += 1
+        else:
+            changed.append(row)
+    return new, changed, unchanged
+
+
+def changed_columns(columns, row, current):
+    """The columns (SITE excluded) whose value in `row` differs from the stored `current` row"""
+    return [column for column, value, old in zip(columns[1:], row[1:], current[1:]) if not same_value(value, old)]
+
+
+def upload_extension(filename):
+    """Lower-cased extension of an upload, or None if it cannot be imported"""
+    extension = ('.' + filename.rsplit('.', 1)[-1].lower()) if '.' in filename else ''
+    return extension if extension in IMPORT_EXTENSIONS else None
+
+
+def iter_frames(source, extension, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield (first_row, frame) for consecutive chunks of an upload, where
+    first_row is the spreadsheet row of the frame's first row.
+    `source` is a path or a binary file object.
+    """
+    if extension == '.csv':
+        yield from _csv_frames(source, chunk_size)
+    elif extension == '.xlsx':
+        yield from _xlsx_frames(source, chunk_size)
+    else:
+        yield FIRST_DATA_ROW, pd.read_excel(source)
+
+
+def row_estimate(source, extension):
+    """Number of data rows the upload claims to have, or None if unknown without reading it"""
+    if extension != '.xlsx':
+        return None
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        max_row = workbook.active.max_row
+        return max_row - 1 if max_row else None
+    finally:
+        workbook.close()
+        if hasattr(source, 'seek'):
+            source.seek(0)
+
+
+def _csv_frames(source, chunk_size):
+    # Everything as text: numeric-looking SITE and PAN values keep their leading zeros.
+    # Blank lines are kept so rows line up with the file; prepare_rows() ignores them.
+    reader = pd.read_csv(source, dtype=str, encoding='utf-8-sig', chunksize=chunk_size,
+                         skip_blank_lines=False)
+    first_row = FIRST_DATA_ROW
+    with reader:
+        for frame in reader:
+            yield first_row, frame
+            first_row += len(frame)
+
+
+def _xlsx_frames(source, chunk_size):
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [name if name is not None else '' for name in header]
+        width = len(header)
+        first_row = FIRST_DATA_ROW
+        chunk = []
+        for row in rows:
+            chunk.append(row[:width] + (None,) * (width - len(row)))
+            if len(chunk) == chunk_size:
+                yield first_row, pd.DataFrame.from_records(chunk, columns=header)
+                first_row += len(chunk)
+                chunk = []
+        if chunk:
+            yield first_row, pd.DataFrame.from_records(chunk, columns=header)
+    finally:
+        workbook.close()
@@ -1,10 +1,18 @@
-from app import app, db, User
+from app import app, db, User, get_db_connection
+from migrations import migrate
 import bcrypt
 
 def init_db():
     with app.app_context():
-        # Create all tables
-        db.create_all()
+        # Create / upgrade tables through the versioned migrations
+        conn = get_db_connection()
+        if conn is None:
+            print("Database connection failed")
+            return
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
         
         # Create default users if they don't exist
         default_users = [
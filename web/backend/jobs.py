@@ -0,0 +1,357 @@
+"""
+Background jobs for heavy reports and imports.
+
+Jobs run on a bounded thread pool. Their state lives in the `jobs` table
+(migration 0005), so status, progress and results outlive the request that
+submitted them and every worker process can answer for them. Result files
+are written to a local directory on the host that ran the job.
+
+A handler is a callable (context, params) -> result dict. It reports
+progress through context.progress(), which is also where a cancellation
+request surfaces as JobCancelled. Keys 'path', 'filename' and
+'content_type' in the result describe a downloadable file; everything else
+is returned to the client as the job's result summary.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+JOB_COLUMNS = ('id', 'kind', 'status', 'owner', 'worker', 'params', 'progress_done', 'progress_total',
+               'message', 'result', 'result_path', 'error', 'cancel_requested',
+               'created_at', 'started_at', 'finished_at')
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested"""
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when this process already holds the maximum number of jobs"""
+
+
+class JobStoreUnavailable(Exception):
+    """Raised when the jobs table cannot be reached"""
+
+
+class JobContext:
+    """Handed to a job handler: progress reporting, cancellation and result paths"""
+
+    def __init__(self, manager, job_id, owner, params):
+        self.manager = manager
+        self.job_id = job_id
+        self.owner = owner
+        self.params = params
+        self._cancel = threading.Event()
+        self._reported_at = 0.0
+        self._paths = []
+
+    def result_path(self, extension):
+        """Path for a file this job writes; it is removed again if the job does not succeed"""
+        path = os.path.join(self.manager.result_dir, f'{self.job_id}.{extension}')
+        self._paths.append(path)
+        return path
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def progress(self, done, total=None, message=None):
+        """
+        Record progress, at most once per progress_interval. Raises
+        JobCancelled if the job was cancelled here or from another process.
+        """
+        self.check_cancelled()
+        now = time.monotonic()
+        if now - self._reported_at < self.manager.progress_interval:
+            return
+        self._reported_at = now
+        fields = {'progress_done': done, 'progress_total': total}
+        if message is not None:
+            fields['message'] = message[:255]
+        if self.manager._update(self.job_id, fields, check_cancel=True):
+            self._cancel.set()
+            raise JobCancelled()
+
+
+class JobManager:
+    """
+    Runs registered job kinds on at most `max_workers` threads, accepting
+    up to `max_pending` queued or running jobs per process.
+    `connect` returns a DB-API connection (or None) for the jobs table.
+    """
+
+    def __init__(self, connect, result_dir, max_workers=2, max_pending=20, progress_interval=0.5):
+        self.connect = connect
+        self.result_dir = result_dir
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.progress_interval = progress_interval
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        os.makedirs(result_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._handlers = {}
+        self._active = {}      # job id -> (future, context), None while being inserted
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'cancelled': 0, 'rejected': 0}
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    # -- storage -----------------------------------------------------------
+
+    def _execute(self, query, params=(), fetch=False):
+        conn = self.connect()
+        if conn is None:
+            raise JobStoreUnavailable('Job store unavailable: database connection failed')
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            if fetch:
+                return cursor.fetchall()
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            if cursor:
+                cursor.close()
+            conn.close()
+
+    def _update(self, job_id, fields, check_cancel=False):
+        """Update a job row; with check_cancel, returns whether cancellation was requested"""
+        assignments = ', '.join(f'{column} = %s' for column in fields)
+        try:
+            self._execute(f"UPDATE jobs SET {assignments} WHERE id = %s", [*fields.values(), job_id])
+            if check_cancel:
+                rows = self._execute("SELECT cancel_requested FROM jobs WHERE id = %s", (job_id,), fetch=True)
+                return bool(rows and rows[0][0])
+        except Exception as e:
+            print(f"Job {job_id} update error: {str(e)}")
+        return False
+
+    @staticmethod
+    def _serialize(row):
+        job = dict(zip(JOB_COLUMNS, row))
+        for key in ('params', 'result'):
+            job[key] = json.loads(job[key]) if job[key] else None
+        for key in ('created_at', 'started_at', 'finished_at'):
+            if isinstance(job[key], datetime):
+                job[key] = job[key].isoformat()
+        total = job.pop('progress_total')
+        done = job.pop('progress_done')
+        job['progress'] = {
+            'done': done,
+            'total': total,
+            'percent': round(100.0 * done / total, 1) if total else None,
+        }
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        job['has_result'] = job['status'] == SUCCEEDED and bool(job.pop('result_path'))
+        del job['worker']
+        return job
+
+    def _row(self, job_id):
+        rows = self._execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = %s", (job_id,), fetch=True)
+        return rows[0] if rows else None
+
+    # -- public API --------------------------------------------------------
+
+    def submit(self, kind, params, owner=None):
+        """Queue a job and return its id"""
+        if kind not in self._handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        with self._lock:
+            if len(self._active) >= self.max_pending:
+                self._counters['rejected'] += 1
+                raise JobQueueFull(f'Too many background jobs in progress (limit {self.max_pending})')
+            # Hold the slot while the row is written, without holding the lock
+            job_id = uuid.uuid4().hex
+            self._active[job_id] = None
+        try:
+            self._execute(
+                "INSERT INTO jobs (id, kind, status, owner, worker, params, created_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (job_id, kind, QUEUED, owner, self.worker, json.dumps(params), datetime.now())
+            )
+        except Exception:
+            with self._lock:
+                self._active.pop(job_id, None)
+            raise
+        context = JobContext(self, job_id, owner, params)
+        with self._lock:
+            self._active[job_id] = (self._executor.submit(self._run, kind, context), context)
+            self._counters['submitted'] += 1
+        return job_id
+
+    def _run(self, kind, context):
+        job_id = context.job_id
+        try:
+            context.check_cancelled()
+            self._update(job_id, {'status': RUNNING, 'started_at': datetime.now()})
+            result = self._handlers[kind](context, context.params) or {}
+            path = result.pop('path', None)
+            self._finish(job_id, SUCCEEDED, result=json.dumps(result), result_path=path)
+        except JobCancelled:
+            self._discard_files(context)
+            self._finish(job_id, CANCELLED, message='Cancelled')
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed: {str(e)}")
+            self._discard_files(context)
+            self._finish(job_id, FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._active.pop(job_id, None)
+
+    def _finish(self, job_id, status, **fields):
+        self._update(job_id, {'status': status, 'finished_at': datetime.now(), **fields})
+        with self._lock:
+            self._counters[status] += 1
+
+    @staticmethod
+    def _discard_files(context):
+        for path in context._paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get(self, job_id, owner=None):
+        """Job as a dict, or None if it does not exist (or belongs to another owner)"""
+        row = self._row(job_id)
+        if row is None or (owner is not None and row[JOB_COLUMNS.index('owner')] != owner):
+            return None
+        return self._serialize(row)
+
+    def list(self, owner=None, limit=50):
+        query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+        params = []
+        if owner is not None:
+            query += " WHERE owner = %s"
+            params.append(owner)
+        query += " ORDER BY created_at DESC LIMIT %s"
+        params.append(limit)
+        return [self._serialize(row) for row in self._execute(query, params, fetch=True)]
+
+    def result_file(self, job_id, owner=None):
+        """(path, filename, content_type) of a finished job's file, or None"""
+        row = self._row(job_id)
+        if row is None or (owner is not None and row[JOB_COLUMNS.index('owner')] != owner):
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        path = job['result_path']
+        if job['status'] != SUCCEEDED or not path or not os.path.exists(path):
+            return None
+        result = json.loads(job['result']) if job['result'] else {}
+        return path, result.get('filename') or os.path.basename(path), result.get('content_type')
+
+    def cancel(self, job_id, owner=None):
+        """
+        Request cancellation. A queued job is cancelled at once; a running one
+        stops at its next progress report. Returns the job, or None if unknown.
+        """
+        job = self.get(job_id, owner)
+        if job is None or job['status'] in FINISHED:
+            return job
+        self._update(job_id, {'cancel_requested': 1})
+        with self._lock:
+            local = self._active.get(job_id)
+        if local is not None:
+            future, context = local
+            context._cancel.set()
+            if future.cancel():
+                with self._lock:
+                    self._active.pop(job_id, None)
+                self._finish(job_id, CANCELLED, message='Cancelled before it started')
+        return self.get(job_id, owner)
+
+    def recover(self):
+        """
+        Fail jobs left queued or running by a process on this host that no
+        longer exists (e.g. after a restart). Returns how many were failed.
+        """
+        host = self.worker.rsplit(':', 1)[0]
+        rows = self._execute(
+            "SELECT id, worker FROM jobs WHERE status IN (%s, %s)", (QUEUED, RUNNING), fetch=True
+        )
+        lost = []
+        for job_id, worker in rows:
+            worker_host, _, pid = worker.rpartition(':')
+            if worker_host == host and worker != self.worker and not _process_alive(pid):
+                lost.append(job_id)
+        for job_id in lost:
+            self._update(job_id, {'status': FAILED, 'finished_at': datetime.now(),
+                                  'error': 'Interrupted by a server restart'})
+        return len(lost)
+
+    def purge(self, max_age_hours):
+        """Delete finished jobs older than max_age_hours, with their result files"""
+        cutoff = datetime.now() - timedelta(hours=max_age_hours)
+        rows = self._execute(
+            "SELECT id, result_path FROM jobs WHERE status IN (%s, %s, %s) AND created_at < %s",
+            (*FINISHED, cutoff), fetch=True
+        )
+        for job_id, path in rows:
+            if path and os.path.exists(path):
+                os.remove(path)
+            self._execute("DELETE FROM jobs WHERE id = %s", (job_id,))
+        return len(rows)
+
+    def sweep(self, grace_seconds=300):
+        """
+        Remove files in result_dir that no job needs any more: uploads and
+        partial results left behind by interrupted jobs, and files whose job
+        row is gone. Unreferenced files younger than grace_seconds are kept,
+        since another process may be about to submit the job that owns them.
+        Returns how many files were removed.
+        """
+        keep, inputs, active = set(), set(), set()
+        for job_id, status, params, result_path in self._execute(
+                "SELECT id, status, params, result_path FROM jobs", fetch=True):
+            if result_path:
+                keep.add(os.path.abspath(result_path))
+            path = (json.loads(params) if params else {}).get('path')
+            if status in FINISHED:
+                if path:
+                    inputs.add(os.path.abspath(path))
+            else:
+                active.add(job_id)
+                if path:
+                    keep.add(os.path.abspath(path))
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for entry in os.scandir(self.result_dir):
+            path = os.path.abspath(entry.path)
+            if not entry.is_file() or path in keep or entry.name.split('.', 1)[0] in active:
+                continue
+            if path not in inputs and entry.stat().st_mtime > cutoff:
+                continue
+            os.remove(path)
+            removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'active': len(self._active),
+                **self._counters,
+            }
+
+
+def _process_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,383 @@
+"""
+Versioned schema migrations for the rental database.
+
+Each migration runs once and is recorded in `schema_migrations`. Steps are
+written to be idempotent, so a migration that was interrupted half way
+(MySQL DDL is not transactional) can simply be re-run.
+
+Usage:
+    python migrations.py            # apply pending migrations
+    python migrations.py status     # list applied / pending migrations
+    python migrations.py check      # EXPLAIN the hot queries, fail on full scans
+"""
+import sys
+import bcrypt
+
+MIGRATION_LOCK = 'rental_schema_migrations'
+
+
+class QueryPlanRegression(Exception):
+    """Raised when a hot query is planned as a full table scan"""
+
+
+def column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, index)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def add_column(table, column, definition):
+    def step(cursor):
+        if not column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN `{column}` {definition}")
+    return step
+
+
+def add_index(table, index, columns):
+    def step(cursor):
+        if not index_exists(cursor, table, index):
+            column_list = ', '.join(f"`{col}`" for col in columns)
+            cursor.execute(f"CREATE INDEX `{index}` ON {table} ({column_list})")
+    return step
+
+
+def seed_admin_user(cursor):
+    cursor.execute("SELECT COUNT(*) FROM USERS WHERE username = 'admin'")
+    if not cursor.fetchone()[0]:
+        hashed = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
+        cursor.execute(
+            "INSERT INTO USERS (username, password, role) VALUES (%s, %s, %s)",
+            ('admin', hashed.decode('utf-8'), 'admin')
+        )
+
+
+# (version, description, steps) - steps are SQL strings or callables taking a cursor.
+# Never edit a migration that has shipped; append a new one instead.
+MIGRATIONS = [
+    ('0001', 'create USERS table and default admin', [
+        """
+        CREATE TABLE IF NOT EXISTS USERS (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(80) UNIQUE NOT NULL,
+            password VARCHAR(120) NOT NULL,
+            role VARCHAR(20) NOT NULL DEFAULT 'user'
+        )
+        """,
+        seed_admin_user,
+    ]),
+    ('0002', 'create rentdetails table', [
+        """
+        CREATE TABLE IF NOT EXISTS rentdetails (
+            `SITE` VARCHAR(10) NOT NULL PRIMARY KEY,
+            `STORE NAME` VARCHAR(100) NOT NULL,
+            `REGION` VARCHAR(50) NOT NULL,
+            `DIV` VARCHAR(10) NOT NULL,
+            `MANAGER` VARCHAR(100) NOT NULL,
+            `ASST MANAGER` VARCHAR(100) NOT NULL,
+            `EXECUTIVE` VARCHAR(100) NOT NULL,
+            `D.O.O` DATE NOT NULL,
+            `SQ.FT` INT NOT NULL,
+            `AGREEMENT DATE` DATE NOT NULL,
+            `RENT POSITION DATE` DATE NOT NULL,
+            `RENT EFFECTIVE DATE` DATE NOT NULL,
+            `AGREEMENT VALID UPTO` DATE,
+            `CURRENT DATE` DATE,
+            `LEASE PERIOD` INT NOT NULL,
+            `RENT FREE PERIOD DAYS` INT NOT NULL,
+            `RENT EFFECTIVE AMOUNT` DOUBLE NOT NULL,
+            `PRESENT RENT` DOUBLE NOT NULL,
+            `HIKE %` DOUBLE NOT NULL,
+            `HIKE YEAR` INT NOT NULL,
+            `RENT DEPOSIT` DOUBLE NOT NULL,
+            `OWNER NAME-1` VARCHAR(100) NOT NULL,
+            `OWNER NAME-2` VARCHAR(100),
+            `OWNER NAME-3` VARCHAR(100),
+            `OWNER NAME-4` VARCHAR(100),
+            `OWNER NAME-5` VARCHAR(100),
+            `OWNER NAME-6` VARCHAR(100),
+            `OWNER MOBILE` VARCHAR(20),
+            `CURRENT DATE 1` VARCHAR(50),
+            `VALIDITY DATE` VARCHAR(50),
+            `GST NUMBER` VARCHAR(20) NOT NULL,
+            `PAN NUMBER` VARCHAR(20) NOT NULL,
+            `TDS PERCENTAGE` DOUBLE NOT NULL,
+            `MATURE` VARCHAR(3) NOT NULL,
+            `STATUS` VARCHAR(10) NOT NULL,
+            `REMARKS` TEXT
+        )
+        """,
+    ]),
+    ('0003', 'rentdetails normalized site column and hot-query indexes', [
+        # Case-insensitive site lookups hit this instead of UPPER(SITE)
+        add_column('rentdetails', 'SITE_NORM',
+                   "VARCHAR(50) GENERATED ALWAYS AS (UPPER(TRIM(`SITE`))) STORED"),
+        add_index('rentdetails', 'idx_rentdetails_site_norm', ['SITE_NORM']),
+        # Report filters: DIV + STATUS + AGREEMENT DATE range, and the DIV=ALL variants
+        add_index('rentdetails', 'idx_rentdetails_div_status_agreement',
+                  ['DIV', 'STATUS', 'AGREEMENT DATE']),
+        add_index('rentdetails', 'idx_rentdetails_status_agreement', ['STATUS', 'AGREEMENT DATE']),
+        add_index('rentdetails', 'idx_rentdetails_agreement_date', ['AGREEMENT DATE']),
+        # Equality only (GET /api/sites?region=); the '%x%' search fallback cannot use it
+        add_index('rentdetails', 'idx_rentdetails_region', ['REGION']),
+    ]),
+    ('0004', 'rentdetails keyset pagination indexes', [
+        # Filtered /api/sites pages walk these in SITE order (REGION is covered by 0003)
+        add_index('rentdetails', 'idx_rentdetails_div_site', ['DIV', 'SITE']),
+        add_index('rentdetails', 'idx_rentdetails_status_site', ['STATUS', 'SITE']),
+    ]),
+    ('0005', 'background jobs table', [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id CHAR(32) PRIMARY KEY,
+            kind VARCHAR(50) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            owner VARCHAR(80),
+            worker VARCHAR(120) NOT NULL,
+            params TEXT,
+            progress_done INT NOT NULL DEFAULT 0,
+            progress_total INT,
+            message VARCHAR(255),
+            result TEXT,
+            result_path VARCHAR(255),
+            error TEXT,
+            cancel_requested TINYINT(1) NOT NULL DEFAULT 0,
+            created_at DATETIME NOT NULL,
+            started_at DATETIME,
+            finished_at DATETIME
+        )
+        """,
+        add_index('jobs', 'idx_jobs_owner_created', ['owner', 'created_at']),
+        add_index('jobs', 'idx_jobs_status', ['status']),
+    ]),
+    ('0006', 'rentdetails change timestamp and payout runs', [
+        # Maintained by MySQL on every change; incremental payout runs recompute only sites changed since
+        add_column('rentdetails', 'UPDATED_AT',
+                   "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"),
+        add_index('rentdetails', 'idx_rentdetails_updated_at', ['UPDATED_AT']),
+        """
+        CREATE TABLE IF NOT EXISTS payout_runs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            period CHAR(7) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            created_by VARCHAR(80),
+            base_run_id INT,
+            job_id CHAR(32),
+            snapshot_at TIMESTAMP(6) NULL,
+            settings VARCHAR(255) NOT NULL,
+            site_count INT NOT NULL DEFAULT 0,
+            line_count INT NOT NULL DEFAULT 0,
+            recomputed_sites INT NOT NULL DEFAULT 0,
+            carried_sites INT NOT NULL DEFAULT 0,
+            gross_total DECIMAL(16,2) NOT NULL DEFAULT 0,
+            tds_total DECIMAL(16,2) NOT NULL DEFAULT 0,
+            gst_total DECIMAL(16,2) NOT NULL DEFAULT 0,
+            net_total DECIMAL(16,2) NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at DATETIME NOT NULL,
+            finished_at DATETIME
+        )
+        """,
+        add_index('payout_runs', 'idx_payout_runs_status_created', ['status', 'created_at']),
+        """
+        CREATE TABLE IF NOT EXISTS payout_lines (
+            run_id INT NOT NULL,
+            `site` VARCHAR(10) NOT NULL,
+            `owner_index` TINYINT NOT NULL,
+            `store_name` VARCHAR(100),
+            `div` VARCHAR(10),
+            `region` VARCHAR(50),
+            `owner_name` VARCHAR(100) NOT NULL,
+            `pan_number` VARCHAR(20),
+            `gst_number` VARCHAR(20),
+            `gst_applicable` TINYINT(1) NOT NULL,
+            `tds_percentage` DOUBLE NOT NULL,
+            `gross` DECIMAL(14,2) NOT NULL,
+            `tds` DECIMAL(14,2) NOT NULL,
+            `gst` DECIMAL(14,2) NOT NULL,
+            `net` DECIMAL(14,2) NOT NULL,
+            PRIMARY KEY (run_id, `site`, `owner_index`)
+        )
+        """,
+    ]),
+    ('0007', 'append-only change log', [
+        # One row per written site; clients sync incrementally by seq (GET /api/changes)
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+            `site` VARCHAR(10) NOT NULL,
+            operation VARCHAR(10) NOT NULL,
+            fields TEXT,
+            source VARCHAR(20) NOT NULL,
+            changed_by VARCHAR(80),
+            changed_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+        )
+        """,
+        add_index('change_log', 'idx_change_log_changed_at', ['changed_at']),
+    ]),
+]
+
+# Tables that must never be read with a full scan by a hot query
+NO_SCAN_TABLES = ('rentdetails', 'change_log')
+
+# Queries that must stay index-backed, with representative parameters.
+# The '%x%' LIKE search cannot use a B-tree index by design and is not listed.
+HOT_QUERIES = {
+    'site by id': (
+        "SELECT * FROM rentdetails WHERE SITE = %s", ['SITE001']),
+    'site by normalized id': (
+        "SELECT * FROM rentdetails WHERE SITE_NORM = UPPER(%s)", ['site001']),
+    'report by div and status': (
+        "SELECT * FROM rentdetails WHERE 1=1 AND `DIV` = %s AND `STATUS` = %s", ['D1', 'ACTIVE']),
+    'report by div, status and agreement date': (
+        "SELECT * FROM rentdetails WHERE 1=1 AND `DIV` = %s AND `STATUS` = %s "
+        "AND `AGREEMENT DATE` BETWEEN %s AND %s", ['D1', 'ACTIVE', '2020-01-01', '2020-12-31']),
+    'site page': (
+        "SELECT SITE FROM rentdetails WHERE SITE > %s ORDER BY SITE LIMIT 101", ['SITE001']),
+    'site page by div': (
+        "SELECT SITE FROM rentdetails WHERE SITE > %s AND `DIV` = %s ORDER BY SITE LIMIT 101", ['SITE001', 'D1']),
+    'site page by region': (
+        "SELECT SITE FROM rentdetails WHERE SITE > %s AND `REGION` = %s ORDER BY SITE LIMIT 101", ['SITE001', 'NORTH']),
+    'sites changed since a payout run': (
+        "SELECT SITE FROM rentdetails WHERE `STATUS` = %s AND `UPDATED_AT` >= %s",
+        ['ONLINE', '2030-01-01 00:00:00']),
+    'report by status and agreement date': (
+        "SELECT * FROM rentdetails WHERE 1=1 AND `STATUS` = %s "
+        "AND `AGREEMENT DATE` BETWEEN %s AND %s", ['ACTIVE', '2020-01-01', '2020-12-31']),
+    'changes after a cursor': (
+        "SELECT seq, site FROM change_log WHERE seq > %s ORDER BY seq LIMIT 501", [0]),
+    'settled change cursor': (
+        "SELECT MAX(seq) FROM change_log WHERE changed_at < %s", ['2030-01-01 00:00:00']),
+}
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(20) PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    ensure_migrations_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(conn):
+    """Apply every pending migration in order. Returns the versions applied."""
+    cursor = conn.cursor()
+    applied = []
+    try:
+        # Serialize concurrent workers starting up against the same database
+        cursor.execute("SELECT GET_LOCK(%s, 60)", (MIGRATION_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Could not acquire the schema migration lock")
+        try:
+            done = applied_versions(cursor)
+            for version, description, steps in MIGRATIONS:
+                if version in done:
+                    continue
+                print(f"Applying migration {version}: {description}")
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                conn.commit()
+                applied.append(version)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchall()
+        return applied
+    finally:
+        cursor.close()
+
+
+def pending_migrations(conn):
+    cursor = conn.cursor()
+    try:
+        done = applied_versions(cursor)
+        return [(version, description) for version, description, _ in MIGRATIONS if version not in done]
+    finally:
+        cursor.close()
+
+
+def check_query_plans(conn, queries=None):
+    """
+    EXPLAIN every hot query and raise QueryPlanRegression if any of them
+    reads one of NO_SCAN_TABLES with a full table scan (access type ALL).
+    Run it against a realistically sized table: on a handful of rows the
+    optimizer may legitimately prefer a scan.
+    """
+    queries = queries or HOT_QUERIES
+    cursor = conn.cursor()
+    failures = []
+    try:
+        for name, (query, params) in queries.items():
+            cursor.execute(f"EXPLAIN {query}", params)
+            columns = [col[0] for col in cursor.description]
+            for row in cursor.fetchall():
+                plan = dict(zip(columns, row))
+                if plan.get('table') in NO_SCAN_TABLES and plan.get('type') == 'ALL':
+                    failures.append(f"{name}: full table scan (possible keys: {plan.get('possible_keys')})")
+    finally:
+        cursor.close()
+
+    if failures:
+        raise QueryPlanRegression('; '.join(failures))
+    return True
+
+
+def main(argv):
+    from app import get_db_connection
+
+    command = argv[1] if len(argv) > 1 else 'migrate'
+    conn = get_db_connection()
+    if conn is None:
+        print("Database connection failed")
+        return 1
+    try:
+        if command == 'migrate':
+            applied = migrate(conn)
+            print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+        elif command == 'status':
+            pending = pending_migrations(conn)
+            for version, description, _ in MIGRATIONS:
+                state = 'pending' if (version, description) in pending else 'applied'
+                print(f"{version}  {state:8}  {description}")
+        elif command == 'check':
+            try:
+                check_query_plans(conn)
+            except QueryPlanRegression as e:
+                print(f"Query plan regression: {str(e)}")
+                return 1
+            print("All hot queries are index-backed")
+        else:
+            print(f"Unknown command: {command}")
+            return 2
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,225 @@
+"""
+Monthly payout runs.
+
+A payout run computes, for every active site, the gross rent (PRESENT
+RENT), the TDS deduction at the site's TDS PERCENTAGE and GST on the rent
+when the site has a valid GSTIN, and splits each amount across the named
+owners (OWNER NAME-1..6). Runs and their lines are stored in payout_runs
+and payout_lines (migration 0006).
+
+Amounts are computed with NumPy a batch of sites at a time, in integer
+paise, so owner shares always add up to the site totals: each owner gets
+an equal share and the first owner also takes the remainder.
+
+An incremental run starts from an earlier completed run with the same
+settings: lines of sites whose rentdetails row has not changed since that
+run's snapshot (UPDATED_AT) are copied over in SQL, and only the changed
+or new sites are recomputed.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+OWNER_COLUMNS = tuple(f'OWNER NAME-{i}' for i in range(1, 7))
+
+# Columns compute_lines() expects, in this order
+PAYOUT_COLUMNS = (
+    'SITE', 'STORE NAME', 'DIV', 'REGION', 'PRESENT RENT', 'TDS PERCENTAGE', 'GST NUMBER', 'PAN NUMBER',
+) + OWNER_COLUMNS
+
+# payout_lines columns after run_id, in the order compute_lines() returns them
+LINE_COLUMNS = (
+    'site', 'store_name', 'div', 'region', 'owner_index', 'owner_name', 'pan_number', 'gst_number',
+    'gst_applicable', 'tds_percentage', 'gross', 'tds', 'gst', 'net',
+)
+AMOUNT_COLUMNS = ('gross', 'tds', 'gst', 'net')
+
+RUN_COLUMNS = (
+    'id', 'period', 'status', 'created_by', 'base_run_id', 'job_id', 'snapshot_at', 'settings',
+    'site_count', 'line_count', 'recomputed_sites', 'carried_sites',
+    'gross_total', 'tds_total', 'gst_total', 'net_total', 'error', 'created_at', 'finished_at',
+)
+
+# 15-character GSTIN: state code, PAN, entity number, 'Z', check character
+GSTIN_PATTERN = r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][1-9A-Z]Z[0-9A-Z]$'
+
+
+def quote(column):
+    return f"`{column}`"
+
+
+def settings_key(settings):
+    """Settings as stored on the run; runs can only build on runs with the same key"""
+    return json.dumps(settings, sort_keys=True)
+
+
+def gst_registered(values):
+    """Boolean array: which GST NUMBER values are well-formed GSTINs"""
+    cleaned = pd.Series(values, dtype=object).fillna('').astype(str).str.strip().str.upper()
+    return cleaned.str.match(GSTIN_PATTERN).to_numpy(dtype=bool)
+
+
+def _numbers(values):
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+
+def _paise(values):
+    return Decimal(int(values)).scaleb(-2)
+
+
+def compute_lines(rows, gst_rate):
+    """
+    Payout lines for rows of PAYOUT_COLUMNS, as tuples in LINE_COLUMNS
+    order. A site without any owner name gets a single line with an empty
+    owner.
+    """
+    if not rows:
+        return []
+    frame = pd.DataFrame.from_records(rows, columns=PAYOUT_COLUMNS)
+
+    gross = np.round(_numbers(frame['PRESENT RENT']) * 100).astype(np.int64)
+    tds_rate = _numbers(frame['TDS PERCENTAGE'])
+    gst_applicable = gst_registered(frame['GST NUMBER'])
+    tds = np.round(gross * tds_rate / 100).astype(np.int64)
+    gst = np.where(gst_applicable, np.round(gross * gst_rate / 100), 0).astype(np.int64)
+    net = gross + gst - tds
+
+    owners = frame[list(OWNER_COLUMNS)].fillna('').astype(str).apply(lambda column: column.str.strip())
+    named = (owners != '').to_numpy()
+    named[~named.any(axis=1), 0] = True
+    counts = named.sum(axis=1)
+    first_owner = named.argmax(axis=1)
+
+    site_pos, slot = np.nonzero(named)
+    takes_remainder = slot == first_owner[site_pos]
+    shares = []
+    for amount in (gross, tds, gst, net):
+        share = amount[site_pos] // counts[site_pos]
+        shares.append(share + np.where(takes_remainder, amount[site_pos] % counts[site_pos], 0))
+
+    sites = frame['SITE'].tolist()
+    stores = frame['STORE NAME'].tolist()
+    divs = frame['DIV'].tolist()
+    regions = frame['REGION'].tolist()
+    pans = frame['PAN NUMBER'].tolist()
+    gstins = frame['GST NUMBER'].tolist()
+    owner_names = owners.to_numpy()
+    lines = []
+    for i, (pos, owner_slot) in enumerate(zip(site_pos.tolist(), slot.tolist())):
+        lines.append((
+            sites[pos], stores[pos], divs[pos], regions[pos], owner_slot + 1, owner_names[pos, owner_slot],
+            pans[pos], gstins[pos], bool(gst_applicable[pos]), float(tds_rate[pos]),
+            *(_paise(share[i]) for share in shares),
+        ))
+    return lines
+
+
+def line_records(rows):
+    """payout_lines rows (LINE_COLUMNS) as dicts with float amounts"""
+    records = []
+    for row in rows:
+        record = dict(zip(LINE_COLUMNS, row))
+        for column in AMOUNT_COLUMNS:
+            record[column] = float(record[column])
+        record['gst_applicable'] = bool(record['gst_applicable'])
+        records.append(record)
+    return records
+
+
+def iter_lines(cursor, batch_size):
+    """Line records of an executed payout_lines query, one fetchmany batch at a time"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield line_records(rows)
+
+
+def run_record(row):
+    """payout_runs row as a JSON-ready dict"""
+    run = dict(zip(RUN_COLUMNS, row))
+    for column in ('gross_total', 'tds_total', 'gst_total', 'net_total'):
+        run[column] = float(run[column] or 0)
+    for column in ('snapshot_at', 'created_at', 'finished_at'):
+        if isinstance(run[column], datetime):
+            run[column] = run[column].isoformat()
+    run['settings'] = json.loads(run['settings']) if run['settings'] else None
+    return run
+
+
+def execute_run(conn, run_id, settings, base=None, batch_size=2000, progress=None):
+    """
+    Fill payout_lines for run `run_id` and store its totals.
+    `base` is (run_id, snapshot_at) of the run to build on, or None for a
+    full run. progress(done, total) is called after each batch.
+    Returns (recomputed_sites, carried_sites).
+    """
+    active_status = settings['active_status']
+    cursor = conn.cursor()
+    try:
+        # The DB clock, so the snapshot compares exactly with UPDATED_AT
+        cursor.execute("SELECT NOW(6)")
+        snapshot_at = cursor.fetchone()[0]
+        cursor.execute("UPDATE payout_runs SET snapshot_at = %s WHERE id = %s", (snapshot_at, run_id))
+
+        carried = 0
+        where = "WHERE `STATUS` = %s"
+        params = [active_status]
+        if base is not None:
+            base_id, base_snapshot = base
+            columns = ', '.join(quote(column) for column in LINE_COLUMNS)
+            cursor.execute(
+                f"INSERT INTO payout_lines (run_id, {columns}) "
+                f"SELECT %s, {', '.join('l.' + quote(column) for column in LINE_COLUMNS)} "
+                "FROM payout_lines l JOIN rentdetails r ON r.`SITE` = l.`site` "
+                "WHERE l.run_id = %s AND r.`STATUS` = %s AND r.`UPDATED_AT` < %s",
+                (run_id, base_id, active_status, base_snapshot)
+            )
+            cursor.execute("SELECT COUNT(DISTINCT `site`) FROM payout_lines WHERE run_id = %s", (run_id,))
+            carried = cursor.fetchone()[0]
+            where += " AND `UPDATED_AT` >= %s"
+            params.append(base_snapshot)
+        conn.commit()
+
+        cursor.execute(f"SELECT {', '.join(quote(column) for column in PAYOUT_COLUMNS)} FROM rentdetails {where}",
+                       params)
+        rows = cursor.fetchall()
+        total = len(rows)
+
+        insert = (
+            f"INSERT INTO payout_lines (run_id, {', '.join(quote(column) for column in LINE_COLUMNS)}) "
+            f"VALUES ({', '.join(['%s'] * (len(LINE_COLUMNS) + 1))})"
+        )
+        recomputed = 0
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            lines = compute_lines(batch, settings['gst_rate'])
+            cursor.executemany(insert, [(run_id, *line) for line in lines])
+            conn.commit()
+            recomputed += len(batch)
+            if progress:
+                progress(recomputed, total)
+
+        cursor.execute(
+            "SELECT COUNT(DISTINCT `site`), COUNT(*), COALESCE(SUM(gross), 0), COALESCE(SUM(tds), 0), "
+            "COALESCE(SUM(gst), 0), COALESCE(SUM(net), 0) FROM payout_lines WHERE run_id = %s",
+            (run_id,)
+        )
+        site_count, line_count, gross_total, tds_total, gst_total, net_total = cursor.fetchone()
+        cursor.execute(
+            "UPDATE payout_runs SET status = %s, site_count = %s, line_count = %s, recomputed_sites = %s, "
+            "carried_sites = %s, gross_total = %s, tds_total = %s, gst_total = %s, net_total = %s, "
+            "finished_at = NOW() WHERE id = %s",
+            (COMPLETED, site_count, line_count, recomputed, carried,
+             gross_total, tds_total, gst_total, net_total, run_id)
+        )
+        conn.commit()
+        return recomputed, carried
+    finally:
+        cursor.close()
@@ -0,0 +1,237 @@
+"""
+Rent escalation and cash-flow projection.
+
+project_rents() computes the month-by-month rent schedule of every site
+in the portfolio over a horizon of whole months and rolls it up by DIV
+and/or REGION. Sites are processed in chunks, each as one (sites x months)
+NumPy array, so the cost per site is a handful of array operations rather
+than a Python loop over months.
+
+Schedule rules, per site:
+- Rent starts on the later of RENT EFFECTIVE DATE and RENT POSITION DATE
+  plus RENT FREE PERIOD DAYS (whichever of the two is known). Sites with
+  neither are skipped and counted.
+- Rent ends on AGREEMENT VALID UPTO (inclusive), else AGREEMENT DATE plus
+  LEASE PERIOD years; with neither it runs through the horizon.
+- The starting rent is RENT EFFECTIVE AMOUNT (PRESENT RENT if that is 0),
+  compounded by HIKE % every HIKE YEAR years counted from the rent start.
+  A month is charged at the rent in effect on its first billable day.
+- Partial months are prorated by the number of billable days.
+"""
+from collections import namedtuple
+from datetime import date
+import numpy as np
+import pandas as pd
+
+PROJECTION_REPORT = 'RENT PROJECTION REPORT'
+
+# Parameter name -> rentdetails column
+PROJECTION_DIMENSIONS = {
+    'div': 'DIV',
+    'region': 'REGION',
+}
+DEFAULT_GROUP_BY = ('div',)
+DEFAULT_MONTHS = 120
+MAX_MONTHS = 360
+CHUNK_SIZE = 5000
+
+COUNT_KEY = 'site_count'
+TOTAL_KEY = 'total'
+
+# Columns project_rents() expects, in this order
+PROJECTION_COLUMNS = (
+    'DIV', 'REGION', 'RENT POSITION DATE', 'RENT FREE PERIOD DAYS', 'RENT EFFECTIVE DATE',
+    'RENT EFFECTIVE AMOUNT', 'PRESENT RENT', 'HIKE %', 'HIKE YEAR', 'AGREEMENT DATE',
+    'LEASE PERIOD', 'AGREEMENT VALID UPTO',
+)
+
+# start is the first projected month as 'YYYY-MM'
+ProjectionSpec = namedtuple('ProjectionSpec', ['group_by', 'start', 'months'])
+
+Projection = namedtuple('Projection', ['months', 'groups', 'total', 'site_count', 'skipped'])
+
+
+def is_projection_report(report_type):
+    return report_type == PROJECTION_REPORT
+
+
+def parse_projection_spec(group_by=None, start=None, months=None, today=None):
+    """
+    ProjectionSpec from request parameters: group_by ("div", "region" or
+    "div,region"; "none" for the portfolio total only), start ("YYYY-MM",
+    default the current month) and months (horizon length).
+    Raises ValueError for anything invalid.
+    """
+    if group_by is None or group_by == '':
+        dimensions = DEFAULT_GROUP_BY
+    elif group_by.strip().lower() == 'none':
+        dimensions = ()
+    else:
+        dimensions = tuple(part.strip().lower() for part in group_by.split(',') if part.strip())
+    for dimension in dimensions:
+        if dimension not in PROJECTION_DIMENSIONS:
+            raise ValueError(
+                f"Cannot group a projection by '{dimension}'; choose from {', '.join(PROJECTION_DIMENSIONS)}"
+            )
+    if len(set(dimensions)) != len(dimensions):
+        raise ValueError('Duplicate group_by dimension')
+
+    if start:
+        try:
+            start = str(np.datetime64(start, 'M'))
+        except ValueError:
+            raise ValueError(f"Invalid start month '{start}'; use YYYY-MM")
+    else:
+        start = str(np.datetime64(today or date.today(), 'M'))
+
+    try:
+        months = int(months) if months not in (None, '') else DEFAULT_MONTHS
+    except (TypeError, ValueError):
+        raise ValueError('months must be an integer')
+    if not 1 <= months <= MAX_MONTHS:
+        raise ValueError(f'months must be between 1 and {MAX_MONTHS}')
+    return ProjectionSpec(dimensions, start, months)
+
+
+def build_projection_query(where):
+    """Query for the projection inputs; `where` is the report filter clause"""
+    columns = ', '.join(f"`{column}`" for column in PROJECTION_COLUMNS)
+    return f"SELECT {columns} FROM rentdetails{where}"
+
+
+def month_labels(spec):
+    first = np.datetime64(spec.start, 'M')
+    return [str(month) for month in first + np.arange(spec.months)]
+
+
+def _dates(values):
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format='mixed')
+    return parsed.to_numpy().astype('datetime64[D]')
+
+
+def _numbers(values):
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+
+def _add_years(days, years):
+    """Add whole years to datetime64[D] values, clamping 29 February"""
+    months = days.astype('datetime64[M]')
+    offset = days - months.astype('datetime64[D]')
+    target = months + (years * 12).astype('timedelta64[M]')
+    last_day = (target + 1).astype('datetime64[D]') - np.timedelta64(1, 'D')
+    return np.minimum(target.astype('datetime64[D]') + offset, last_day)
+
+
+def _schedule(frame, month_index, month_start, month_end, month_days):
+    """(sites x months) rent matrix for one chunk, and the mask of projectable sites"""
+    position = _dates(frame['RENT POSITION DATE'])
+    rent_free = _numbers(frame['RENT FREE PERIOD DAYS']).astype(np.int64).astype('timedelta64[D]')
+    free_until = position + rent_free
+    effective = _dates(frame['RENT EFFECTIVE DATE'])
+    start = np.where(np.isnat(effective), free_until,
+                     np.where(np.isnat(free_until), effective, np.maximum(effective, free_until)))
+
+    lease_years = _numbers(frame['LEASE PERIOD']).astype(np.int64)
+    lease_end = _add_years(_dates(frame['AGREEMENT DATE']), lease_years)
+    lease_end = np.where(lease_years > 0, lease_end, np.datetime64('NaT', 'D'))
+    valid_upto = _dates(frame['AGREEMENT VALID UPTO'])
+    end = np.where(np.isnat(valid_upto), lease_end, valid_upto)
+    # Open-ended leases run through the horizon
+    end = np.where(np.isnat(end), month_end[-1], end)
+
+    known = ~np.isnat(start)
+    start = start[known]
+    end = end[known]
+
+    amount = _numbers(frame['RENT EFFECTIVE AMOUNT'])
+    amount = np.where(amount > 0, amount, _numbers(frame['PRESENT RENT']))[known]
+    hike = _numbers(frame['HIKE %'])[known]
+    hike_every = _numbers(frame['HIKE YEAR']).astype(np.int64)[known]
+
+    # Billable days of each month: [max(start, month start), min(end, month end)]
+    first_day = np.maximum(start[:, None], month_start[None, :])
+    last_day = np.minimum(end[:, None], month_end[None, :])
+    billed = (last_day - first_day).astype(np.int64) + 1
+    billed = np.maximum(billed, 0)
+
+    # Completed years since the rent start, as of each month's first billable day.
+    # That day is the 1st of the month except in the starting month, so whole
+    # months elapsed follow from month indexes without per-cell date arithmetic.
+    start_month = start.astype('datetime64[M]').astype(np.int64)
+    late_start = (start - start.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64) > 0
+    elapsed = month_index[None, :] - start_month[:, None] - late_start[:, None]
+    years = np.maximum(elapsed, 0) // 12
+    steps = np.where(hike_every[:, None] > 0, years // np.maximum(hike_every, 1)[:, None], 0)
+    rent = amount[:, None] * np.power(1 + hike[:, None] / 100.0, steps)
+    return rent * billed / month_days[None, :], known
+
+
+def project_rents(rows, spec, chunk_size=CHUNK_SIZE):
+    """
+    Projection for rows of PROJECTION_COLUMNS: per-group schedules (one
+    value per month of the horizon) and the portfolio total.
+    """
+    first = np.datetime64(spec.start, 'M')
+    months = first + np.arange(spec.months)
+    month_start = months.astype('datetime64[D]')
+    month_end = (months + 1).astype('datetime64[D]') - np.timedelta64(1, 'D')
+    month_days = (month_end - month_start).astype(np.int64) + 1
+
+    columns = [PROJECTION_DIMENSIONS[dimension] for dimension in spec.group_by]
+    groups = {}
+    total = np.zeros(spec.months)
+    site_count = 0
+    skipped = 0
+
+    for offset in range(0, len(rows), chunk_size):
+        frame = pd.DataFrame.from_records(rows[offset:offset + chunk_size], columns=PROJECTION_COLUMNS)
+        schedule, known = _schedule(frame, months.astype(np.int64), month_start, month_end, month_days)
+        skipped += int((~known).sum())
+        site_count += len(schedule)
+        total += schedule.sum(axis=0)
+        if not columns or not len(schedule):
+            continue
+
+        keys = frame.loc[known, columns].fillna('').astype(str).reset_index(drop=True)
+        data = pd.DataFrame(schedule)
+        data[COUNT_KEY] = 1
+        sums = data.groupby([keys[column] for column in columns]).sum()
+        for key, values in zip(sums.index, sums.to_numpy()):
+            key = key if isinstance(key, tuple) else (key,)
+            count, running = groups.get(key, (0, 0.0))
+            groups[key] = (count + int(values[-1]), running + values[:-1])
+
+    ordered = [(key, *groups[key]) for key in sorted(groups)]
+    return Projection(month_labels(spec), ordered, total, site_count, skipped)
+
+
+def projection_output_keys(spec):
+    return spec.group_by + (COUNT_KEY, TOTAL_KEY) + tuple(month_labels(spec))
+
+
+def projection_records(spec, projection):
+    """One record per group: its dimensions, site count, horizon total and a column per month"""
+    records = []
+    for key, count, schedule in projection.groups:
+        record = dict(zip(spec.group_by, key))
+        record.update(_amounts(count, schedule, projection.months))
+        records.append(record)
+    return records
+
+
+def projection_document(spec, projection):
+    return {
+        'data': projection_records(spec, projection),
+        'group_by': list(spec.group_by),
+        'start': spec.start,
+        'months': projection.months,
+        'total': _amounts(projection.site_count, projection.total, projection.months),
+        'skipped_sites': projection.skipped,
+    }
+
+
+def _amounts(count, schedule, labels):
+    values = np.round(schedule, 2).tolist()
+    amounts = {COUNT_KEY: count, TOTAL_KEY: round(float(schedule.sum()), 2)}
+    amounts.update(zip(labels, values))
+    return amounts
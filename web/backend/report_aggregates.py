@@ -0,0 +1,124 @@
+"""
+Aggregate report types.
+
+Summaries are pushed down to MySQL as one GROUP BY over the report filters,
+so only a row per group crosses the wire. Dimensions, measures and functions
+are whitelisted: request parameters select from them and never reach the
+SQL text.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+# Parameter name -> rentdetails column
+DIMENSIONS = {
+    'div': 'DIV',
+    'region': 'REGION',
+    'status': 'STATUS',
+    'manager': 'MANAGER',
+    'mature': 'MATURE',
+}
+MEASURES = {
+    'present_rent': 'PRESENT RENT',
+    'rent_effective_amount': 'RENT EFFECTIVE AMOUNT',
+    'rent_deposit': 'RENT DEPOSIT',
+    'sqft': 'SQ.FT',
+}
+FUNCTIONS = ('sum', 'avg', 'min', 'max')
+
+# Every aggregate row carries the number of sites in its group
+COUNT_KEY = 'site_count'
+
+# Free-form summary: ?group_by=div,region&metrics=sum:present_rent,avg:sqft
+CUSTOM_REPORT = 'SUMMARY REPORT'
+
+# Preset report types: (group_by, metrics)
+PRESETS = {
+    'RENT BY DIV REPORT': (
+        ('div',), ('sum:present_rent', 'avg:present_rent', 'min:present_rent', 'max:present_rent')),
+    'DEPOSIT BY REGION REPORT': (('region',), ('sum:rent_deposit', 'avg:rent_deposit')),
+    'SQFT BY STATUS REPORT': (('status',), ('sum:sqft', 'avg:sqft')),
+    'MATURE SITES REPORT': (('mature',), ()),
+}
+
+AggregateSpec = namedtuple('AggregateSpec', ['group_by', 'metrics'])
+
+
+def is_aggregate_report(report_type):
+    return report_type == CUSTOM_REPORT or report_type in PRESETS
+
+
+def _split(value):
+    return [part.strip().lower() for part in value.split(',') if part.strip()] if value else []
+
+
+def parse_aggregate_spec(report_type, group_by=None, metrics=None):
+    """
+    AggregateSpec for a report type; the custom report takes group_by and
+    metrics ("function:measure", comma-separated) from the request.
+    Raises ValueError for anything outside the whitelists.
+    """
+    if report_type in PRESETS:
+        dimensions, metric_names = PRESETS[report_type]
+    else:
+        dimensions = _split(group_by)
+        metric_names = _split(metrics) or [f'sum:{measure}' for measure in MEASURES]
+
+    for dimension in dimensions:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Cannot group by '{dimension}'; choose from {', '.join(DIMENSIONS)}")
+    if len(set(dimensions)) != len(dimensions):
+        raise ValueError('Duplicate group_by dimension')
+
+    parsed = []
+    for name in metric_names:
+        function, _, measure = name.partition(':')
+        if function not in FUNCTIONS or measure not in MEASURES:
+            raise ValueError(
+                f"Invalid metric '{name}'; use function:measure with function in {', '.join(FUNCTIONS)} "
+                f"and measure in {', '.join(MEASURES)}"
+            )
+        if (function, measure) not in parsed:
+            parsed.append((function, measure))
+    return AggregateSpec(tuple(dimensions), tuple(parsed))
+
+
+def metric_key(function, measure):
+    return f'{function}_{measure}'
+
+
+def aggregate_output_keys(spec):
+    return spec.group_by + (COUNT_KEY,) + tuple(metric_key(*metric) for metric in spec.metrics)
+
+
+def build_aggregate_query(spec, where):
+    """GROUP BY query over rentdetails; `where` is the report filter clause"""
+    dimensions = ', '.join(f"`{DIMENSIONS[dimension]}`" for dimension in spec.group_by)
+    select = [f"`{DIMENSIONS[dimension]}` AS `{dimension}`" for dimension in spec.group_by]
+    select.append(f"COUNT(*) AS `{COUNT_KEY}`")
+    select.extend(
+        f"{function.upper()}(`{MEASURES[measure]}`) AS `{metric_key(function, measure)}`"
+        for function, measure in spec.metrics
+    )
+    query = f"SELECT {', '.join(select)} FROM rentdetails{where}"
+    if dimensions:
+        query += f" GROUP BY {dimensions} ORDER BY {dimensions}"
+    return query
+
+
+def decode_aggregate_rows(spec, rows):
+    """Aggregate rows as dicts; DECIMAL sums/averages become floats, averages rounded to 2 places"""
+    keys = aggregate_output_keys(spec)
+    rounded = {metric_key(function, measure) for function, measure in spec.metrics if function == 'avg'}
+    records = []
+    for row in rows:
+        record = {}
+        for key, value in zip(keys, row):
+            if isinstance(value, Decimal):
+                value = float(value)
+            if value is None:
+                value = '' if key in spec.group_by else 0
+            elif key in rounded:
+                value = round(value, 2)
+            record[key] = value
+        records.append(record)
+    return records
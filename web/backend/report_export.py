@@ -0,0 +1,247 @@
+"""
+Server-side report exports.
+
+CSV is encoded a decoded batch at a time, so it can be streamed straight
+from the cursor. XLSX is streamed the same way: the sheet XML is written
+a batch at a time into a zip archive on a non-seekable stream (sizes and
+CRCs go in data descriptors after each member), and whatever the
+compressor has produced is sent after every batch. The workbook is the
+minimal package Excel, LibreOffice and openpyxl open: one sheet with
+inline strings, and one style for dates.
+"""
+import csv
+import io
+import math
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+# Text cells starting with these are evaluated as formulas by spreadsheet apps
+FORMULA_PREFIXES = ('=', '+', '-', '@')
+
+
+def header_labels(keys):
+    """Column titles as the reports table shows them"""
+    return [key.replace('_', ' ').upper() for key in keys]
+
+
+def safe_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_records(cursor, decoder, batch_size, today):
+    """Decoded records, one fetchmany batch at a time"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield decoder.decode_many(rows, today)
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def csv_header(keys):
+    # The BOM lets Excel detect UTF-8
+    return '\ufeff' + _csv_lines([header_labels(keys)])
+
+
+def csv_rows(records, keys):
+    return _csv_lines([safe_cell(record[key]) for key in keys] for record in records)
+
+
+def text_chunks(response_format, batches, keys, dumps):
+    """
+    Encode decoded batches as text: 'ndjson' (a record per line), 'stream'
+    (a {"data": [...]} document) or 'csv'. One chunk per batch.
+    """
+    if response_format == 'stream':
+        yield '{"data": ['
+    elif response_format == 'csv':
+        yield csv_header(keys)
+    first = True
+    for records in batches:
+        if not records:
+            continue
+        if response_format == 'ndjson':
+            yield ''.join(dumps(record) + '\n' for record in records)
+        elif response_format == 'csv':
+            yield csv_rows(records, keys)
+        else:
+            yield ('' if first else ', ') + ', '.join(dumps(record) for record in records)
+        first = False
+    if response_format == 'stream':
+        yield ']}'
+
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '<Relationship Id="rId2" Target="styles.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+    '</Relationships>'
+)
+# Style 0 is the default, 1 a date (built-in format 14), 2 a date and time (22)
+XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+# Characters XML 1.0 does not allow at all; they are dropped from cells
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+# Spreadsheet day 0 in the 1900 date system, as Excel counts it
+_EPOCH = datetime(1899, 12, 30)
+# Sheet names cannot contain these
+_SHEET_NAME_ILLEGAL = re.compile(r'[\\/*?:\[\]]')
+
+
+def column_letters(count):
+    letters = []
+    for index in range(1, count + 1):
+        name = ''
+        while index:
+            index, remainder = divmod(index - 1, 26)
+            name = chr(65 + remainder) + name
+        letters.append(name)
+    return letters
+
+
+def _text_cell(ref, value):
+    if _ILLEGAL_XML.search(value):
+        value = _ILLEGAL_XML.sub('', value)
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+
+
+def xlsx_cell(ref, value):
+    """One <c> element, or '' for an empty cell"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return _text_cell(ref, value) if value else ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return _text_cell(ref, str(value))
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        serial = (value.replace(tzinfo=None) - _EPOCH).total_seconds() / 86400
+        return f'<c r="{ref}" s="2"><v>{serial!r}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="1"><v>{(value - _EPOCH.date()).days}</v></c>'
+    return _text_cell(ref, str(value))
+
+
+def xlsx_rows(rows, letters, first_row):
+    """Sheet XML for rows of cell values, numbered from first_row"""
+    parts = []
+    for number, row in enumerate(rows, first_row):
+        cells = ''.join(xlsx_cell(f'{letter}{number}', value) for letter, value in zip(letters, row))
+        parts.append(f'<row r="{number}">{cells}</row>')
+    return ''.join(parts)
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that collects what the zip writer produces"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def xlsx_chunks(batches, keys, title='Report', compresslevel=1):
+    """
+    Encode decoded batches as an .xlsx workbook, yielding bytes as each
+    batch has been written. Memory is bounded by one batch.
+    """
+    title = _SHEET_NAME_ILLEGAL.sub(' ', title)[:31] or 'Sheet1'
+    letters = column_letters(len(keys))
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(title=escape(title, {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', XLSX_STYLES)
+        # force_zip64: the sheet's size is not known up front and may pass 4 GiB
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((XLSX_SHEET_START + xlsx_rows([header_labels(keys)], letters, 1)).encode('utf-8'))
+            next_row = 2
+            for records in batches:
+                if not records:
+                    continue
+                rows = [[safe_cell(record[key]) for key in keys] for record in records]
+                sheet.write(xlsx_rows(rows, letters, next_row).encode('utf-8'))
+                next_row += len(rows)
+                chunk = sink.take()
+                if chunk:
+                    yield chunk
+            sheet.write(XLSX_SHEET_END.encode('utf-8'))
+    yield sink.take()
+
+
+def write_xlsx(batches, keys, fileobj, title='Report'):
+    """Write decoded batches as an .xlsx workbook to a binary file object"""
+    for chunk in xlsx_chunks(batches, keys, title):
+        fileobj.write(chunk)
@@ -0,0 +1,172 @@
+"""
+In-process LRU + TTL caches of serialized JSON responses.
+
+ResponseCache holds bodies with a strong ETag (SHA-1 of the body), bounded
+by entry count and optionally by total body size. Entries also expire at
+midnight because tenure fields in the bodies are relative to today.
+
+Writers call invalidate() or clear(), which bump a generation; a reader
+that started its query before that passes the generation it saw to put(),
+and the stale result is dropped instead of being cached.
+
+SiteCache and ReportCache only add how their keys are built.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+
+class CachedResponse:
+    __slots__ = ('body', 'etag', 'expires', 'day')
+
+    def __init__(self, body, etag, expires, day):
+        self.body = body
+        self.etag = etag
+        self.expires = expires
+        self.day = day
+
+
+class ResponseCache:
+    """LRU + TTL cache of serialized bodies; see the module docstring"""
+
+    def __init__(self, max_entries, ttl, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+                          'invalidations': 0, 'stale_puts': 0, 'oversized': 0}
+
+    def normalize(self, key):
+        """The key entries are stored under"""
+        return key
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def get(self, key):
+        key = self.normalize(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.expires < time.monotonic() or entry.day != date.today()):
+                self._drop(key)
+                self._counters['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry
+
+    def put(self, key, body, generation=None):
+        """Cache a serialized body; returns the entry (cached or not) with its ETag"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        entry = CachedResponse(body, hashlib.sha1(body).hexdigest(), time.monotonic() + self.ttl, date.today())
+        key = self.normalize(key)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self._counters['stale_puts'] += 1
+                return entry
+            if self.max_bytes is not None and len(body) > self.max_bytes:
+                self._counters['oversized'] += 1
+                return entry
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None
+                                                            and self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+        return entry
+
+    def invalidate(self, keys):
+        """Drop these entries and any result computed before now"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                key = self.normalize(key)
+                if key in self._entries:
+                    self._drop(key)
+                    self._counters['invalidations'] += 1
+
+    def clear(self):
+        """Drop every entry and any result computed before now"""
+        with self._lock:
+            self._generation += 1
+            self._counters['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'generation': self._generation,
+                'hit_ratio': round(self._counters['hits'] / lookups, 4) if lookups else 0.0,
+                **self._counters,
+            }
+
+
+class SiteCache(ResponseCache):
+    """Single-site responses, keyed by normalized site ID"""
+
+    def __init__(self, max_entries=5000, ttl=300):
+        super().__init__(max_entries, ttl)
+
+    def normalize(self, key):
+        return str(key).strip().upper()
+
+
+class ReportCache(ResponseCache):
+    """
+    Report responses, keyed by the normalized report filters.
+
+    Any write to rentdetails can change any report, so instead of tracking
+    which reports a site appears in, writers bump() the generation, which
+    drops every entry.
+    """
+
+    def __init__(self, max_entries=200, max_bytes=64 * 2**20, ttl=600):
+        super().__init__(max_entries, ttl, max_bytes)
+
+    @staticmethod
+    def key(report_type, div=None, status=None, from_date=None, to_date=None, spec=None):
+        """
+        Normalized filter tuple. Mirrors report_filters(): 'ALL' or an empty
+        value means no filter, and the date range only applies when both ends
+        are given. Aggregate and projection reports are keyed by their parsed
+        spec, so a preset and the equivalent SUMMARY REPORT share an entry.
+        """
+        def choice(value):
+            return None if not value or value == 'ALL' else value.upper()
+
+        def day(value):
+            try:
+                return date.fromisoformat(value).isoformat()
+            except ValueError:
+                return value
+
+        dates = (day(from_date), day(to_date)) if from_date and to_date else None
+        return (spec if spec is not None else report_type, choice(div), choice(status), dates)
+
+    def bump(self):
+        """Record a data change: every cached report is dropped"""
+        self.clear()
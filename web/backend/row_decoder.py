@@ -0,0 +1,240 @@
+"""
+Row decoders for rentdetails result sets.
+
+A decoder is compiled once per (column layout, output layout) pair and
+cached, so turning a row into an output dict is a single itemgetter call
+plus the handful of converters the layout actually needs.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from operator import itemgetter
+from tenure import tenure_strings, SINCE, UNTIL
+
+# Field kinds
+RAW = 'raw'          # value as returned by MySQL
+DATE = 'date'        # formatted as YYYY-MM-DD
+NOT_NULL = 'notnull'  # NULL replaced by the default
+
+
+def format_date(date_value):
+    """Format a date value as a string"""
+    if not date_value:
+        return ""
+    try:
+        if type(date_value) is date:
+            return date_value.isoformat()
+        if isinstance(date_value, str):
+            return date_value
+        return date_value.strftime('%Y-%m-%d')
+    except Exception as e:
+        print(f"Error formatting date {date_value}: {str(e)}")
+        return str(date_value) if date_value else ""
+
+
+# (output keys, source column, kind, default)
+# The first key is the MySQL column name, any further keys are legacy aliases.
+SITE_DETAIL_FIELDS = [
+    (('SITE', 'site_id', 'site'), 'SITE', RAW, ''),
+    (('STORE NAME', 'store_name'), 'STORE NAME', RAW, ''),
+    (('REGION', 'region'), 'REGION', RAW, ''),
+    (('DIV', 'div'), 'DIV', RAW, ''),
+    (('MANAGER', 'manager'), 'MANAGER', RAW, ''),
+    (('ASST MANAGER', 'asst_manager'), 'ASST MANAGER', RAW, ''),
+    (('EXECUTIVE', 'executive'), 'EXECUTIVE', RAW, ''),
+    (('D.O.O', 'doo'), 'D.O.O', DATE, ''),
+    (('SQ.FT', 'sqft'), 'SQ.FT', RAW, 0),
+    (('AGREEMENT DATE', 'agreement_date'), 'AGREEMENT DATE', DATE, ''),
+    (('RENT POSITION DATE', 'rent_position_date'), 'RENT POSITION DATE', DATE, ''),
+    (('RENT EFFECTIVE DATE', 'rent_effective_date'), 'RENT EFFECTIVE DATE', DATE, ''),
+    (('AGREEMENT VALID UPTO', 'agreement_valid_upto'), 'AGREEMENT VALID UPTO', DATE, ''),
+    (('CURRENT DATE', 'current_date'), 'CURRENT DATE', DATE, ''),
+    (('LEASE PERIOD', 'lease_period'), 'LEASE PERIOD', RAW, 0),
+    (('RENT FREE PERIOD DAYS', 'rent_free_period_days'), 'RENT FREE PERIOD DAYS', RAW, 0),
+    (('RENT EFFECTIVE AMOUNT', 'rent_effective_amount'), 'RENT EFFECTIVE AMOUNT', RAW, 0),
+    (('PRESENT RENT', 'present_rent'), 'PRESENT RENT', RAW, 0),
+    (('HIKE %', 'hike_percentage'), 'HIKE %', RAW, 0),
+    (('HIKE YEAR', 'hike_year'), 'HIKE YEAR', RAW, 0),
+    (('RENT DEPOSIT', 'rent_deposit'), 'RENT DEPOSIT', RAW, 0),
+    (('OWNER NAME-1', 'owner_name1'), 'OWNER NAME-1', RAW, ''),
+    (('OWNER NAME-2', 'owner_name2'), 'OWNER NAME-2', RAW, ''),
+    (('OWNER NAME-3', 'owner_name3'), 'OWNER NAME-3', RAW, ''),
+    (('OWNER NAME-4', 'owner_name4'), 'OWNER NAME-4', RAW, ''),
+    (('OWNER NAME-5', 'owner_name5'), 'OWNER NAME-5', RAW, ''),
+    (('OWNER NAME-6', 'owner_name6'), 'OWNER NAME-6', RAW, ''),
+    (('OWNER MOBILE', 'owner_mobile'), 'OWNER MOBILE', RAW, ''),
+    (('CURRENT DATE 1', 'current_date1'), 'CURRENT DATE 1', DATE, ''),
+    (('VALIDITY DATE', 'validity_date'), 'VALIDITY DATE', DATE, ''),
+    (('GST NUMBER', 'gst_number'), 'GST NUMBER', NOT_NULL, ''),
+    (('PAN NUMBER', 'pan_number'), 'PAN NUMBER', NOT_NULL, ''),
+    (('TDS PERCENTAGE', 'tds_percentage'), 'TDS PERCENTAGE', NOT_NULL, 0),
+    (('MATURE', 'mature'), 'MATURE', RAW, ''),
+    (('STATUS', 'status'), 'STATUS', RAW, ''),
+    (('REMARKS', 'remarks'), 'REMARKS', RAW, ''),
+]
+
+SITE_LIST_FIELDS = [
+    (('site_id',), 'SITE', RAW, ''),
+    (('store_name',), 'STORE NAME', RAW, ''),
+    (('region',), 'REGION', RAW, ''),
+    (('div',), 'DIV', RAW, ''),
+    (('gst_number',), 'GST NUMBER', NOT_NULL, ''),
+    (('pan_number',), 'PAN NUMBER', NOT_NULL, ''),
+]
+
+SEARCH_FIELDS = [
+    (('site_id', 'SITE'), 'SITE', RAW, ''),
+    (('STORE NAME',), 'STORE NAME', RAW, ''),
+    (('REGION',), 'REGION', RAW, ''),
+    (('DIV',), 'DIV', RAW, ''),
+    (('GST NUMBER',), 'GST NUMBER', RAW, ''),
+    (('PAN NUMBER',), 'PAN NUMBER', RAW, ''),
+]
+
+REPORT_FIELDS = [
+    (('site_id',), 'SITE', RAW, ''),
+    (('store_name',), 'STORE NAME', RAW, ''),
+    (('region',), 'REGION', RAW, ''),
+    (('div',), 'DIV', RAW, ''),
+    (('manager',), 'MANAGER', RAW, ''),
+    (('asst_manager',), 'ASST MANAGER', RAW, ''),
+    (('executive',), 'EXECUTIVE', RAW, ''),
+    (('doo',), 'D.O.O', DATE, ''),
+    (('sqft',), 'SQ.FT', RAW, 0),
+    (('agreement_date',), 'AGREEMENT DATE', DATE, ''),
+    (('rent_position_date',), 'RENT POSITION DATE', DATE, ''),
+    (('rent_effective_date',), 'RENT EFFECTIVE DATE', DATE, ''),
+    (('lease_period',), 'LEASE PERIOD', RAW, 0),
+    (('rent_free_period_days',), 'RENT FREE PERIOD DAYS', RAW, 0),
+    (('rent_effective_amount',), 'RENT EFFECTIVE AMOUNT', RAW, 0),
+    (('present_rent',), 'PRESENT RENT', RAW, 0),
+    (('hike_percentage',), 'HIKE %', RAW, 0),
+    (('hike_year',), 'HIKE YEAR', RAW, 0),
+    (('rent_deposit',), 'RENT DEPOSIT', RAW, 0),
+    (('owner_name1',), 'OWNER NAME-1', RAW, ''),
+    (('gst_number',), 'GST NUMBER', RAW, ''),
+    (('pan_number',), 'PAN NUMBER', RAW, ''),
+    (('tds_percentage',), 'TDS PERCENTAGE', RAW, 0),
+    (('mature',), 'MATURE', RAW, ''),
+    (('status',), 'STATUS', RAW, ''),
+    (('remarks',), 'REMARKS', RAW, ''),
+]
+
+# Derived tenure fields: (output keys, source column, direction), computed per batch by tenure.py.
+# A NULL source date leaves the key at its decoded value (or '' if the layout has none).
+SITE_DETAIL_TENURE = [
+    (('CURRENT DATE 1',), 'RENT POSITION DATE', SINCE),
+    (('VALIDITY DATE',), 'AGREEMENT VALID UPTO', UNTIL),
+]
+
+SEARCH_TENURE = SITE_DETAIL_TENURE
+
+REPORT_TENURE = [
+    (('current_date1',), 'RENT POSITION DATE', SINCE),
+    (('validity_date',), 'AGREEMENT VALID UPTO', UNTIL),
+]
+
+# Any output key (column name or legacy alias) -> (source column, all output keys)
+SITE_DETAIL_KEYS = {
+    key: (column, out_keys)
+    for out_keys, column, _, _ in SITE_DETAIL_FIELDS
+    for key in out_keys
+}
+
+# Derived columns that need another column selected to be computed
+TENURE_SOURCES = {out_keys[0]: column for out_keys, column, _ in SITE_DETAIL_TENURE}
+
+LAYOUTS = {
+    'site_detail': (SITE_DETAIL_FIELDS, SITE_DETAIL_TENURE),
+    'site_list': (SITE_LIST_FIELDS, []),
+    'search': (SEARCH_FIELDS, SEARCH_TENURE),
+    'report': (REPORT_FIELDS, REPORT_TENURE),
+}
+
+
+def _constant(default):
+    return lambda _: default
+
+
+def _not_null(default):
+    return lambda value: default if value is None else value
+
+
+def _tuple_getter(indexes):
+    if len(indexes) == 1:
+        idx = indexes[0]
+        return lambda seq: (seq[idx],)
+    return itemgetter(*indexes)
+
+
+class RowDecoder:
+    """Decoder for one column layout; build it with get_decoder()"""
+
+    def __init__(self, columns, layout):
+        fields, tenure = LAYOUTS[layout]
+        column_map = {col.upper(): i for i, col in enumerate(columns)}
+
+        keys = []
+        indexes = []
+        converters = []
+        expand = []
+        for field_pos, (out_keys, column, kind, default) in enumerate(fields):
+            idx = column_map.get(column)
+            if idx is None:
+                converters.append((field_pos, _constant(default)))
+            elif kind == DATE:
+                converters.append((field_pos, format_date))
+            elif kind == NOT_NULL:
+                converters.append((field_pos, _not_null(default)))
+            indexes.append(idx if idx is not None else 0)
+            for key in out_keys:
+                keys.append(key)
+                expand.append(field_pos)
+
+        self.columns = tuple(columns)
+        self.keys = tuple(keys)
+        self._converters = tuple(converters)
+        # Each source value is read and converted once, then fanned out to its aliases.
+        # (itemgetter with a single index returns a bare value, not a tuple.)
+        self._getter = _tuple_getter(indexes)
+        self._expand = _tuple_getter(expand)
+        self._tenure = tuple(
+            (out_keys, column_map[column], direction)
+            for out_keys, column, direction in tenure if column in column_map
+        )
+        # Every key a decoded record carries, in order (tenure keys not in the layout come last)
+        self.output_keys = self.keys + tuple(
+            key for out_keys, _, _ in self._tenure for key in out_keys if key not in self.keys
+        )
+
+    def _decode_row(self, row):
+        values = list(self._getter(row))
+        for pos, converter in self._converters:
+            values[pos] = converter(values[pos])
+        return dict(zip(self.keys, self._expand(values)))
+
+    def decode(self, row, today=None):
+        return self.decode_many([row], today)[0]
+
+    def decode_many(self, rows, today=None):
+        records = [self._decode_row(row) for row in rows]
+        if self._tenure and records:
+            today = today or datetime.now().date()
+            for out_keys, idx, direction in self._tenure:
+                texts = tenure_strings([row[idx] for row in rows], today, direction)
+                for record, text in zip(records, texts):
+                    for key in out_keys:
+                        if text is None:
+                            record.setdefault(key, '')
+                        else:
+                            record[key] = text
+        return records
+
+
+@lru_cache(maxsize=64)
+def compile_decoder(columns, layout):
+    return RowDecoder(columns, layout)
+
+
+def get_decoder(description, layout):
+    """Cached decoder for a cursor.description and an output layout"""
+    return compile_decoder(tuple(col[0] for col in description), layout)
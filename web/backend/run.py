@@ -1,5 +1,6 @@
-from app import app
+from app import app, startup
 
 if __name__ == '__main__':
     print("Starting rental data management backend server...")
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    startup()
+    app.run(debug=True, port=5000)
\ No newline at end of file
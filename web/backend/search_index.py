@@ -0,0 +1,286 @@
+"""
+In-process trigram index over SITE, STORE NAME and REGION.
+
+Postings map each trigram to the set of document ids containing it, so a
+'%term%' search only verifies the documents that contain every trigram of
+the term instead of scanning the whole table. Terms shorter than a trigram
+and terms whose rarest trigram is still common are answered from a scan
+view instead: one newline-joined blob per field in SITE order, searched with
+str.find class by class (exact, prefix, substring) until the limit is full.
+
+Autocomplete uses sorted (key, site) arrays of site IDs, site numbers and
+store names instead, so a prefix lookup is a bisect plus a walk of at most
+`limit` entries per array.
+"""
+import heapq
+import re
+import threading
+import time
+from collections import deque
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate
+
+GRAM = 3
+# Above this many trigram candidates, the ordered scan view is cheaper than verifying each one
+MAX_CANDIDATES = 512
+
+# Match classes, best first
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+
+# Autocomplete key kinds, in the order suggestions are offered
+COMPLETION_KINDS = ('site_id', 'site_number', 'store_name')
+
+SITE_NUMBER = re.compile(r'(\d+)$')
+
+
+def normalize(value):
+    # Newlines separate documents in the scan view
+    return str(value).strip().upper().replace('\n', ' ') if value is not None else ''
+
+
+def trigrams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def completion_keys(site, store_name):
+    """Autocomplete key per kind; 'SITE007' is also reachable as '7'"""
+    number = SITE_NUMBER.search(site)
+    return (site, number.group(1).lstrip('0') or '0' if number else '', store_name)
+
+
+class SearchIndex:
+    FIELDS = ('SITE', 'STORE NAME', 'REGION')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self.built_at = None
+        self._complete_times = deque(maxlen=1024)
+        # Writes seen while a rebuild is reading the table: site -> fields, or None for removal
+        self._pending = None
+
+    def _reset(self):
+        self._doc_ids = {}     # site -> doc id
+        self._docs = {}        # doc id -> (site, normalized field values)
+        self._postings = {}    # trigram -> set of doc ids
+        self._next_id = 0
+        self._order = []       # sites, sorted
+        self._view = None      # scan view over _order, rebuilt lazily after writes
+        self._labels = {}      # site -> (store name, region) as stored
+        self._completions = tuple([] for _ in COMPLETION_KINDS)  # sorted (key, site) per kind
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def build(self, rows):
+        """
+        Replace the index contents with rows of (SITE, STORE NAME, REGION).
+        Upserts and removals that arrive while rows are being read are
+        replayed on top of the new contents.
+        """
+        with self._lock:
+            self._pending = {}
+        fresh = SearchIndex()
+        try:
+            for row in rows:
+                fresh._add(row[0], row[1:], ordered=False)
+            fresh._order = sorted(fresh._doc_ids)
+            for keys in fresh._completions:
+                keys.sort()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for site, values in self._pending.items():
+                fresh._remove(site)
+                if values is not None:
+                    fresh._add(site, values)
+            self._doc_ids = fresh._doc_ids
+            self._docs = fresh._docs
+            self._postings = fresh._postings
+            self._next_id = fresh._next_id
+            self._order = fresh._order
+            self._view = None
+            self._labels = fresh._labels
+            self._completions = fresh._completions
+            self._pending = None
+            self.built_at = time.monotonic()
+
+    def _add(self, site, values, ordered=True):
+        site = str(site).strip()
+        fields = tuple(normalize(value) for value in (site, *values))
+        doc_id = self._next_id
+        self._next_id += 1
+        self._doc_ids[site] = doc_id
+        self._docs[doc_id] = (site, fields)
+        self._labels[site] = tuple('' if value is None else str(value).strip() for value in values[:2])
+        entries = [(key, site) for key in completion_keys(fields[0], fields[1])]
+        if ordered:
+            insort(self._order, site)
+            self._view = None
+            for keys, entry in zip(self._completions, entries):
+                if entry[0]:
+                    insort(keys, entry)
+        else:
+            for keys, entry in zip(self._completions, entries):
+                if entry[0]:
+                    keys.append(entry)
+        for gram in set().union(*(trigrams(field) for field in fields)):
+            self._postings.setdefault(gram, set()).add(doc_id)
+
+    def _remove(self, site):
+        doc_id = self._doc_ids.pop(site, None)
+        if doc_id is None:
+            return
+        _, fields = self._docs.pop(doc_id)
+        del self._labels[site]
+        pos = bisect_left(self._order, site)
+        if pos < len(self._order) and self._order[pos] == site:
+            del self._order[pos]
+        self._view = None
+        for keys, key in zip(self._completions, completion_keys(fields[0], fields[1])):
+            pos = bisect_left(keys, (key, site))
+            if pos < len(keys) and keys[pos] == (key, site):
+                del keys[pos]
+        for gram in set().union(*(trigrams(field) for field in fields)):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def upsert(self, site, store_name, region):
+        site = str(site).strip()
+        with self._lock:
+            if self._pending is not None:
+                self._pending[site] = (store_name, region)
+            self._remove(site)
+            self._add(site, (store_name, region))
+
+    def remove(self, site):
+        site = str(site).strip()
+        with self._lock:
+            if self._pending is not None:
+                self._pending[site] = None
+            self._remove(site)
+
+    def search(self, term, limit=50):
+        """
+        Site IDs matching term as a substring of any indexed field, ranked
+        exact > prefix > substring, then SITE > STORE NAME > REGION, then SITE.
+        """
+        term = normalize(term)
+        if not term:
+            return []
+
+        with self._lock:
+            if len(term) >= GRAM:
+                postings = sorted((self._postings.get(gram, ()) for gram in trigrams(term)), key=len)
+                if not postings or not postings[0]:
+                    return []
+                if len(postings[0]) <= MAX_CANDIDATES:
+                    candidates = set(postings[0]).intersection(*postings[1:])
+                    return self._rank_candidates(term, candidates, limit)
+            return self._scan(term, limit)
+
+    def _rank_candidates(self, term, candidates, limit):
+        ranked = []
+        for doc_id in candidates:
+            site, fields = self._docs[doc_id]
+            best = None
+            for field_pos, value in enumerate(fields):
+                if term not in value:
+                    continue
+                if value == term:
+                    rank = (EXACT, field_pos)
+                elif value.startswith(term):
+                    rank = (PREFIX, field_pos)
+                else:
+                    rank = (SUBSTRING, field_pos)
+                if best is None or rank < best:
+                    best = rank
+            if best is not None:
+                ranked.append((best, site))
+        return [site for _, site in heapq.nsmallest(limit, ranked)]
+
+    def _scan_view(self):
+        if self._view is None:
+            docs = [self._docs[self._doc_ids[site]][1] for site in self._order]
+            blobs = []
+            for field_pos in range(len(self.FIELDS)):
+                values = [fields[field_pos] for fields in docs]
+                # Offset of each document's value inside the blob
+                starts = list(accumulate((len(value) + 1 for value in values), initial=1))
+                blobs.append(('\n' + '\n'.join(values) + '\n', starts))
+            self._view = blobs
+        return self._view
+
+    def _scan(self, term, limit):
+        """Walk the match classes in rank order over the SITE-ordered blobs, stopping at limit"""
+        needles = {EXACT: f'\n{term}\n', PREFIX: f'\n{term}', SUBSTRING: term}
+        results = []
+        seen = set()
+        view = self._scan_view()
+        for match_class in (EXACT, PREFIX, SUBSTRING):
+            needle = needles[match_class]
+            # The exact and prefix needles start on the separator before the value
+            lead = 1 if match_class != SUBSTRING else 0
+            for blob, starts in view:
+                at = blob.find(needle)
+                while at != -1:
+                    doc = bisect_right(starts, at + lead) - 1
+                    site = self._order[doc]
+                    if site not in seen:
+                        seen.add(site)
+                        results.append(site)
+                        if len(results) >= limit:
+                            return results
+                    at = blob.find(needle, starts[doc + 1] - lead)
+        return results
+
+    def complete(self, prefix, limit=10):
+        """
+        Suggestions whose site ID, site number or store name starts with
+        prefix, in that order, each kind sorted by key. Returns dicts with
+        site_id, store_name, region and the kind of key that matched.
+        """
+        started = time.perf_counter()
+        prefix = normalize(prefix)
+        suggestions = []
+        seen = set()
+        with self._lock:
+            for kind, keys in zip(COMPLETION_KINDS, self._completions if prefix else ()):
+                pos = bisect_left(keys, (prefix,))
+                while len(suggestions) < limit and pos < len(keys) and keys[pos][0].startswith(prefix):
+                    site = keys[pos][1]
+                    pos += 1
+                    if site in seen:
+                        continue
+                    seen.add(site)
+                    store_name, region = self._labels[site]
+                    suggestions.append({'site_id': site, 'store_name': store_name,
+                                        'region': region, 'match': kind})
+            self._complete_times.append(time.perf_counter() - started)
+        return suggestions
+
+    def complete_latency(self):
+        """p50/p99/max of recent complete() calls, in milliseconds"""
+        with self._lock:
+            times = sorted(self._complete_times)
+        if not times:
+            return None
+        pick = lambda q: round(times[min(len(times) - 1, int(q * len(times)))] * 1000, 3)
+        return {'samples': len(times), 'p50_ms': pick(0.50), 'p99_ms': pick(0.99),
+                'max_ms': round(times[-1] * 1000, 3)}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'documents': len(self._docs),
+                'trigrams': len(self._postings),
+                'autocomplete': self.complete_latency(),
+                'age_seconds': round(time.monotonic() - self.built_at, 1) if self.ready else None,
+            }
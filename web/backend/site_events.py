@@ -0,0 +1,215 @@
+"""
+Fan-out of site changes to server-sent event streams.
+
+One poller thread per process reads the change log (see change_log.py)
+and hands each change to every subscriber whose DIV/REGION filter matches,
+so hundreds of open dashboards cost one query per poll instead of one
+request each. The poller only runs while someone is subscribed, and
+wake() makes it poll right away after a write in this process.
+
+Each subscriber has a bounded queue keyed by SITE: a further change to a
+site that is still queued is merged into the queued event (fields are
+unioned, the newest seq wins), so a slow consumer sees each site at most
+once. A consumer that falls more than `queue_size` sites behind has its
+queue dropped and is told to resync instead.
+"""
+import threading
+from collections import OrderedDict
+
+RESYNC = 'resync'
+
+
+class HubFull(Exception):
+    """Raised when the hub already has max_clients subscribers"""
+
+
+def _key(value):
+    return str(value or '').strip().upper()
+
+
+def _normalize(values):
+    return frozenset(_key(value) for value in values or () if _key(value))
+
+
+def merge_events(queued, event):
+    """A queued event for a site combined with a newer change to the same site"""
+    if queued['operation'] == event['operation'] and (
+            event['fields'] is None or (queued['fields'] is not None and set(queued['fields']) <= set(event['fields']))):
+        # The newer change covers the queued one; events are shared between subscribers, so never modified
+        return event
+    merged = dict(event)
+    if queued['fields'] is None or event['fields'] is None:
+        merged['fields'] = None
+    else:
+        merged['fields'] = sorted(set(queued['fields']) | set(event['fields']))
+    if queued['operation'] != event['operation']:
+        # Inserted then updated: still new to the client
+        merged['operation'] = queued['operation']
+    return merged
+
+
+class Subscriber:
+    """One event stream: its filter, the seq it has seen up to and its pending events"""
+
+    def __init__(self, divs, regions, after, queue_size):
+        self.divs = _normalize(divs)
+        self.regions = _normalize(regions)
+        self.after = after
+        self.queue_size = queue_size
+        self.pending = OrderedDict()
+        self.overflowed = False
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def matches(self, event):
+        return self._accepts(_key(event.get('div')), _key(event.get('region')))
+
+    def _accepts(self, div, region):
+        return (not self.divs or div in self.divs) and (not self.regions or region in self.regions)
+
+    def offer(self, event, site, div, region):
+        """
+        Queue an event, given its normalized SITE, DIV and REGION. Returns
+        'coalesced', 'dropped', 'queued', or None if filtered out.
+        """
+        if event['seq'] <= self.after or not self._accepts(div, region):
+            return None
+        with self.condition:
+            if self.overflowed:
+                return 'dropped'
+            queued = self.pending.pop(site, None)
+            if queued is not None:
+                self.pending[site] = merge_events(queued, event)
+                outcome = 'coalesced'
+            elif len(self.pending) >= self.queue_size:
+                self.pending.clear()
+                self.overflowed = True
+                outcome = 'dropped'
+            else:
+                self.pending[site] = event
+                outcome = 'queued'
+            self.condition.notify()
+        return outcome
+
+    def next_events(self, timeout):
+        """
+        Wait up to `timeout` seconds. Returns the queued events in seq
+        order, RESYNC after an overflow, or [] on timeout or close.
+        """
+        with self.condition:
+            if not (self.pending or self.overflowed or self.closed):
+                self.condition.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return RESYNC
+            events = list(self.pending.values())
+            self.pending.clear()
+            if events:
+                self.after = events[-1]['seq']
+        return events
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class EventHub:
+    """
+    Polls fetch(since) -> (events, next_since, more) while anyone is
+    subscribed and offers every event to the subscribers. Events are
+    change dicts with seq, site, div and region. start() gives the cursor
+    to begin from when the poller first starts.
+    """
+
+    def __init__(self, fetch, start, max_clients=500, queue_size=200, poll_interval=1.0, retry_after=5.0):
+        self.fetch = fetch
+        self.start = start
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+        self.cursor = None
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.poller = None
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def subscribe(self, divs=None, regions=None, after=None):
+        """
+        New subscriber that receives events after seq `after` (default:
+        the hub's current cursor). Starts the poller if needed; raises
+        HubFull, or whatever start() raises.
+        """
+        with self.lock:
+            if len(self.subscribers) >= self.max_clients:
+                raise HubFull(f'At most {self.max_clients} event streams')
+            if self.cursor is None:
+                self.cursor = self.start()
+            subscriber = Subscriber(divs, regions, self.cursor if after is None else max(after, self.cursor),
+                                    self.queue_size)
+            self.subscribers.add(subscriber)
+            if self.poller is None or not self.poller.is_alive():
+                self.poller = threading.Thread(target=self._poll, name='site-events', daemon=True)
+                self.poller.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def wake(self):
+        """Poll now instead of at the next interval"""
+        self.wakeup.set()
+
+    def publish(self, events):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for event in events:
+            self.published += 1
+            site, div, region = _key(event['site']), _key(event.get('div')), _key(event.get('region'))
+            for subscriber in subscribers:
+                outcome = subscriber.offer(event, site, div, region)
+                if outcome == 'coalesced':
+                    self.coalesced += 1
+                elif outcome == 'dropped':
+                    self.dropped += 1
+
+    def _poll(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.poller = None
+                    return
+                since = self.cursor
+            try:
+                events, next_since, more = self.fetch(since)
+            except Exception as e:
+                self.errors += 1
+                print(f"Site event poll error: {str(e)}")
+                self.wakeup.wait(self.retry_after)
+                self.wakeup.clear()
+                continue
+            self.publish(events)
+            with self.lock:
+                self.cursor = next_since
+            if not more:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+    def stats(self):
+        with self.lock:
+            clients = len(self.subscribers)
+        return {
+            'clients': clients,
+            'cursor': self.cursor,
+            'published': self.published,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'errors': self.errors,
+        }
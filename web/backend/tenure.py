@@ -0,0 +1,143 @@
+"""
+Batch lease tenure computation ("X Years, Y Months, Z Days").
+
+tenure_strings() takes a whole column of dates and computes the
+relativedelta-style years/months/days difference to `today` for every
+distinct value in one vectorized NumPy pass. Results are memoized per
+(value, direction) for the current day, so repeated requests over the
+same portfolio only pay for dates they have not seen yet.
+"""
+import threading
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+SINCE = 'since'   # time elapsed since the date (today - date)
+UNTIL = 'until'   # time remaining until the date (date - today)
+
+MEMO_LIMIT = 100000
+
+_memo = {}
+_memo_day = None
+_memo_lock = threading.Lock()
+
+
+def format_tenure(years, months, days):
+    return (
+        f"{years} {'Years' if years != 1 else 'Year'}, "
+        f"{months} {'Months' if months != 1 else 'Month'}, "
+        f"{days} {'Days' if days != 1 else 'Day'}"
+    )
+
+
+def _scalar_tenure(value, today, direction):
+    """relativedelta fallback for values NumPy can't represent (e.g. year 9999)"""
+    try:
+        if isinstance(value, datetime):
+            value = value.date()
+        elif isinstance(value, str):
+            value = datetime.strptime(value, '%Y-%m-%d').date()
+        diff = relativedelta(today, value) if direction == SINCE else relativedelta(value, today)
+        return format_tenure(diff.years, diff.months, diff.days)
+    except Exception as e:
+        print(f"Error calculating tenure for {value}: {str(e)}")
+        return ''
+
+
+def _split(days):
+    """datetime64[D] -> (year, month, day) integer arrays"""
+    months = days.astype('datetime64[M]')
+    year = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    return year, month, day
+
+
+def _add_months(year, month, day, months):
+    """Add whole months, clamping the day to the end of the target month"""
+    target = ((year - 1970) * 12 + (month - 1) + months).astype('datetime64[M]')
+    month_start = target.astype('datetime64[D]')
+    month_length = ((target + 1).astype('datetime64[D]') - month_start).astype(np.int64)
+    return month_start + (np.minimum(day, month_length) - 1)
+
+
+def relative_components(dt1, dt2):
+    """
+    Vectorized relativedelta(dt1, dt2) for datetime64[D] arrays.
+    Returns (years, months, days) integer arrays with relativedelta's signs.
+    """
+    y1, m1, _ = _split(dt1)
+    y2, m2, d2 = _split(dt2)
+
+    months = (y1 - y2) * 12 + (m1 - m2)
+    anchor = _add_months(y2, m2, d2, months)
+    # The clamped anchor can overshoot dt1 by less than a month; step back once
+    overshoot = np.where(dt1 < dt2, dt1 > anchor, dt1 < anchor)
+    months = months + np.where(overshoot, np.where(dt1 < dt2, 1, -1), 0)
+    anchor = _add_months(y2, m2, d2, months)
+    days = (dt1 - anchor).astype(np.int64)
+
+    sign = np.sign(months)
+    years = sign * (np.abs(months) // 12)
+    months = months - years * 12
+    return years, months, days
+
+
+def _compute(values, today, direction):
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format='mixed')
+    valid = parsed.notna().to_numpy()
+    results = [None] * len(values)
+
+    if valid.any():
+        dates = parsed[valid].to_numpy().astype('datetime64[D]')
+        today64 = np.full(dates.shape, np.datetime64(today, 'D'))
+        if direction == SINCE:
+            years, months, days = relative_components(today64, dates)
+        else:
+            years, months, days = relative_components(dates, today64)
+        positions = np.flatnonzero(valid)
+        for pos, y, m, d in zip(positions.tolist(), years.tolist(), months.tolist(), days.tolist()):
+            results[pos] = format_tenure(y, m, d)
+
+    for pos in np.flatnonzero(~valid).tolist():
+        results[pos] = _scalar_tenure(values[pos], today, direction)
+    return results
+
+
+def tenure_strings(values, today=None, direction=SINCE):
+    """
+    Tenure text for every value in `values` relative to `today`.
+    None entries map to None; unparseable dates map to ''.
+    """
+    global _memo, _memo_day
+    today = today or date.today()
+
+    with _memo_lock:
+        if _memo_day != today or len(_memo) > MEMO_LIMIT:
+            _memo = {}
+            _memo_day = today
+        memo = _memo
+
+    out = [None] * len(values)
+    missing = {}
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        key = (value, direction)
+        text = memo.get(key)
+        if text is None:
+            missing.setdefault(key, []).append(i)
+        else:
+            out[i] = text
+
+    if missing:
+        keys = list(missing)
+        computed = _compute([key[0] for key in keys], today, direction)
+        with _memo_lock:
+            if _memo_day == today:
+                _memo.update(zip(keys, computed))
+        for key, text in zip(keys, computed):
+            for i in missing[key]:
+                out[i] = text
+    return out
@@ -103,35 +103,21 @@ document.addEventListener('DOMContentLoaded', function() {
             }
 
             try {
-                // First try to search directly by site ID
+                // Look up the site and load its details in a single batch request
                 const searchValue = siteSearch.trim();
                 console.log("Searching for site ID:", searchValue);
-                const data = await makeAuthenticatedRequest(`/api/search?term=${encodeURIComponent(searchValue)}&site_id_search=true`);
+                const data = await makeAuthenticatedRequest('/api/sites/batch', {
+                    method: 'POST',
+                    body: JSON.stringify({ site_ids: [searchValue] })
+                });
                 if (!data) return;
 
-                console.log("Search API response:", data);
-
-                if(data.results && data.results.length > 0) {
-                    // If search found a site, load it directly
-                    const site = data.results[0];
-                    console.log("Found site:", site);
-
-                    // Make sure we have a valid site_id
-                    if (!site.site_id) {
-                        console.error("Missing site_id in search result");
-                        alert('Invalid search result: missing site ID');
-                        return;
-                    }
-
-                    const siteData = await makeAuthenticatedRequest(`/api/sites?site_id=${site.site_id}`);
+                console.log("Batch API response:", data);
 
-                    if (siteData) {
-                        console.log("Site details loaded:", siteData);
-                        updateSiteData(siteData);
-                    } else {
-                        console.error("Failed to load site details");
-                        alert('Failed to load site details');
-                    }
+                if(data.sites && data.sites.length > 0) {
+                    const siteData = data.sites[0];
+                    console.log("Site details loaded:", siteData);
+                    updateSiteData(siteData);
                 } else {
                     console.error("Site not found:", data);
                     alert(data.message || 'Site not found');
@@ -698,6 +684,40 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Site ID type-ahead, served from the backend's in-memory autocomplete index
+    const siteSearchInput = document.getElementById('siteSearch');
+    if (siteSearchInput) {
+        const suggestionList = document.createElement('datalist');
+        suggestionList.id = 'siteSuggestions';
+        siteSearchInput.setAttribute('list', suggestionList.id);
+        siteSearchInput.setAttribute('autocomplete', 'off');
+        siteSearchInput.after(suggestionList);
+
+        let suggestTimer = null;
+        let suggestSeq = 0;
+        siteSearchInput.addEventListener('input', function() {
+            clearTimeout(suggestTimer);
+            const prefix = this.value.trim();
+            if (!prefix) {
+                suggestionList.innerHTML = '';
+                return;
+            }
+            suggestTimer = setTimeout(async () => {
+                const seq = ++suggestSeq;
+                const data = await makeAuthenticatedRequest(`/api/sites/autocomplete?q=${encodeURIComponent(prefix)}&limit=10`);
+                // Drop responses that arrive after a newer keystroke
+                if (seq !== suggestSeq || data.error || !data.suggestions) return;
+                suggestionList.innerHTML = '';
+                data.suggestions.forEach(suggestion => {
+                    const option = document.createElement('option');
+                    option.value = suggestion.site_id;
+                    option.label = suggestion.store_name || '';
+                    suggestionList.appendChild(option);
+                });
+            }, 150);
+        });
+    }
+
     async function searchSite() {
         try {
             const siteSearch = document.getElementById('siteSearch').value;
@@ -714,59 +734,30 @@ document.addEventListener('DOMContentLoaded', function() {
             const searchValue = siteSearch.trim().toUpperCase();
             console.log("Searching for site ID:", searchValue);
 
-            // First try exact search
-            const data = await makeAuthenticatedRequest(`/api/search?term=${encodeURIComponent(searchValue)}&site_id_search=true`);
+            // Exact lookup (autocomplete is only for the type-ahead); a bare number also tries "SITE00x"
+            const candidates = [searchValue];
+            if (/^\d+$/.test(searchValue)) {
+                candidates.push(`SITE${searchValue.padStart(3, '0')}`);
+            }
+            const data = await makeAuthenticatedRequest('/api/sites/batch', {
+                method: 'POST',
+                body: JSON.stringify({ site_ids: candidates, fields: ['SITE', 'STORE NAME', 'REGION'] })
+            });
 
-            // Check if the request was successful
             if (data.error) {
-                if (data.status === 404) {
-                    // If not found and the search is just a number, try with SITE prefix
-                    if (/^\d+$/.test(searchValue)) {
-                        const sitePrefix = `SITE${searchValue.padStart(3, '0')}`;
-                        console.log("No results found. Trying with prefix:", sitePrefix);
-                        document.getElementById('searchResults').innerHTML = `<p>Trying with prefix: ${sitePrefix}...</p>`;
-
-                        const prefixData = await makeAuthenticatedRequest(`/api/search?term=${encodeURIComponent(sitePrefix)}&site_id_search=true`);
-
-                        if (prefixData.error) {
-                            // Still no results
-                            document.getElementById('searchResults').innerHTML = `
-                                <p>No sites found for "${searchValue}" or "${sitePrefix}".</p>
-                                <p>Site IDs are typically in the format "SITE001".</p>
-                                <p>Try searching with the complete site ID.</p>
-                            `;
-                            return;
-                        }
-
-                        if (prefixData.results && prefixData.results.length > 0) {
-                            displaySearchResults(prefixData.results[0]);
-                            return;
-                        } else {
-                            document.getElementById('searchResults').innerHTML = `
-                                <p>No sites found for "${searchValue}" or "${sitePrefix}".</p>
-                                <p>Site IDs are typically in the format "SITE001".</p>
-                                <p>Try searching with the complete site ID.</p>
-                            `;
-                            return;
-                        }
-                    } else {
-                        document.getElementById('searchResults').innerHTML = `<p>${data.message || 'No sites found matching your search.'}</p>`;
-                        return;
-                    }
-                } else {
-                    // Handle other error statuses
-                    document.getElementById('searchResults').innerHTML = `<p>Error: ${data.message || 'An error occurred during search'}</p>`;
-                    return;
-                }
+                document.getElementById('searchResults').innerHTML = `<p>Error: ${data.message || 'An error occurred during search'}</p>`;
+                return;
             }
 
-            // Process successful response
-            if (data.results && data.results.length > 0) {
-                // Found a matching site
-                displaySearchResults(data.results[0]);
+            if (data.sites && data.sites.length > 0) {
+                // Sites come back in request order, so the literal input wins over the padded form
+                displaySearchResults(data.sites[0]);
             } else {
-                // No results found
-                document.getElementById('searchResults').innerHTML = '<p>No sites found matching your search.</p>';
+                document.getElementById('searchResults').innerHTML = `
+                    <p>No sites found for "${searchValue}".</p>
+                    <p>Site IDs are typically in the format "SITE001".</p>
+                    <p>Try searching with the complete site ID.</p>
+                `;
             }
         } catch (error) {
             console.error("Search error:", error);
@@ -1126,8 +1117,54 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Reload the displayed site when it changes (or when the server says to resync)
+    async function refreshDisplayedSite(siteId) {
+        const siteElement = document.getElementById('site_value') || document.getElementById('site_id_value');
+        const displayedSite = siteElement ? siteElement.textContent.trim() : '';
+        if (!displayedSite || displayedSite === 'N/A') return;
+        if (siteId && siteId.trim().toUpperCase() !== displayedSite.toUpperCase()) return;
+        if (editBtn && editBtn.classList.contains('editing')) {
+            console.log(`Site ${displayedSite} was changed while being edited`);
+            return;
+        }
+
+        const siteData = await makeAuthenticatedRequest(`/api/sites?site_id=${encodeURIComponent(displayedSite)}`);
+        if (!siteData.error) {
+            updateSiteData(siteData);
+        }
+    }
+
+    // Server-sent site changes replace re-searching to see colleagues' edits
+    function subscribeToSiteEvents() {
+        if (!window.EventSource) return;
+
+        const username = (JSON.parse(localStorage.getItem('user') || '{}') || {}).username;
+        const events = new EventSource(`http://localhost:5000/api/events?jwt=${encodeURIComponent(token)}`);
+
+        events.addEventListener('site', function(e) {
+            const change = JSON.parse(e.data);
+            // Our own saves already refresh the page
+            if (change.changed_by === username) return;
+            console.log(`Site ${change.site} changed by ${change.changed_by || 'another user'}`);
+            refreshDisplayedSite(change.site);
+        });
+
+        events.addEventListener('resync', function() {
+            refreshDisplayedSite(null);
+        });
+
+        events.onerror = function() {
+            // EventSource reconnects by itself and resumes from the last event;
+            // it only gives up when the server refuses the stream (e.g. expired token)
+            if (events.readyState === EventSource.CLOSED) {
+                console.error('Site event stream closed');
+            }
+        };
+    }
+
     // Load initial data when page loads
     loadInitialSiteData();
+    subscribeToSiteEvents();
 
     // Add this function to handle sidebar menu setup
     function setupSidebarMenu() {
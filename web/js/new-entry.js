@@ -184,9 +184,12 @@ document.addEventListener('DOMContentLoaded', function() {
             
             const formData = new FormData();
             formData.append('file', fileInput.files[0]);
+            const updateExisting = document.getElementById('updateExisting');
+            const mode = updateExisting && updateExisting.checked ? 'upsert' : 'insert';
             
             try {
-                const response = await fetch('http://localhost:5000/api/upload', {
+                // Large workbooks are imported as a background job; poll it until done
+                const response = await fetch(`http://localhost:5000/api/upload?background=true&mode=${mode}`, {
                     method: 'POST',
                     headers: {
                         'Authorization': `Bearer ${token}`
@@ -196,11 +199,23 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 const data = await response.json();
                 
-                if(response.ok) {
-                    alert('File uploaded successfully');
+                if(!response.ok) {
+                    alert(data.message || 'Upload failed');
+                    return;
+                }
+                
+                const job = await waitForJob(data.job_id);
+                if(job.status === 'succeeded') {
+                    const result = job.result || {};
+                    let message = result.message || 'File uploaded successfully';
+                    // Show the first few rejected rows; the rest are in the job result
+                    (result.rejections || []).slice(0, 5).forEach(rejection => {
+                        message += `\nRow ${rejection.row} (${rejection.site}): ${rejection.errors.join('; ')}`;
+                    });
+                    alert(message);
                     uploadModal.style.display = 'none';
                 } else {
-                    alert(data.message || 'Upload failed');
+                    alert(job.error || job.message || 'Upload failed');
                 }
             } catch(error) {
                 console.error('Upload error:', error);
@@ -209,6 +224,24 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    async function waitForJob(jobId) {
+        while(true) {
+            const response = await fetch(`http://localhost:5000/api/jobs/${jobId}`, {
+                headers: {
+                    'Authorization': `Bearer ${token}`
+                }
+            });
+            const job = await response.json();
+            if(!response.ok) {
+                throw new Error(job.message || 'Failed to read job status');
+            }
+            if(['succeeded', 'failed', 'cancelled'].includes(job.status)) {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+    
     // New Entry Form
     const newEntryForm = document.getElementById('newEntryForm');
     
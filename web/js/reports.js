@@ -55,6 +55,22 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Build the /api/reports URL for the current form selections
+    function buildReportUrl(reportType, format) {
+        const url = new URL('http://localhost:5000/api/reports');
+        url.searchParams.append('type', reportType);
+        url.searchParams.append('from_date', document.getElementById('fromDate').value);
+        url.searchParams.append('to_date', document.getElementById('toDate').value);
+        
+        if(reportType === 'Lease Period Report') {
+            url.searchParams.append('lease_period', document.getElementById('leasePeriod').value);
+        }
+        if(format) {
+            url.searchParams.append('format', format);
+        }
+        return url;
+    }
+    
     // Generate Report Button
     const generateBtn = document.getElementById('generateBtn');
     
@@ -80,14 +96,7 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             try {
-                const url = new URL('http://localhost:5000/api/reports');
-                url.searchParams.append('type', selectedReportType);
-                url.searchParams.append('from_date', fromDate);
-                url.searchParams.append('to_date', toDate);
-                
-                if(selectedReportType === 'Lease Period Report') {
-                    url.searchParams.append('lease_period', document.getElementById('leasePeriod').value);
-                }
+                const url = buildReportUrl(selectedReportType);
                 
                 const response = await fetch(url, {
                     headers: {
@@ -141,30 +150,37 @@ document.addEventListener('DOMContentLoaded', function() {
     const exportBtn = document.querySelector('.btn-export');
     
     if(exportBtn) {
-        exportBtn.addEventListener('click', function() {
-            const table = document.getElementById('reportTable');
-            if(!table) return;
-            
-            // Create CSV content
-            let csv = [];
-            const rows = table.querySelectorAll('tr');
+        exportBtn.addEventListener('click', async function() {
+            const selectedReportType = document.querySelector('input[name="reportType"]:checked').value;
             
-            rows.forEach(row => {
-                const rowData = [];
-                row.querySelectorAll('th, td').forEach(cell => {
-                    rowData.push(cell.textContent);
+            try {
+                // The workbook is generated on the server straight from the database
+                const response = await fetch(buildReportUrl(selectedReportType, 'xlsx'), {
+                    headers: {
+                        'Authorization': `Bearer ${token}`
+                    }
                 });
-                csv.push(rowData.join(','));
-            });
-            
-            // Create and download file
-            const blob = new Blob([csv.join('\n')], { type: 'text/csv' });
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = 'report.csv';
-            a.click();
-            window.URL.revokeObjectURL(url);
+                
+                if(!response.ok) {
+                    const data = await response.json().catch(() => ({}));
+                    alert(data.message || 'Failed to export report');
+                    return;
+                }
+                
+                // Create and download file
+                const disposition = response.headers.get('Content-Disposition') || '';
+                const match = disposition.match(/filename="([^"]+)"/);
+                const blob = await response.blob();
+                const url = window.URL.createObjectURL(blob);
+                const a = document.createElement('a');
+                a.href = url;
+                a.download = match ? match[1] : 'report.xlsx';
+                a.click();
+                window.URL.revokeObjectURL(url);
+            } catch(error) {
+                console.error('Report export error:', error);
+                alert('An error occurred while exporting the report');
+            }
         });
     }
     